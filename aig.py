@@ -0,0 +1,423 @@
+################################################
+# aig.py
+# agent
+# agent@local
+################################################
+# Contains the AND-inverter graph built from all
+# equations of a design and the cut based LUT
+# mapper that covers it.
+# Every equation is one output of the same graph,
+# a literal that names another equation's output
+# is wired to that output's node, so logic shared
+# between equations is mapped once.
+################################################
+# AIG literals:
+# node ids count up from 0, node 0 is constant 0.
+# A literal is 2 * node + complemented, so literal
+# 0 is constant 0 and literal 1 is constant 1.
+# Nodes are added after their fanins, so node id
+# order is a topological order. AND nodes are
+# structurally hashed on their (sorted) fanins, so
+# the same AND of the same literals is one node no
+# matter which equation asks for it.
+################################################
+# Mapping uses priority cuts: every node keeps the
+# CUTS_PER_NODE best k-feasible cuts merged from
+# the cuts of its fanins. The first pass picks the
+# cut of least depth, the recovery passes pick the
+# cut of least area flow that still meets the
+# required time of the depth-optimal mapping.
+################################################
+# methods:
+# build_aig(eqs: list) -> aig
+# pair_counts(trees: list) -> dict
+# and_terms(g: aig, items: list, pairs: dict) -> int
+# shared_nodes(g: aig) -> list
+# lut_map(g: aig, k: int) -> dict
+# cut_truth(g: aig, node: int, leaves: tuple, phase: set) -> int
+# map_luts(eqs: list, k: int) -> dict
+################################################
+
+import expr_ast as xast
+import fse
+import quine_mccluskey as qm
+import truth_table as tt
+import npn
+
+# cuts kept per node
+CUTS_PER_NODE = 8
+# area recovery passes after the depth pass
+AREA_PASSES = 2
+
+
+class aig:
+    def __init__(self):
+        self.fanins = [None]    # node -> (lit, lit), None for constant / inputs
+        self.names = ["0"]      # node -> input name, '' for AND nodes
+        self.inputs = {}        # input name -> node
+        self.outputs = []       # (output name, lit)
+        self.strash = {}        # (lit, lit) -> AND node, one node per function
+        self.hits = 0           # AND nodes reused through strash
+
+    # literal of an input, created on first use
+    def add_input(self, name):
+        if name not in self.inputs:
+            self.inputs[name] = len(self.fanins)
+            self.fanins.append(None)
+            self.names.append(name)
+        return self.inputs[name] << 1
+
+    # literal of a AND b
+    def add_and(self, a, b):
+        if a > b:
+            a, b = b, a
+        if a == 0 or a == b ^ 1:
+            return 0
+        if a == 1 or a == b:
+            return b
+        if (a, b) in self.strash:
+            self.hits += 1
+            return self.strash[(a, b)] << 1
+        self.strash[(a, b)] = len(self.fanins)
+        self.fanins.append((a, b))
+        self.names.append("")
+        return len(self.fanins) - 1 << 1
+
+    def add_output(self, name, lit):
+        self.outputs.append((name, lit))
+
+    def is_and(self, node):
+        return self.fanins[node] is not None
+
+    def size(self):
+        return len(self.fanins)
+
+
+""" build_aig
+one AIG for all equations, built from the minimized SOP of each
+truth table, equation names used as literals in other equations
+are wired to that equation's output
+product terms are built pair by pair, the pairs of literals found
+in the most product terms across all equations first, so common
+subterms are one node feeding every consumer
+raises fse.CombinationalLoopError on a combinational loop
+"""
+def build_aig(eqs: list):
+    g = aig()
+    by_name = {e.name: e for e in eqs}
+    done = {}       # output name -> lit
+    active = set()  # outputs being built, to find loops
+
+    # the minimized SOP of every truth table (cached by min_cache)
+    trees = {}
+    for e in eqs:
+        sop = qm.quine_mccluskey(e, list(dict.fromkeys(e.literals)))
+        trees[e.name] = int(sop) if sop == "0" or sop == "1" else xast.parse(sop)
+    pairs = pair_counts(trees.values())
+
+    def output(name):
+        if name in done:
+            return done[name]
+        if name in active:
+            raise fse.CombinationalLoopError("combinational loop through " + name)
+        active.add(name)
+        tree = trees[name]
+        done[name] = tree if isinstance(tree, int) else build(tree)
+        active.remove(name)
+        return done[name]
+
+    def build(node):
+        kind = type(node)
+        if kind is xast.Var:
+            if node.name in by_name:
+                return output(node.name)
+            return g.add_input(node.name)
+        if kind is xast.Not:
+            return build(node.arg) ^ 1
+        if kind is xast.And:
+            return and_terms(g, [(_key(a), build(a)) for a in node.args], pairs)
+        # OR of terms, in literal order so equal sums hash to one node
+        lits = sorted(set(build(a) ^ 1 for a in node.args))
+        out = 1
+        for l in lits:
+            out = g.add_and(out, l)
+        return out ^ 1
+
+    for e in eqs:
+        g.add_output(e.name, output(e.name))
+    return g
+# end build_aig
+
+
+""" pair_counts
+number of product terms every pair of literals appears in,
+over all expression trees
+"""
+def pair_counts(trees):
+    pairs = {}
+    for tree in trees:
+        if isinstance(tree, int):
+            continue
+        for cube in xast.cubes(xast.nnf(tree)):
+            keys = sorted(set(cube))
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    pairs[(keys[i], keys[j])] = pairs.get((keys[i], keys[j]), 0) + 1
+    return pairs
+# end pair_counts
+
+""" and_terms
+AND of (key, lit) items, the pair with the highest count in
+pairs is joined first, the rest are folded in key order
+"""
+def and_terms(g: aig, items: list, pairs: dict):
+    items = sorted(set(items))
+    while len(items) > 1:
+        best = (1, 0, 1)
+        for i in range(len(items)):
+            for j in range(i + 1, len(items)):
+                count = pairs.get((items[i][0], items[j][0]), 0)
+                if count > best[0]:
+                    best = (count, i, j)
+        count, i, j = best
+        joined = (items[i][0], items[j][0])
+        lit = g.add_and(items[i][1], items[j][1])
+        items = [items[x] for x in range(len(items)) if x != i and x != j]
+        items.insert(0, (joined, lit))
+    if not items:
+        return 1
+    return items[0][1]
+# end and_terms
+
+# pair count key of a literal node, (name, negated) like xast.cubes
+def _key(node):
+    if type(node) is xast.Var:
+        return (node.name, 0)
+    if type(node) is xast.Not and type(node.arg) is xast.Var:
+        return (node.arg.name, 1)
+    return ("", repr(node))
+
+
+""" shared_nodes
+AND nodes in the cone of more than one output
+"""
+def shared_nodes(g: aig):
+    owner = [None] * g.size()
+    shared = set()
+    for name, lit in g.outputs:
+        stack = [lit >> 1]
+        while stack:
+            node = stack.pop()
+            if not g.is_and(node) or owner[node] == name:
+                continue
+            if owner[node] is not None:
+                shared.add(node)
+            owner[node] = name
+            stack.extend(l >> 1 for l in g.fanins[node])
+    return sorted(shared)
+# end shared_nodes
+
+
+""" lut_map
+cover the AIG with k-input LUTs
+returns {node: leaves} for every node that becomes a LUT
+"""
+def lut_map(g: aig, k: int):
+    n = g.size()
+    refs = [0] * n
+    for node in range(n):
+        if g.is_and(node):
+            for lit in g.fanins[node]:
+                refs[lit >> 1] += 1
+    for name, lit in g.outputs:
+        refs[lit >> 1] += 1
+
+    best = _map_pass(g, k, refs, None)
+    for p in range(AREA_PASSES):
+        cover = _cover(g, best)
+        required = _required(g, best, cover)
+        # blend the fanout in the graph with the fanout in the mapping
+        used = [0] * n
+        for node in cover:
+            for leaf in best[node][0]:
+                used[leaf] += 1
+        for name, lit in g.outputs:
+            used[lit >> 1] += 1
+        est = [(refs[i] + 2 * used[i]) / 3 for i in range(n)]
+        best = _map_pass(g, k, est, required)
+    return {node: best[node][0] for node in _cover(g, best)}
+# end lut_map
+
+# one pass of cut enumeration, best[node] is (leaves, depth, flow)
+# with required times the pass minimizes area flow within them
+def _map_pass(g, k, refs, required):
+    n = g.size()
+    best = [None] * n
+    cuts = [None] * n
+    for node in range(n):
+        if not g.is_and(node):
+            best[node] = ((node,), 0, 0.0)
+            cuts[node] = []
+            continue
+        a, b = g.fanins[node]
+        found = {}
+        # the cuts of a fanin plus the fanin itself
+        for ca in cuts[a >> 1] + [((a >> 1,),)]:
+            for cb in cuts[b >> 1] + [((b >> 1,),)]:
+                leaves = tuple(sorted(set(ca[0]) | set(cb[0])))
+                if len(leaves) > k or leaves in found:
+                    continue
+                depth = 1 + max(best[l][1] for l in leaves)
+                flow = 1.0 + sum(best[l][2] for l in leaves)
+                found[leaves] = (leaves, depth, flow)
+        if required is None or required[node] is None:
+            key = lambda c: (c[1], c[2], len(c[0]))
+        else:
+            limit = required[node]
+            key = lambda c: (c[1] > limit, c[2], c[1], len(c[0]))
+        ranked = sorted(found.values(), key=key)[:CUTS_PER_NODE]
+        cuts[node] = ranked
+        leaves, depth, flow = ranked[0]
+        best[node] = (leaves, depth, flow / max(1.0, refs[node]))
+    return best
+
+# AND nodes used by the mapping, in topological order
+def _cover(g, best):
+    need = set()
+    stack = [lit >> 1 for name, lit in g.outputs]
+    while stack:
+        node = stack.pop()
+        if node in need or not g.is_and(node):
+            continue
+        need.add(node)
+        stack.extend(best[node][0])
+    return sorted(need)
+
+# latest depth every mapped node may have without delaying an output
+def _required(g, best, cover):
+    required = [None] * g.size()
+    depth = max([best[lit >> 1][1] for name, lit in g.outputs] + [0])
+    for name, lit in g.outputs:
+        required[lit >> 1] = depth
+    for node in reversed(cover):
+        for leaf in best[node][0]:
+            r = required[node] - 1
+            if required[leaf] is None or r < required[leaf]:
+                required[leaf] = r
+    return required
+
+
+""" cut_truth
+truth table of node over the cut leaves, leaves[0] is the
+most significant bit of the minterm
+phase: leaves whose signal carries the complement of the node
+"""
+def cut_truth(g: aig, node: int, leaves: tuple, phase: set = ()):
+    nvars = len(leaves)
+    full = tt.full_mask(nvars)
+    value = {0: 0}
+    for i in range(nvars):
+        value[leaves[i]] = tt.literal_mask(nvars, i)
+        if leaves[i] in phase:
+            value[leaves[i]] ^= full
+    stack = [node]
+    while stack:
+        top = stack[-1]
+        if top in value:
+            stack.pop()
+            continue
+        a, b = g.fanins[top]
+        todo = [l >> 1 for l in (a, b) if l >> 1 not in value]
+        if todo:
+            stack.extend(todo)
+            continue
+        va = value[a >> 1] ^ (full if a & 1 else 0)
+        vb = value[b >> 1] ^ (full if b & 1 else 0)
+        value[top] = va & vb
+        stack.pop()
+    return value[node]
+# end cut_truth
+
+
+""" map_luts
+map all equations onto k-input LUTs through one shared AIG
+returns {equation name: (lut_inputs, lut_outputs, lut_data, num_luts,
+output_lut_name, output_var_name)} like fse.partition_to_lut, a LUT
+belongs to the first equation (in list order) that reaches it
+"""
+def map_luts(eqs: list, k: int):
+    g = build_aig(eqs)
+    mapping = lut_map(g, k)
+    signal = {}     # node -> name of the LUT output or input driving it
+    for name, node in g.inputs.items():
+        signal[node] = name
+    outputs = dict(g.outputs)
+    # a LUT drives the complement of its node when the node is only
+    # used as an inverted output, readers fold the inversion into
+    # their own data
+    positive = set(lit >> 1 for lit in outputs.values() if not lit & 1)
+    phase = set(lit >> 1 for lit in outputs.values()
+                if lit & 1 and lit >> 1 in mapping and lit >> 1 not in positive)
+
+    def truth(node, leaves):
+        bits = cut_truth(g, node, leaves, phase)
+        if node in phase:
+            bits ^= tt.full_mask(len(leaves))
+        return bits
+
+    result = {}
+    for e in eqs:
+        luts = []
+
+        def new_lut(leaves, bits):
+            name = "LUT_%s_%d" % (e.name, len(luts))
+            luts.append((name, leaves, bits))
+            return name + "_Output"
+
+        # claim the unnamed LUTs of this output's cone, fanins first
+        lit = outputs[e.name]
+        stack = [(lit >> 1, False)]
+        while stack:
+            node, ready = stack.pop()
+            if node in signal or node not in mapping:
+                continue
+            if ready:
+                leaves = mapping[node]
+                signal[node] = new_lut(leaves, truth(node, leaves))
+                continue
+            stack.append((node, True))
+            for leaf in mapping[node]:
+                if leaf not in signal:
+                    stack.append((leaf, False))
+
+        node = lit >> 1
+        if node == 0:
+            out = new_lut((), lit & 1)
+        elif not g.is_and(node):
+            # buffer or inverter of an input
+            out = new_lut((node,), 1 if lit & 1 else 2)
+        elif (lit & 1) == (node in phase):
+            out = signal[node]
+            if not luts:
+                # the same function as an earlier output, which owns the
+                # LUT, this output gets a buffer of its own
+                out = new_lut((node,), 2)
+        else:
+            # the output needs the other polarity of the LUT
+            leaves = mapping[node]
+            out = new_lut(leaves, tt.full_mask(len(leaves)) ^ truth(node, leaves))
+
+        lut_inputs = [[signal[l] for l in leaves] for name, leaves, bits in luts]
+        lut_outputs = [name + "_Output" for name, leaves, bits in luts]
+        lut_data = [npn.bits_to_data(len(leaves), bits).ljust(1 << k, "0")
+                    for name, leaves, bits in luts]
+        result[e.name] = (
+            lut_inputs,
+            lut_outputs,
+            lut_data,
+            len(luts),
+            out.split("_Output")[0],
+            e.name,
+        )
+    return result
+# end map_luts
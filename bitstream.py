@@ -0,0 +1,529 @@
+################################################
+# bitstream.py
+# agent
+# agent@local
+################################################
+# Contains the binary bitstream format, written
+# with NumPy and read back through mmap, and the
+# converter to and from the JSON bitstream of
+# fse.write_bitstream.
+################################################
+# File layout (little endian):
+# - header: magic "FPGB", version, flags,
+#   lut_type, LUT, equation, string and section
+#   counts
+# - section directory: (tag, offset, size) per
+#   section, sections start on 8 byte boundaries
+# - STRS: string table, count + 1 offsets into a
+#   UTF-8 blob, every name is stored once and
+#   referred to by its index (0 is "")
+# - LUTS: one fixed record per LUT (name, op,
+#   location, inputs, configuration bits)
+# - CONF: the LUT configuration bit array, the
+#   data of every LUT packed one bit per bit
+# - EQNS, NEGS, TBLS: equation records, their
+#   negations and truth table bits
+# - IDXS: string indexes of LUT inputs, equation
+#   literals and ops and routed signals
+# - LAYR, CELL, TABL: the layout grids as raw
+#   int32 cell ids and their tables
+# - NETS, PATH, HOPS: the routing bits, the cells
+#   of every routed path
+# - META: the remaining attributes as JSON
+################################################
+# methods:
+# is_binary(path: str) -> bool
+# write(fpga_adt: fpga_adt, path: str) -> int
+# load(path: str) -> fpga_adt
+# save(fpga_adt: fpga_adt, path: str) -> None
+# convert(src: str, dst: str) -> None
+################################################
+
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+import numpy as np
+import eq_adt as eq
+import fpga_adt as fpga
+import fse
+import truth_table as tt
+
+MAGIC = b"FPGB"
+# changes when the file layout does
+VERSION = 1
+# magic, version, flags, lut_type, LUTs, equations, strings, sections
+HEADER = struct.Struct("<4sHHIIIII")
+# tag, offset, size
+SECTION = struct.Struct("<4sQQ")
+ALIGN = 8
+
+# header flags
+SHARED_LAYOUT = 1  # layout[1] is layout[0]
+CONSTRAINED = 2
+
+# data of a LUT that is not a bit string ({} for unused LUTs)
+NO_DATA = 0xFFFFFFFF
+# table kinds of an equation
+TABLE_DICT = 0  # minterm -> value, only the minterms present
+TABLE_FULL = 1  # every minterm, read back as a truth_table
+# what a layout table entry refers to
+CELL_STR = 0
+CELL_LUT = 1
+
+LUT_RECORD = np.dtype([
+    ("name", "<u4"), ("type", "<u4"), ("op", "<i4"), ("row", "<i4"),
+    ("col", "<i4"), ("output", "<u4"), ("inputs", "<u4"), ("ninputs", "<u4"),
+    ("conns", "<u4"), ("nconns", "<u4"), ("conf", "<u8"), ("bits", "<u4"),
+])
+EQ_RECORD = np.dtype([
+    ("name", "<u4"), ("eq", "<u4"), ("level", "<i4"), ("circuit", "<u4"),
+    ("lits", "<u4"), ("nlits", "<u4"), ("negs", "<u4"), ("nnegs", "<u4"),
+    ("ops", "<u4"), ("nops", "<u4"), ("kind", "<u4"), ("nvars", "<u4"),
+    ("table", "<u8"), ("size", "<u4"),
+])
+LAYER_RECORD = np.dtype([
+    ("rows", "<u4"), ("cols", "<u4"), ("cells", "<u8"), ("table", "<u4"),
+    ("ntable", "<u4"),
+])
+CELL_ENTRY = np.dtype([("kind", "<u4"), ("ref", "<u4")])
+NET_RECORD = np.dtype([
+    ("net", "<u4"), ("sigs", "<u4"), ("nsigs", "<u4"), ("paths", "<u4"),
+    ("npaths", "<u4"),
+])
+PATH_RECORD = np.dtype([("hops", "<u4"), ("nhops", "<u4")])
+
+
+""" is_binary
+whether a file is a binary bitstream
+"""
+def is_binary(path: str):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+# end is_binary
+
+""" write
+write a fabric as a binary bitstream
+returns the size of the file in bytes
+"""
+def write(fpga_adt: fpga.fpga_adt, path: str):
+    strings = _strings()
+    idxs = []
+    meta = {}
+
+    # equations, the ones LUTs use that are not in eqs go after them
+    eqs = [_as_eq(e) for e in fpga_adt.eqs]
+    eq_index = {id(e): i for i, e in enumerate(eqs)}
+    eq_key = {e.key(): i for i, e in enumerate(eqs)}
+    lut_ops = []
+    for lut in fpga_adt.luts:
+        if lut.op == "":
+            lut_ops.append(-1)
+            continue
+        if id(lut.op) not in eq_index:
+            # loaded from JSON every LUT has its own copy of its equation
+            key = _as_eq(lut.op).key()
+            if key not in eq_key:
+                eq_key[key] = len(eqs)
+                eqs.append(_as_eq(lut.op))
+            eq_index[id(lut.op)] = eq_key[key]
+        lut_ops.append(eq_index[id(lut.op)])
+
+    negs = []
+    tables = []
+    table_size = 0
+    eq_records = []
+    for e in eqs:
+        lits = len(idxs)
+        idxs += [strings(l) for l in e.literals]
+        ops = len(idxs)
+        idxs += [strings(o) for o in e.ops]
+        kind, nvars, raw = _pack_table(e.table, len(set(e.literals)))
+        eq_records.append((
+            strings(e.name), strings(e.eq), e.level, int(bool(e.isCircuit)),
+            lits, len(e.literals), len(negs), len(e.neglist), ops, len(e.ops),
+            kind, nvars, table_size, len(raw),
+        ))
+        negs += list(e.neglist)
+        tables.append(raw)
+        table_size += len(raw)
+
+    # LUTs and their configuration bits
+    conf = []
+    conf_size = 0
+    lut_index = {}
+    lut_records = []
+    odd = {}
+    for n, lut in enumerate(fpga_adt.luts):
+        lut_index[id(lut)] = n
+        lut_index.setdefault(lut.name, n)
+        inputs = len(idxs)
+        idxs += [strings(s) for s in lut.inputs]
+        conns = len(idxs)
+        if all(isinstance(c, str) for c in lut.connections):
+            idxs += [strings(c) for c in lut.connections]
+            nconns = len(lut.connections)
+        else:
+            odd.setdefault("connections", {})[n] = lut.connections
+            nconns = 0
+        bits = NO_DATA
+        if isinstance(lut.data, str) and set(lut.data) <= {"0", "1"}:
+            bits = len(lut.data)
+            conf.append(lut.data)
+        elif lut.data != {}:
+            odd.setdefault("data", {})[n] = lut.data
+        loc = list(lut.location) if len(lut.location) == 2 else [-1, -1]
+        lut_records.append((
+            strings(lut.name), lut.type, lut_ops[n], loc[0], loc[1],
+            strings(lut.output), inputs, len(lut.inputs), conns, nconns,
+            conf_size, bits,
+        ))
+        if bits != NO_DATA:
+            conf_size += bits
+    conf_bits = np.frombuffer("".join(conf).encode("ascii"), dtype=np.uint8) - ord("0")
+    if odd:
+        meta["odd"] = odd
+
+    # layout grids, only the table entries the cells use are kept
+    layouts = [fpga_adt.layout[0]] if _shared(fpga_adt.layout) else fpga_adt.layout
+    layer_records = []
+    cells = []
+    entries = []
+    cell_size = 0
+    for layers in layouts:
+        for layer in layers:
+            layer = fpga.grid.load(layer)
+            used = np.union1d(np.unique(layer.cells), [0])
+            remap = np.zeros(len(layer.table), dtype=np.int32)
+            remap[used] = np.arange(len(used), dtype=np.int32)
+            rows, cols = layer.cells.shape
+            layer_records.append((rows, cols, cell_size, len(entries), len(used)))
+            cells.append(remap[layer.cells].astype("<i4"))
+            cell_size += rows * cols
+            for c in used.tolist():
+                entries.append(_entry(layer.table[c], lut_index, strings))
+    meta["layout"] = [len(layers) for layers in layouts]
+
+    # routing bits, the cells of every routed path
+    net_records = []
+    path_records = []
+    hops = []
+    wire = fpga_adt.get_wire()
+    if all(isinstance(w, dict) and {"net", "signals", "paths"} <= set(w) for w in wire):
+        for w in wire:
+            sigs = len(idxs)
+            idxs += [strings(s) for s in w["signals"]]
+            net_records.append((strings(w["net"]), sigs, len(w["signals"]),
+                                len(path_records), len(w["paths"])))
+            for p in w["paths"]:
+                path_records.append((len(hops), len(p)))
+                hops += [c for cell in p for c in cell]
+    else:
+        meta["wire"] = wire
+
+    skip = ("layout", "wire", "luts", "eqs", "fromBitstream") + fpga_adt.INDEXES
+    for k, v in vars(fpga_adt).items():
+        if k not in skip:
+            meta[k] = v
+    meta["eqs"] = len(fpga_adt.eqs)
+
+    flags = (SHARED_LAYOUT if _shared(fpga_adt.layout) else 0) | (
+        CONSTRAINED if fpga_adt.constrained else 0
+    )
+    sections = [
+        (b"STRS", strings.pack()),
+        (b"LUTS", np.array(lut_records, dtype=LUT_RECORD).tobytes()),
+        (b"CONF", np.packbits(conf_bits).tobytes()),
+        (b"EQNS", np.array(eq_records, dtype=EQ_RECORD).tobytes()),
+        (b"NEGS", np.array(negs, dtype=np.uint8).tobytes()),
+        (b"TBLS", b"".join(tables)),
+        (b"IDXS", np.array(idxs, dtype="<u4").tobytes()),
+        (b"LAYR", np.array(layer_records, dtype=LAYER_RECORD).tobytes()),
+        (b"CELL", b"".join(c.tobytes() for c in cells)),
+        (b"TABL", np.array(entries, dtype=CELL_ENTRY).tobytes()),
+        (b"NETS", np.array(net_records, dtype=NET_RECORD).tobytes()),
+        (b"PATH", np.array(path_records, dtype=PATH_RECORD).tobytes()),
+        (b"HOPS", np.array(hops, dtype="<i4").tobytes()),
+        (b"META", json.dumps(meta, default=_meta_default).encode("utf-8")),
+    ]
+    header = HEADER.pack(
+        MAGIC, VERSION, flags, fpga_adt.get_lut_type(), len(fpga_adt.luts),
+        len(fpga_adt.eqs), len(strings.table), len(sections),
+    )
+    offset = _aligned(HEADER.size + SECTION.size * len(sections))
+    directory = []
+    for tag, raw in sections:
+        directory.append(SECTION.pack(tag, offset, len(raw)))
+        offset = _aligned(offset + len(raw))
+    with open(path, "wb") as f:
+        f.write(header + b"".join(directory))
+        for tag, raw in sections:
+            f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+            f.write(raw)
+        return f.tell()
+# end write
+
+""" load
+read a bitstream, binary through mmap or JSON
+returns the fpga_adt
+"""
+def load(path: str):
+    if not is_binary(path):
+        return fpga.fpga_adt.load_bitstream(path)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _read(mm, path)
+    finally:
+        mm.close()
+# end load
+
+""" save
+write a fabric as JSON when path ends in .json, binary otherwise
+"""
+def save(fpga_adt: fpga.fpga_adt, path: str):
+    if path.endswith(".json"):
+        # written aside and moved, a fabric loaded from path reads its
+        # equations from the old file when they are first used
+        with open(path + ".tmp", "w") as f:
+            fse.write_bitstream(fpga_adt, f)
+        os.replace(path + ".tmp", path)
+    else:
+        write(fpga_adt, path)
+# end save
+
+""" convert
+convert a bitstream between the binary and the JSON form, dst is
+written as JSON when it ends in .json and binary otherwise
+"""
+def convert(src: str, dst: str):
+    save(load(src), dst)
+# end convert
+
+# fabric from the mapped file, every array read from it is copied
+# or turned into lists so the map can be closed
+def _read(mm, path):
+    magic, version, flags, lut_type, nluts, neqs, nstrings, nsections = (
+        HEADER.unpack_from(mm, 0)
+    )
+    if version != VERSION:
+        raise Exception(path + ": bitstream version " + str(version) + " is not "
+                        + str(VERSION))
+    sections = {}
+    for k in range(nsections):
+        tag, offset, size = SECTION.unpack_from(mm, HEADER.size + k * SECTION.size)
+        sections[tag] = (offset, size)
+
+    def raw(tag):
+        offset, size = sections[tag]
+        return mm[offset:offset + size]
+
+    def array(tag, dtype):
+        offset, size = sections[tag]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(mm, dtype=dtype, count=size // dtype.itemsize,
+                             offset=offset)
+
+    strs = _read_strings(raw(b"STRS"), nstrings)
+    idxs = [strs[i] for i in array(b"IDXS", "<u4").tolist()]
+    meta = json.loads(raw(b"META").decode("utf-8"))
+    data = fpga.fpga_adt()
+
+    # equations
+    negs = array(b"NEGS", np.uint8).tolist()
+    tables = raw(b"TBLS")
+    eqs = []
+    for (name, text, level, circuit, lits, nlits, neg, nnegs, ops, nops, kind,
+         nvars, table, size) in array(b"EQNS", EQ_RECORD).tolist():
+        e = eq.eq_adt(strs[text])
+        e.literals = tuple(idxs[lits:lits + nlits])
+        e.neglist = tuple(negs[neg:neg + nnegs])
+        e.ops = tuple(idxs[ops:ops + nops])
+        e.table = _unpack_table(kind, nvars, tables[table:table + size])
+        e.name = strs[name]
+        e.isCircuit = bool(circuit)
+        e.level = level
+        eqs.append(e)
+    data.eqs = eqs[:neqs]
+
+    # LUTs, the configuration bits as one string sliced per LUT
+    conf = (np.unpackbits(array(b"CONF", np.uint8)) + ord("0")).tobytes().decode("ascii")
+    odd = meta.pop("odd", {})
+    luts = []
+    for n, (name, tLut, op, row, col, output, inputs, ninputs, conns, nconns,
+            bits_at, bits) in enumerate(array(b"LUTS", LUT_RECORD).tolist()):
+        lut = fpga.LUT(strs[name], tLut)
+        lut.op = eqs[op] if op >= 0 else ""
+        lut.inputs = idxs[inputs:inputs + ninputs]
+        lut.output = strs[output]
+        lut.location = [row, col] if row >= 0 else []
+        lut.connections = odd.get("connections", {}).get(
+            str(n), idxs[conns:conns + nconns]
+        )
+        if bits != NO_DATA:
+            lut.data = conf[bits_at:bits_at + bits]
+        else:
+            lut.data = odd.get("data", {}).get(str(n), {})
+        luts.append(lut)
+    data.luts = luts
+
+    # layout grids
+    cells = array(b"CELL", "<i4")
+    entries = array(b"TABL", CELL_ENTRY).tolist()
+    grids = []
+    for rows, cols, at, table, ntable in array(b"LAYR", LAYER_RECORD).tolist():
+        layer = fpga.grid(rows, cols)
+        layer.cells = cells[at:at + rows * cols].reshape(rows, cols).astype(np.int32)
+        layer.table = [
+            luts[ref] if kind == CELL_LUT else strs[ref]
+            for kind, ref in entries[table:table + ntable]
+        ]
+        layer.ids = {}
+        for c, value in enumerate(layer.table):
+            layer.ids.setdefault(value, c)
+        grids.append(layer)
+    counts = meta.pop("layout")
+    data.layout = []
+    for count in counts:
+        data.layout.append(grids[:count])
+        grids = grids[count:]
+    if flags & SHARED_LAYOUT and data.layout:
+        data.layout.append(data.layout[0])
+
+    # routing
+    if "wire" in meta:
+        data.wire = meta.pop("wire")
+    else:
+        hops = array(b"HOPS", "<i4").tolist()
+        paths = array(b"PATH", PATH_RECORD).tolist()
+        for net, sigs, nsigs, first, npaths in array(b"NETS", NET_RECORD).tolist():
+            data.wire.append({
+                "net": strs[net],
+                "signals": idxs[sigs:sigs + nsigs],
+                "paths": [
+                    [hops[k:k + 2] for k in range(at, at + 2 * n, 2)]
+                    for at, n in paths[first:first + npaths]
+                ],
+            })
+
+    meta.pop("eqs", None)
+    for k, v in meta.items():
+        if hasattr(data, k):
+            setattr(data, k, v)
+    data.lut_type = lut_type
+    data.constrained = bool(flags & CONSTRAINED)
+    data.fromBitstream = True
+    data.reset_free()
+    data.rebuild_index()
+    return data
+
+# string table that hands out indexes, "" is 0
+class _strings:
+    def __init__(self):
+        self.table = [""]
+        self.index = {"": 0}
+
+    def __call__(self, s):
+        s = str(s)
+        if s not in self.index:
+            self.index[s] = len(self.table)
+            self.table.append(s)
+        return self.index[s]
+
+    # count + 1 offsets, then the UTF-8 blob
+    def pack(self):
+        blobs = [s.encode("utf-8") for s in self.table]
+        ends = np.cumsum([0] + [len(b) for b in blobs], dtype=np.uint64)
+        return ends.astype("<u4").tobytes() + b"".join(blobs)
+
+def _read_strings(raw, count):
+    ends = np.frombuffer(raw, dtype="<u4", count=count + 1).tolist()
+    blob = raw[4 * (count + 1):]
+    # names are interned like the parser's literals
+    return [sys.intern(blob[ends[k]:ends[k + 1]].decode("utf-8")) for k in range(count)]
+
+# eq_adt of an equation, a JSON bitstream loads fpga_adt.eqs as dicts
+def _as_eq(e):
+    if not isinstance(e, dict):
+        return e
+    lut = fpga.LUT("", 0)
+    lut.set_op(e)
+    return lut.op
+
+# (kind, nvars, bytes) of a table, nvars is the literal count when
+# every minterm fits in it, a JSON table has string minterms
+def _pack_table(table, nvars):
+    if isinstance(table, tt.truth_table):
+        nvars = table.nvars
+        size = ((1 << nvars) + 7) // 8
+        return TABLE_FULL, nvars, table.bits.to_bytes(size, "little")
+    values = {int(k): v for k, v in table.items()}
+    if any(v not in (0, 1) for v in values.values()):
+        raise Exception("truth table values must be 0 or 1")
+    if values:
+        nvars = max(nvars, max(values).bit_length())
+    size = ((1 << nvars) + 7) // 8
+    bits = sum(1 << k for k, v in values.items() if v)
+    if len(values) == 1 << nvars:
+        return TABLE_FULL, nvars, bits.to_bytes(size, "little")
+    present = sum(1 << k for k in values)
+    return TABLE_DICT, nvars, bits.to_bytes(size, "little") + present.to_bytes(size, "little")
+
+def _unpack_table(kind, nvars, raw):
+    size = ((1 << nvars) + 7) // 8
+    bits = int.from_bytes(raw[:size], "little")
+    if kind == TABLE_FULL:
+        return tt.truth_table(nvars, bits)
+    present = int.from_bytes(raw[size:], "little")
+    return {k: bits >> k & 1 for k in tt.iter_bits(present)}
+
+# table entry of a layout cell, LUTs by their index
+def _entry(value, lut_index, strings):
+    if isinstance(value, fpga.LUT):
+        if id(value) in lut_index:
+            return (CELL_LUT, lut_index[id(value)])
+        value = value.name
+    elif isinstance(value, dict) and "name" in value:
+        # LUT written out whole by an older bitstream
+        value = value["name"]
+        if value in lut_index:
+            return (CELL_LUT, lut_index[value])
+    return (CELL_STR, strings(value))
+
+# layout[1] repeats layout[0], a JSON bitstream loads them as copies
+def _shared(layout):
+    if len(layout) != 2 or len(layout[0]) != len(layout[1]):
+        return False
+    if layout[1] is layout[0]:
+        return True
+    for a, b in zip(layout[0], layout[1]):
+        a = fpga.grid.load(a)
+        b = fpga.grid.load(b)
+        if a.cells.shape != b.cells.shape:
+            return False
+        names_a = np.array([_cell_name(v) for v in a.table], dtype=object)
+        names_b = np.array([_cell_name(v) for v in b.table], dtype=object)
+        if not np.array_equal(names_a[a.cells], names_b[b.cells]):
+            return False
+    return True
+
+# what a layout cell holds, a LUT by its name
+def _cell_name(value):
+    if isinstance(value, fpga.LUT):
+        return value.name
+    if isinstance(value, dict):
+        return value.get("name", "")
+    return value
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+# values in META that json can't write itself, a truth table (LUT
+# data) is written as a dict as the JSON bitstream does, anything else
+# raises like json.dumps so nothing comes back as another type
+def _meta_default(o):
+    if isinstance(o, Mapping):
+        return dict(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
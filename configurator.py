@@ -11,9 +11,16 @@
 ################################################
 # methods:
 # config()
+# read_equations(path: str) -> generator
+# synth_eq(job: tuple) -> tuple
+# init_worker(cache: str) -> None
 ################################################
 
 import logic_synthesis_engine as lse
+import expr_ast as xast
+import min_cache as mc
+import copy
+from concurrent.futures import ProcessPoolExecutor
 # import fse
 import eq_adt as logic
 import fpga_adt as fpga
@@ -22,13 +29,22 @@ import fpga_adt as fpga
 ''' config
 configures the data for the FPGA synthesis engine
 inputs:
-- expr: expression(s) to be synthesized
+- expr: expression(s) to be synthesized, any iterable of strings or
+        (line number, string) pairs like the ones from read_equations
 - nLuts: number of LUTs - number > 0
 - tLut: number of inputs per LUT - 4 or 6
 - cLut: connectivity of LUTs - fully or partially connected
 - bitstream: bitstream file
+- cache: sqlite file to keep minimized functions across runs (optional)
+- workers: processes used to minimize equations, 1 runs in this process
+- reuse: {output name: (expression, eq_adt, minimized equation)} of a
+         previous run, an output with the same expression is not
+         minimized again (see incremental.py)
 '''
-def config(expr: list, nLut: int, tLut: int, cLut='', bitstream=''):
+def config(expr: list, nLut: int, tLut: int, cLut='', bitstream='', cache='',
+           workers=1, reuse=None):
+    if cache:
+        mc.open_disk(cache)
     if bitstream:
         # TODO: implement when pushed to main
         # fse.load_bitstream(bitstream)
@@ -40,9 +56,7 @@ def config(expr: list, nLut: int, tLut: int, cLut='', bitstream=''):
     data.lut_type = tLut
 
     # create LUTs
-    for i in range(nLut):
-        lut = fpga.LUT('LUT' + str(i), tLut)
-        data.add_lut(lut)
+    data.add_luts(nLut, tLut)
 
     # get partially connected LUT file if specified
     # TODO: implement
@@ -53,17 +67,37 @@ def config(expr: list, nLut: int, tLut: int, cLut='', bitstream=''):
         #     lut_data = json.load(f)
     #data.update_connectivity(connectivity)
     
-    # minimize expression to fit in LUTs
-    eq = []
-    req = []
+    # output names and renaming are resolved in input order, each
+    # equation is independent after that and is minimized right away
+    # (or handed to the pool) while the rest are still being read
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                   initargs=(cache,))
+    done = []
+    seen = {}   # expression -> index in done of its first synthesis
     inputs = []
     rein   = {} # redundant input assignment
     outputs = []
+    reused = 0
     for e in expr:
+        # equations from read_equations carry their line number
+        where = ""
+        if isinstance(e, tuple):
+            where = "line " + str(e[0]) + ": "
+            e = e[1]
         # TODO: take out output & check for same name I/O
         # eliminate all spaces
         e = e.replace(' ', '')
         ex = e.split('=')
+        # skip equations the parser can't read
+        try:
+            if len(ex) != 2:
+                raise ValueError("expected one '='")
+            xast.parse(ex[1])
+        except ValueError as err:
+            print("error: " + where + e + ": " + str(err))
+            continue
         nop = ex[0] # new output name
         if ex[0] not in outputs:
             outputs.append(ex[0])
@@ -85,61 +119,55 @@ def config(expr: list, nLut: int, tLut: int, cLut='', bitstream=''):
                         # TODO: check if self referential
                         ex[1] = ex[1][:idx] + r + str(rein[r]) + ex[1][idx+len(r):]
             idx += 1
-            
 
-        # minimize expression
-        
-        # check if POS or SOP
-        pos = False
-        if ex[1][0] == '(':
-            pos = True
+        data.sources[nop] = ex[1]
 
-        equ = logic.eq_adt(ex[1])
-        lit, neg, ops = lse.parser(ex[1], pos=pos)
-        equ.update_literals(lit)
-        equ.update_neglist(neg)
-        equ.update_ops(ops)
+        # an expression seen before reuses that result under this name
+        if ex[1] in seen:
+            done.append((seen[ex[1]], nop))
+            continue
+        seen[ex[1]] = len(done)
 
-        red = lse.synth_engine(equ)
-        rep = red.replace('(', '')
-        rep = rep.replace(')', '')
-        rep = rep.replace(' ', '')
-
-        # check if literals lost in minimization for further reduction
-        l, n, o = lse.parser(rep)
-        if len(l) != len(lit):
-            # redo synthesis with reduced literals
-            equ = logic.eq_adt(rep)
-            equ.update_literals(l)
-            equ.update_neglist(n)
-            equ.update_ops(o)
-            red = lse.synth_engine(equ)
+        # unchanged since the last run
+        if reuse is not None and nop in reuse and reuse[nop][0] == ex[1]:
+            done.append(reuse[nop][1:])
+            reused += 1
+            continue
 
-        equ.name = nop
-        eq.append(equ)
-        req.append(nop + '=' + red)
+        # minimize expression to fit in LUTs
+        if pool is None:
+            done.append(synth_eq((nop, ex[1])))
+        else:
+            done.append(pool.submit(synth_eq, (nop, ex[1])))
+    # results are merged in input order
+    if pool is not None:
+        done = [d if isinstance(d, tuple) else d.result() for d in done]
+        pool.shutdown()
+    for i in range(len(done)):
+        if isinstance(done[i][0], int):
+            first, nop = done[i]
+            equ = copy.copy(done[first][0])
+            equ.name = nop
+            done[i] = (equ, nop + '=' + done[first][1].split('=', 1)[1])
+    eq = [d[0] for d in done]
+    req = [d[1] for d in done]
     # update ADT
     data.update_inputs(inputs)
     data.update_outputs(outputs)
     data.update_eqs(eq)
     data.update_reqs(req)
+    if reuse is not None:
+        data.reuse_report = {"reused": reused}
     
     # develop specs
     r = 2 + nLut//16
     c = nLut // r
     w = tLut * c-1
-    # create layout
+    # create layout, rows of LUTs + 1 layers of
+    # rows of wires x columns of wires * 2 cells
     layout = []
-    l = []
-    for i in range(r+1):            # rows of LUTs + 1
-        wr = []
-        for j in range(w):          # rows of wires
-            for k in range(c*2):    # columns of wires * 2
-                wr.append('')
-            l.append(wr)
-            wr = []
-        layout.append(l)
-        l = []
+    for i in range(r+1):
+        layout.append(fpga.grid(w, c*2))
     # create whole layout
     rlayout = [layout, layout]
     data.update_layout(rlayout)
@@ -153,4 +181,71 @@ def config(expr: list, nLut: int, tLut: int, cLut='', bitstream=''):
     # fdata,ndata = fse.fse()
 
     return (0, data)
-# end config
\ No newline at end of file
+# end config
+
+''' read_equations
+yields (line number, equation) for each equation in a file
+one line at a time, blank lines and comments (# or //) are skipped
+'''
+def read_equations(path: str):
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if line == '' or line.startswith('#') or line.startswith('//'):
+                continue
+            yield n, line
+# end read_equations
+
+''' synth_eq
+parses and minimizes one equation
+inputs:
+- job: (output name, expression) with renaming already applied
+returns (eq_adt, minimized equation string)
+'''
+def synth_eq(job: tuple):
+    nop, exp = job
+    # check if POS or SOP
+    pos = False
+    if exp[0] == '(':
+        pos = True
+
+    equ = logic.eq_adt(exp)
+    lit, neg, ops = lse.parser(exp, pos=pos)
+    equ.update_literals(lit)
+    equ.update_neglist(neg)
+    equ.update_ops(ops)
+
+    red = lse.synth_engine(equ)
+    rep = red.replace('(', '')
+    rep = rep.replace(')', '')
+    rep = rep.replace(' ', '')
+
+    # constant functions have nothing left to reduce
+    if rep == '0' or rep == '1':
+        equ.name = nop
+        return equ, nop + '=' + red
+
+    # check if literals lost in minimization for further reduction
+    l, n, o = lse.parser(rep)
+    if len(l) != len(lit):
+        # redo synthesis with reduced literals
+        equ = logic.eq_adt(rep)
+        equ.update_literals(l)
+        equ.update_neglist(n)
+        equ.update_ops(o)
+        red = lse.synth_engine(equ)
+
+    equ.name = nop
+    return equ, nop + '=' + red
+# end synth_eq
+
+''' init_worker
+sets up the minimization cache of a pool worker
+the sqlite connection of the parent can't be shared, so each
+worker opens its own
+'''
+def init_worker(cache: str):
+    mc.cache.db = None
+    if cache:
+        mc.open_disk(cache)
+# end init_worker
\ No newline at end of file
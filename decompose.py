@@ -0,0 +1,247 @@
+################################################
+# decompose.py
+# agent
+# agent@local
+################################################
+# Contains the decomposition engine that maps a
+# function of any width onto a tree of k-input
+# LUTs (k = 4 or 6).
+# Each step works on the truth table as a NumPy
+# array with one axis per input:
+# - inputs the function does not depend on are
+#   dropped
+# - k or fewer inputs fit in one LUT
+# - otherwise a Roth-Karp decomposition is tried:
+#   a bound set B of inputs is encoded into t < |B|
+#   LUT outputs and the rest of the function is
+#   decomposed on the free inputs plus the codes
+# - if no bound set helps, the function is split
+#   by Shannon cofactoring into a MUX LUT whose
+#   data inputs are the decomposed cofactors
+# Equal subfunctions (or complements) are built
+# once and shared.
+################################################
+# LUT data:
+# character m of the data string is the output
+# for the input assignment m, where inputs[0] is
+# the most significant bit. A LUT with fewer than
+# k inputs has its unused (high) pins tied to 0,
+# the data is padded to 2^k with 0s.
+################################################
+# methods:
+# decompose(outputs: ndarray, vars: list, k: int, name: str) -> tuple
+# bound_set(arr: ndarray, vars: list, k: int) -> tuple
+# evaluate_luts(lut_inputs: list, lut_outputs: list, lut_data: list, values: dict) -> dict
+################################################
+
+import numpy as np
+
+# bound sets kept at each size of the bound set search
+BEAM_WIDTH = 4
+
+
+""" decompose
+map the function with output array outputs (index m is minterm m,
+vars[0] is the most significant bit) onto k-input LUTs
+returns (lut_inputs, lut_outputs, lut_data), the LUTs are listed
+so that every LUT comes after the LUTs it reads and the last LUT
+drives the function output
+"""
+def decompose(outputs, vars: list, k: int, name: str):
+    net = {
+        "k": k,
+        "name": name,
+        "inputs": [],
+        "outputs": [],
+        "data": [],
+        "memo": {},
+        "luts": 0,
+        "muxes": 0,
+    }
+    arr = np.asarray(outputs, dtype=np.uint8).reshape((2,) * len(vars))
+    _build(net, arr, list(vars), True)
+    return net["inputs"], net["outputs"], net["data"]
+# end decompose
+
+# signal driving arr as (name, inverted), name is None for constants
+# the root always gets its own LUT so it can drive the output
+def _build(net, arr, vars, root):
+    arr, vars = _support(arr, vars)
+    k = net["k"]
+    if not vars:
+        if root:
+            return _add_lut(net, "LUT", [], lambda pins: int(arr))
+        return (None, int(arr))
+    if not root:
+        key = (tuple(vars), arr.tobytes())
+        if key in net["memo"]:
+            return net["memo"][key]
+        comp = (tuple(vars), (1 - arr).tobytes())
+        if comp in net["memo"]:
+            sig, inv = net["memo"][comp]
+            return (sig, 1 - inv)
+        if len(vars) == 1:
+            # a literal or its complement needs no LUT
+            sig = (vars[0], int(arr[0]))
+            net["memo"][key] = sig
+            return sig
+    if len(vars) <= k:
+        sig = _add_lut(net, "LUT", vars, lambda pins: int(arr[pins]))
+    else:
+        found = bound_set(arr, vars, k)
+        if found is not None:
+            sig = _roth_karp(net, arr, vars, found, root)
+        else:
+            sig = _shannon(net, arr, vars, root)
+    if not root:
+        net["memo"][(tuple(vars), arr.tobytes())] = sig
+    return sig
+
+# drop the inputs arr does not depend on
+def _support(arr, vars):
+    i = 0
+    while i < len(vars):
+        lo = np.take(arr, 0, axis=i)
+        if np.array_equal(lo, np.take(arr, 1, axis=i)):
+            arr = lo
+            vars = vars[:i] + vars[i + 1:]
+        else:
+            i += 1
+    return arr, vars
+
+
+""" bound_set
+search for a bound set B of at most k inputs whose columns in the
+decomposition chart take few distinct values, grown pair by pair
+in a beam search
+returns (positions of B, distinct columns, column class of every
+assignment of B) or None if no bound set removes an input
+"""
+def bound_set(arr, vars: list, k: int):
+    n = len(vars)
+    best = None
+    best_score = None
+    beam = [()]
+    for size in range(1, k + 1):
+        tried = {}
+        for b in beam:
+            for v in range(n):
+                if v in b:
+                    continue
+                cand = tuple(sorted(b + (v,)))
+                if cand in tried:
+                    continue
+                uniq, cls = _chart(arr, cand)
+                tried[cand] = (uniq, cls)
+        ranked = sorted(tried, key=lambda c: (len(tried[c][0]), c))
+        for cand in ranked:
+            mu = len(tried[cand][0])
+            t = max(1, (mu - 1).bit_length())
+            gain = len(cand) - t
+            if gain <= 0:
+                continue
+            # fewest code LUTs first, then the most inputs removed
+            score = (t, -gain, cand)
+            if best_score is None or score < best_score:
+                best_score = score
+                best = (cand,) + tried[cand]
+        beam = ranked[:BEAM_WIDTH]
+    return best
+# end bound_set
+
+# distinct columns of the chart with bound set positions b, and the
+# class of each column, columns are assignments of b (b[0] MSB)
+def _chart(arr, b):
+    n = arr.ndim
+    free = [i for i in range(n) if i not in b]
+    chart = np.transpose(arr, list(b) + free).reshape(1 << len(b), -1)
+    # rows are packed to bytes and numbered in order of first appearance
+    packed = np.packbits(chart, axis=1)
+    seen = {}
+    first = []
+    cls = np.empty(len(chart), dtype=np.intp)
+    for r in range(len(chart)):
+        c = seen.setdefault(packed[r].tobytes(), len(seen))
+        if c == len(first):
+            first.append(r)
+        cls[r] = c
+    return chart[first], cls
+
+# f = g(h_0(B), ..., h_t-1(B), F), the h LUTs encode the column class
+def _roth_karp(net, arr, vars, found, root):
+    b, uniq, cls = found
+    mu = len(uniq)
+    t = max(1, (mu - 1).bit_length())
+    bvars = [vars[i] for i in b]
+    cls = cls.reshape((2,) * len(b))
+    codes = []
+    for j in range(t):
+        shift = t - 1 - j
+        sig = _add_lut(net, "LUT", bvars, lambda pins: int(cls[pins]) >> shift & 1)
+        codes.append(sig[0])
+    # g over the free inputs then the code bits, unused codes repeat class 0
+    fvars = [vars[i] for i in range(len(vars)) if i not in b]
+    rows = np.arange(1 << t)
+    rows[rows >= mu] = 0
+    g = uniq[rows].T.reshape((2,) * (len(fvars) + t))
+    return _build(net, g, fvars + codes, root)
+
+# f = x' f0 + x f1 on the input whose cofactors have the smallest support
+def _shannon(net, arr, vars, root):
+    best = None
+    for i in range(len(vars)):
+        f0, v0 = _support(np.take(arr, 0, axis=i), vars[:i] + vars[i + 1:])
+        f1, v1 = _support(np.take(arr, 1, axis=i), vars[:i] + vars[i + 1:])
+        size = (max(len(v0), len(v1)), len(v0) + len(v1))
+        if best is None or size < best[0]:
+            best = (size, i)
+    i = best[1]
+    rest = vars[:i] + vars[i + 1:]
+    sig0 = _build(net, np.take(arr, 0, axis=i), rest, False)
+    sig1 = _build(net, np.take(arr, 1, axis=i), rest, False)
+    pins = [vars[i]]
+    for sig in (sig0, sig1):
+        if sig[0] is not None and sig[0] not in pins:
+            pins.append(sig[0])
+
+    def value(sig, p):
+        if sig[0] is None:
+            return sig[1]
+        return p[pins.index(sig[0])] ^ sig[1]
+
+    return _add_lut(net, "MUX", pins,
+                    lambda p: value(sig1, p) if p[0] else value(sig0, p))
+
+# add a LUT computing fn(pin values) and return its signal
+def _add_lut(net, kind, pins, fn):
+    if kind == "MUX":
+        name = "MUX_%s_%d" % (net["name"], net["muxes"])
+        net["muxes"] += 1
+    else:
+        name = "LUT_%s_%d" % (net["name"], net["luts"])
+        net["luts"] += 1
+    n = len(pins)
+    data = []
+    for m in range(1 << n):
+        p = tuple(m >> (n - 1 - j) & 1 for j in range(n))
+        data.append(str(fn(p)))
+    data = "".join(data).ljust(1 << net["k"], "0")
+    net["inputs"].append(list(pins))
+    net["outputs"].append(name + "_Output")
+    net["data"].append(data)
+    return (name + "_Output", 0)
+
+
+""" evaluate_luts
+value of every LUT output for the input values in values
+(name -> 0/1), LUTs must be listed inputs first
+"""
+def evaluate_luts(lut_inputs: list, lut_outputs: list, lut_data: list, values: dict):
+    values = dict(values)
+    for pins, out, data in zip(lut_inputs, lut_outputs, lut_data):
+        m = 0
+        for p in pins:
+            m = m << 1 | values[p]
+        values[out] = int(data[m])
+    return values
+# end evaluate_luts
@@ -8,57 +8,66 @@
 ###############################################
 # ADT attributes:
 #   eq: string of the input equation, provide at init
-#   literals: list of literals in the equation, updated by parser
-#   neglist: list of negations in the equation, updated by parser
-#   ops: list of operators in the equation, updated by parser
+#   literals: tuple of literals in the equation, updated by parser,
+#             names are interned so equal names share one string
+#   neglist: tuple of negations in the equation, updated by parser
+#   ops: tuple of operators in the equation, updated by parser
+#   table: minterm -> output, a dict or a packed
+#          truth_table view, updated by synth_engine
+#   level: longest chain of equations this one reads through,
+#          0 when it reads only inputs, set by fse.analyze_eq
+# attributes live in __slots__, there is no per
+# object __dict__
 ################################################
 # methods:
 # parser(eq) -> void
 # synth_engine() -> void
+# key() -> tuple
 ################################################
 # import numpy as np
 # import matplotlib.pyplot as plt
+import sys
 import quine_mccluskey as qm
 
 
 class eq_adt:
+    __slots__ = (
+        "eq", "literals", "neglist", "ops", "table", "name", "isCircuit", "level"
+    )
+
     def __init__(self, eq):
         self.eq = eq
-        self.literals = []
-        self.neglist = []
-        self.ops = []
+        self.literals = ()
+        self.neglist = ()
+        self.ops = ()
         self.table = {}
         self.name = ""
         self.isCircuit = False
+        self.level = 0
 
     # update literals method
     def update_literals(self, lit):
         # unpack lit and update literals
-        for i in range(0, len(lit)):
-            self.literals.append(lit[i])
+        self.literals += tuple(sys.intern(l) for l in lit)
 
     # update neglist method
     def update_neglist(self, neg):
         # unpack neg and update neglist
-        for i in range(0, len(neg)):
-            self.neglist.append(neg[i])
+        self.neglist += tuple(neg)
 
     # update ops method
     def update_ops(self, op):
         # unpack op and update ops
-        for i in range(0, len(op)):
-            self.ops.append(op[i])
+        self.ops += tuple(op)
 
     # save truth table
+    # table can be a dict or a truth_table, which reads like a dict
     def update_table(self, table):
         self.table = table
 
     def update_isCircuit(self):
         self.isCircuit = True
 
-    def isCircuit(self):
-        return self.isCircuit
-
     # get_literals()
     def get_literals(self):
         return self.literals
@@ -75,6 +84,12 @@ class eq_adt:
     def get_table(self):
         return self.table
 
+    # key()
+    # fields that make two equations the same, a bitstream
+    # writes equal equations once
+    def key(self):
+        return (self.name, self.eq, tuple(self.literals), tuple(self.neglist), tuple(self.ops))
+
     def draw_tt(self, term):
         print("---------------")
         print("Truth Table for: " + self.eq + ":")
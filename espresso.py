@@ -0,0 +1,212 @@
+################################################
+# espresso.py
+# agent
+# agent@local
+################################################
+# Contains an Espresso style heuristic minimizer.
+# It works on a cover of cubes and loops over
+# REDUCE / EXPAND / IRREDUNDANT until the cover
+# stops improving. Cube checks are done on the
+# packed truth table bits, so the minterm list is
+# never built.
+################################################
+# Cubes are (value, mask) tuples like the ones used
+# by quine_mccluskey: a set mask bit is a don't
+# care, a value bit is the value of a fixed input.
+# Bit j of a cube is bit j of the minterm number.
+################################################
+# methods:
+# espresso(nvars: int, on: int, max_iter: int) -> list
+# initial_cover(nvars: int, on: int) -> list
+# expand(nvars: int, cover: list, on: int) -> list
+# irredundant(nvars: int, cover: list) -> list
+# reduce(nvars: int, cover: list) -> list
+# cube_bits(nvars: int, cube: tuple) -> int
+# supercube(nvars: int, bits: int) -> tuple
+# cost(nvars: int, cover: list) -> tuple
+################################################
+
+import truth_table as tt
+
+
+""" espresso
+minimize the function whose onset is the bitset on
+returns a list of cubes
+"""
+def espresso(nvars: int, on: int, max_iter: int = 8):
+    cover = initial_cover(nvars, on)
+    cover = expand(nvars, cover, on)
+    cover = irredundant(nvars, cover)
+    best = cover
+    for i in range(max_iter):
+        cover = reduce(nvars, cover)
+        cover = expand(nvars, cover, on)
+        cover = irredundant(nvars, cover)
+        if cost(nvars, cover) >= cost(nvars, best):
+            break
+        best = cover
+    return best
+# end espresso
+
+""" initial_cover
+disjoint cover of the onset built by Shannon expansion
+of the bitset, inputs the function does not depend on
+are left as don't cares
+"""
+def initial_cover(nvars: int, on: int):
+    full = tt.full_mask(nvars)
+    memo = {}
+
+    def cover(f, j):
+        # f does not depend on inputs j and above
+        if f == 0:
+            return []
+        if f == full or j == 0:
+            return [(0, (1 << j) - 1)]
+        if (f, j) in memo:
+            return memo[(f, j)]
+        j -= 1
+        lit = _var_mask(nvars, j)
+        shift = 1 << j
+        f1 = f & lit
+        f1 |= f1 >> shift       # cofactor x=1 on both halves
+        f0 = f & (full ^ lit)
+        f0 |= f0 << shift       # cofactor x=0 on both halves
+        if f0 == f1:
+            res = [(v, m | 1 << j) for v, m in cover(f0, j)]
+        else:
+            res = [(v, m) for v, m in cover(f0, j)]
+            res += [(v | 1 << j, m) for v, m in cover(f1, j)]
+        memo[(f, j + 1)] = res
+        return res
+
+    return cover(on, nvars)
+# end initial_cover
+
+""" expand
+raise the inputs of every cube while it stays inside
+the onset, then drop cubes inside an expanded one
+"""
+def expand(nvars: int, cover: list, on: int):
+    off = tt.full_mask(nvars) ^ on
+    # large cubes first so they swallow the small ones
+    cubes = sorted(cover, key=lambda c: -_bitcount(c[1]))
+    # inputs fixed the same way in many cubes are raised last
+    weight = [0] * nvars
+    for value, mask in cubes:
+        for j in range(nvars):
+            if not mask >> j & 1:
+                weight[j] += 1
+    order = sorted(range(nvars), key=lambda j: weight[j])
+
+    out = []
+    for value, mask in cubes:
+        if any(_contains(c, (value, mask)) for c in out):
+            continue
+        for j in order:
+            if mask >> j & 1:
+                continue
+            raised = (value & ~(1 << j), mask | 1 << j)
+            if cube_bits(nvars, raised) & off == 0:
+                value, mask = raised
+        out = [c for c in out if not _contains((value, mask), c)]
+        out.append((value, mask))
+    return out
+# end expand
+
+""" irredundant
+remove cubes whose onset is covered by the other cubes,
+smallest cubes are tried first
+"""
+def irredundant(nvars: int, cover: list):
+    cubes = sorted(cover, key=lambda c: _bitcount(c[1]))
+    bits = [cube_bits(nvars, c) for c in cubes]
+    keep = [True] * len(cubes)
+    for i in range(len(cubes)):
+        rest = 0
+        for k in range(len(cubes)):
+            if k != i and keep[k]:
+                rest |= bits[k]
+        if bits[i] & ~rest == 0:
+            keep[i] = False
+    return [cubes[i] for i in range(len(cubes)) if keep[i]]
+# end irredundant
+
+""" reduce
+shrink every cube to the smallest cube holding the
+part of the onset only it covers
+"""
+def reduce(nvars: int, cover: list):
+    cubes = sorted(cover, key=lambda c: -_bitcount(c[1]))
+    bits = [cube_bits(nvars, c) for c in cubes]
+    out = []
+    for i in range(len(cubes)):
+        rest = 0
+        for k in range(len(cubes)):
+            if k != i:
+                rest |= bits[k]
+        alone = bits[i] & ~rest
+        if alone:
+            cubes[i] = supercube(nvars, alone)
+            bits[i] = cube_bits(nvars, cubes[i])
+            out.append(cubes[i])
+        else:
+            bits[i] = 0     # covered by the others
+    return out
+# end reduce
+
+""" cube_bits
+onset bits of a cube
+"""
+def cube_bits(nvars: int, cube: tuple):
+    full = tt.full_mask(nvars)
+    bits = full
+    value, mask = cube
+    for j in range(nvars):
+        if mask >> j & 1:
+            continue
+        if value >> j & 1:
+            bits &= _var_mask(nvars, j)
+        else:
+            bits &= full ^ _var_mask(nvars, j)
+    return bits
+# end cube_bits
+
+""" supercube
+smallest cube containing every set bit of bits
+"""
+def supercube(nvars: int, bits: int):
+    full = tt.full_mask(nvars)
+    value = 0
+    mask = 0
+    for j in range(nvars):
+        lit = _var_mask(nvars, j)
+        if bits & lit == 0:
+            continue            # input is always 0
+        if bits & (full ^ lit) == 0:
+            value |= 1 << j     # input is always 1
+        else:
+            mask |= 1 << j
+    return (value, mask)
+# end supercube
+
+""" cost
+number of cubes and number of literals in a cover
+"""
+def cost(nvars: int, cover: list):
+    literals = 0
+    for value, mask in cover:
+        literals += nvars - _bitcount(mask)
+    return (len(cover), literals)
+# end cost
+
+# projection mask of bit j of the minterm number
+def _var_mask(nvars, j):
+    return tt.literal_mask(nvars, nvars - 1 - j)
+
+# true if cube a contains cube b
+def _contains(a, b):
+    return b[1] & a[1] == b[1] and (a[0] ^ b[0]) & ~a[1] == 0
+
+def _bitcount(i):
+    return i.bit_count()
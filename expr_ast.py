@@ -0,0 +1,211 @@
+################################################
+# expr_ast.py
+# agent
+# agent@local
+################################################
+# Contains the tokenizer and recursive descent
+# parser for boolean equations. An equation is
+# parsed once into an immutable expression tree;
+# DeMorgan's and flattening are walks over it.
+################################################
+# grammar:
+#   expr    := term ('+' term)*
+#   term    := factor ('*' factor)*
+#   factor  := primary "'"*
+#   primary := literal | '(' expr ')'
+################################################
+# methods:
+# tokenize(eq: str) -> list
+# parse(eq: str) -> node
+# nnf(node, negate: bool) -> node
+# is_pos(node) -> bool
+# cubes(node) -> list
+# clauses(node) -> list
+################################################
+
+import re
+from collections import namedtuple
+
+
+# expression tree nodes, tuples so they can't be changed once built
+Var = namedtuple("Var", "name")
+Not = namedtuple("Not", "arg")
+And = namedtuple("And", "args")
+Or = namedtuple("Or", "args")
+
+# a literal starts with a letter, everything else is one character
+_token_re = re.compile(r"[A-Za-z][A-Za-z0-9]*|\S")
+
+
+""" tokenize
+split an equation into (kind, text, position) tokens in one pass
+kind is one of: lit ' * + ( )
+"""
+def tokenize(eq: str):
+    tokens = []
+    for m in _token_re.finditer(eq):
+        text = m.group()
+        if text in "'*+()":
+            tokens.append((text, text, m.start()))
+        elif text[0].isalpha():
+            tokens.append(("lit", text, m.start()))
+        else:
+            raise ValueError("illegal character '%s' at %d" % (text, m.start()))
+    return tokens
+# end tokenize
+
+
+""" parse
+build the expression tree of an equation
+raises ValueError for malformed equations
+"""
+def parse(eq: str):
+    tokens = tokenize(eq)
+    if not tokens:
+        raise ValueError("empty equation")
+    node, i = _expr(tokens, 0)
+    if i != len(tokens):
+        _fail(tokens, i)
+    return node
+# end parse
+
+def _expr(tokens, i):
+    args = []
+    node, i = _term(tokens, i)
+    args.append(node)
+    while i < len(tokens) and tokens[i][0] == "+":
+        node, i = _term(tokens, i + 1)
+        args.append(node)
+    return _join(Or, args), i
+
+def _term(tokens, i):
+    args = []
+    node, i = _factor(tokens, i)
+    args.append(node)
+    while i < len(tokens) and tokens[i][0] == "*":
+        node, i = _factor(tokens, i + 1)
+        args.append(node)
+    return _join(And, args), i
+
+def _factor(tokens, i):
+    node, i = _primary(tokens, i)
+    while i < len(tokens) and tokens[i][0] == "'":
+        node = Not(node)
+        i += 1
+    return node, i
+
+def _primary(tokens, i):
+    if i >= len(tokens):
+        raise ValueError("equation ends after an operator")
+    kind = tokens[i][0]
+    if kind == "lit":
+        return Var(tokens[i][1]), i + 1
+    if kind == "(":
+        node, i = _expr(tokens, i + 1)
+        if i >= len(tokens) or tokens[i][0] != ")":
+            raise ValueError("missing ')'")
+        return node, i + 1
+    _fail(tokens, i)
+
+def _fail(tokens, i):
+    kind, text, at = tokens[i]
+    if kind == "lit" or kind == "(":
+        raise ValueError("missing operator before '%s' at %d" % (text, at))
+    raise ValueError("unexpected '%s' at %d" % (text, at))
+
+""" _join
+build an And/Or node, merging children of the same type
+"""
+def _join(op, args):
+    if len(args) == 1:
+        return args[0]
+    flat = []
+    for a in args:
+        if type(a) is op:
+            flat.extend(a.args)
+        else:
+            flat.append(a)
+    return op(tuple(flat))
+# end _join
+
+
+""" nnf
+negation normal form: push every NOT down to a literal
+using DeMorgan's, negate complements the whole node
+"""
+def nnf(node, negate=False):
+    kind = type(node)
+    if kind is Var:
+        return Not(node) if negate else node
+    if kind is Not:
+        return nnf(node.arg, not negate)
+    if kind is And:
+        op = Or if negate else And
+    else:
+        op = And if negate else Or
+    return _join(op, [nnf(a, negate) for a in node.args])
+# end nnf
+
+
+""" is_pos
+true if an nnf tree is a product of sums with at least one sum
+"""
+def is_pos(node):
+    if type(node) is Or:
+        return all(_is_literal(a) for a in node.args)
+    if type(node) is not And:
+        return False
+    has_sum = False
+    for a in node.args:
+        if type(a) is Or:
+            if not all(_is_literal(b) for b in a.args):
+                return False
+            has_sum = True
+        elif not _is_literal(a):
+            return False
+    return has_sum
+# end is_pos
+
+def _is_literal(node):
+    return type(node) is Var or (type(node) is Not and type(node.arg) is Var)
+
+def _literal(node):
+    if type(node) is Var:
+        return (node.name, 0)
+    return (node.arg.name, 1)
+
+
+""" cubes
+product terms of an nnf tree as lists of (literal, negated),
+nested sums are distributed to reach sum of products form
+"""
+def cubes(node):
+    kind = type(node)
+    if kind is Var or kind is Not:
+        return [[_literal(node)]]
+    if kind is Or:
+        out = []
+        for a in node.args:
+            out.extend(cubes(a))
+        return out
+    out = [[]]
+    for a in node.args:
+        out = [c + d for c in out for d in cubes(a)]
+    return out
+# end cubes
+
+
+""" clauses
+sum terms of a product of sums as lists of (literal, negated)
+"""
+def clauses(node):
+    if type(node) is Or:
+        return [[_literal(a) for a in node.args]]
+    out = []
+    for a in node.args:
+        if type(a) is Or:
+            out.append([_literal(b) for b in a.args])
+        else:
+            out.append([_literal(a)])
+    return out
+# end clauses
@@ -5,7 +5,50 @@
 ################################################
 # may be replaced with something else later
 ################################################
+# free-slot index:
+# every layer that placement fills (0: LUTs,
+# 2: I/O) has a bitmap of its empty cells, bit
+# column * rows + row, so the first free cell in
+# fill order (down each column, then right) at or
+# after a column is a find-first-set on the map.
+# The index is built from the layout on first use
+# and kept up to date by update_fpga_layout and
+# update_io_layout in fse. It is not written to a
+# bitstream, loading one rebuilds it.
+################################################
+# name index:
+# lut_locations maps a placed LUT's name to its
+# cell and io_locations an I/O net name to the
+# cells it occupies, an output variable is found
+# through output_lut_name. Both are updated at
+# placement like the free-slot index and rebuilt
+# from the layout by load_bitstream.
+################################################
+# layout:
+# layout[0][layer] (layout[1] is the same list)
+# is a grid of rows x columns cells, layer 0 is
+# the LUT layer, 1 wires and 2 I/O. A grid keeps
+# a NumPy array of cell ids and a table from id to
+# what the cell holds ("" for id 0, wire marks,
+# net names and LUT objects), but reads and writes
+# like nested lists: grid[i][j], grid[i, j],
+# len(grid), iterating rows.
+################################################
+# bitstream:
+# a JSON bitstream holds every equation and LUT
+# once, LUT ops, layout cells and layout[1] name
+# them with {"$ref": "<table>/<index>"}, which
+# load_bitstream resolves. load_bitstream reads
+# the file one value at a time and leaves the
+# equations in it, each is parsed the first time
+# one of its fields is used.
+################################################
+import base64
+import codecs
 import json
+import re
+import zlib
+import numpy as np
 import eq_adt as eq
 
 
@@ -25,9 +68,21 @@ class fpga_adt:
         self.luts_utilized = 0
         self.io_utilized = 0
         self.constrained = False
+        self.place_report = {}  # wirelength before / after annealing
+        self.route_report = {}  # nets, wirelength and passes of the router
+        self.delay_model = {"lut": 1.0, "wire": 0.1, "budget": 0}  # see timing.py
+        self.timing_report = {}  # critical delay, budget and worst slack
+        self.sources = {}  # output name -> expression it was synthesized from
+        self.reuse_report = {}  # what an incremental run reused
+        self.free = {}  # layer -> [rows, bitmap of empty cells]
+        self.lut_locations = {}  # LUT name -> [row, column]
+        self.io_locations = {}  # I/O net name -> [[row, column], ...]
 
     # end __init__
 
+    # attributes rebuilt from the layout, left out of bitstreams
+    INDEXES = ("free", "lut_locations", "io_locations")
+
     def update_layout(self, layout):
         self.layout = layout
 
@@ -139,6 +194,16 @@ class fpga_adt:
 
     # end add_lut
 
+    """ add_luts
+    add count empty LUTs of type tLut named prefix0, prefix1, ...
+    """
+
+    def add_luts(self, count, tLut, prefix="LUT"):
+        start = len(self.luts)
+        self.luts.extend(LUT(prefix + str(start + i), tLut) for i in range(count))
+
+    # end add_luts
+
     def add_eq(self, eq):
         self.eqs.append(eq)
 
@@ -149,6 +214,114 @@ class fpga_adt:
 
     # end add_req
 
+    """ first_free
+    first empty cell of a layer at or after column, going down each
+    column before moving right
+    returns [row, column] or None if the rest of the layer is full
+    """
+
+    def first_free(self, layer, column=0):
+        rows, free = self.free_index(layer)
+        free >>= column * rows
+        if free == 0:
+            return None
+        pos = column * rows + (free & -free).bit_length() - 1
+        return [pos % rows, pos // rows]
+
+    # end first_free
+
+    """ free_in_column
+    first empty row of one column of a layer or None if it is full
+    """
+
+    def free_in_column(self, layer, column):
+        rows, free = self.free_index(layer)
+        column %= len(self.layout[0][layer][0])
+        free = free >> (column * rows) & ((1 << rows) - 1)
+        if free == 0:
+            return None
+        return (free & -free).bit_length() - 1
+
+    # end free_in_column
+
+    def free_index(self, layer):
+        if layer not in self.free:
+            cells = self.layout[0][layer].cells
+            # empty cells in fill order, bit k of the map is cell k
+            empty = (cells == 0).T.ravel()
+            packed = np.packbits(empty, bitorder="little").tobytes()
+            self.free[layer] = [cells.shape[0], int.from_bytes(packed, "little")]
+        return self.free[layer]
+
+    # end free_index
+
+    def mark_used(self, layer, loc):
+        if layer in self.free:
+            index = self.free[layer]
+            # cells outside the layer are not in the map
+            if not (0 <= loc[0] < index[0] and 0 <= loc[1] < len(self.layout[0][layer][0])):
+                return
+            index[1] &= ~(1 << (loc[1] * index[0] + loc[0]))
+
+    # end mark_used
+
+    # the layout was changed outside of placement, rebuild on next use
+    def reset_free(self):
+        self.free = {}
+
+    # end reset_free
+
+    """ record_lut
+    note a LUT placed at loc in the name index
+    """
+
+    def record_lut(self, name, loc):
+        self.lut_locations[name] = loc
+
+    # end record_lut
+
+    """ record_io
+    note an I/O net placed at loc in the name index, old is the net
+    the cell held before (if any)
+    """
+
+    def record_io(self, name, loc, old=""):
+        if old != "" and old in self.io_locations:
+            cells = self.io_locations[old]
+            if loc in cells:
+                cells.remove(loc)
+        self.io_locations.setdefault(name, []).append(loc)
+
+    # end record_io
+
+    """ output_location
+    location of the LUT driving an output variable or None
+    """
+
+    def output_location(self, name):
+        if name not in self.output_lut_name:
+            return None
+        return self.lut_locations.get(self.output_lut_name[name])
+
+    # end output_location
+
+    # rebuild the name index from the layout
+    def rebuild_index(self):
+        self.lut_locations = {}
+        self.io_locations = {}
+        if self.layout == []:
+            return
+        luts = self.layout[0][0]
+        for i, j in zip(*np.nonzero(luts.cells)):
+            elem = luts[i, j]
+            if isinstance(elem, LUT) and elem.name not in self.lut_locations:
+                self.lut_locations[elem.name] = [int(i), int(j)]
+        io = self.layout[0][2]
+        for i, j in zip(*np.nonzero(io.cells)):
+            self.io_locations.setdefault(io[i, j], []).append([int(i), int(j)])
+
+    # end rebuild_index
+
     def update_utilization(self):
         num_luts_used = 0
         for lut in self.luts:
@@ -156,60 +329,386 @@ class fpga_adt:
                 num_luts_used += 1
         self.luts_utilized = num_luts_used
 
+    """ load_bitstream
+    fpga_adt from a JSON bitstream, references like
+    {"$ref": "luts/<i>"} (see fse.write_bitstream) become the
+    objects they name, older bitstreams write every LUT and
+    equation out in full
+    the file is read a piece at a time, the equations are only
+    read from it when something uses them, each read opens the
+    file again so no handle is kept once loading is done
+    """
+
     @classmethod
     def load_bitstream(cls, filepath):
-        with open(filepath, "r") as file:
-            data = json.load(file)
-
         fpga_instance = cls()
-        lut_list = []
-        # Reconstruct LUT objects
-        if "luts" in data:
-            fpga_instance.luts = [
-                LUT(lut_data.get("name"), lut_data.get("type"))
-                for lut_data in data["luts"]
-            ]
-            for lut_instance, lut_data in zip(fpga_instance.luts, data["luts"]):
-                lut_instance.set_op(
-                    lut_data.get("op", {})
-                )  # Handle eq_adt reconstruction
-                lut_instance.inputs = lut_data.get("inputs", [])
-                lut_instance.output = lut_data.get("output", "")
-                lut_instance.location = lut_data.get("location", [])
-                lut_instance.connections = lut_data.get("connections", [])
-                lut_instance.data = lut_data.get("data", {})
-                
-
-        # replace the fpga's lut list with the reconstructed lut list
-        #fpga_instance.luts = lut_list
+        tables = {"eqs": [], "ops": [], "luts": []}
+        lut_ops = []  # resolved once the equations are known
+        data = {}
+        with _bitstream_file(filepath) as source:
+            for key in source.fields():
+                if key in ("eqs", "ops"):
+                    tables[key] = [_lazy_eq(source, span) for span in source.spans()]
+                elif key == "luts":
+                    # Reconstruct LUT objects
+                    for lut_data in source.items():
+                        lut_instance = LUT(lut_data.get("name"), lut_data.get("type"))
+                        lut_instance.inputs = lut_data.get("inputs", [])
+                        lut_instance.output = lut_data.get("output", "")
+                        lut_instance.location = lut_data.get("location", [])
+                        lut_instance.connections = lut_data.get("connections", [])
+                        lut_instance.data = lut_data.get("data", {})
+                        lut_ops.append(lut_data.get("op", {}))
+                        tables["luts"].append(lut_instance)
+                elif key == "layout":
+                    # layers come back as grids, older bitstreams hold nested lists
+                    data[key] = [
+                        layers if _is_ref(layers)
+                        else [grid.load(layer) for layer in layers]
+                        for layers in source.value()
+                    ]
+                else:
+                    data[key] = source.value()
+
+        fpga_instance.luts = tables["luts"]
+        for lut_instance, op in zip(fpga_instance.luts, lut_ops):
+            lut_instance.set_op(_resolve(op, tables))  # Handle eq_adt reconstruction
+        fpga_instance.eqs = tables["eqs"]
         # Set other attributes
         for key, value in data.items():
-            if key != "luts" and hasattr(fpga_instance, key):
+            if hasattr(fpga_instance, key):
                 setattr(fpga_instance, key, value)
+        tables["layout"] = fpga_instance.layout
+        for k, layers in enumerate(fpga_instance.layout):
+            if _is_ref(layers):
+                fpga_instance.layout[k] = _resolve(layers, tables)
+                continue
+            for layer in layers:
+                layer.table = [_resolve(value, tables) for value in layer.table]
+                for i, value in enumerate(layer.table):
+                    if isinstance(value, LUT):
+                        layer.ids.setdefault(value, i)
 
         fpga_instance.fromBitstream = True
+        fpga_instance.reset_free()
 
         # manually replace LUTs onto layouts
         for lut in fpga_instance.luts:
             loc = lut.get_location()
             if loc != []:
                 fpga_instance.layout[0][0][loc[0]][loc[1]] = lut
+        fpga_instance.rebuild_index()
 
         return fpga_instance
 
+    # end load_bitstream
+
 
 # end fpga_adt
 
 
+# {"$ref": "<table>/<index>"} written by fse.write_bitstream
+def _is_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and "$ref" in value
+
+
+# the object a reference names, anything else as it is
+def _resolve(value, tables):
+    if not _is_ref(value):
+        return value
+    table, index = value["$ref"].split("/")
+    return tables[table][int(index)]
+
+
+# eq_adt of an equation in a bitstream
+def _load_eq(data):
+    holder = LUT("", 0)
+    holder.set_op(data)
+    return holder.op
+
+
+# a JSON bitstream read one value at a time, only the value being
+# read is held in memory, equations are read back by their spans
+# the file stays open for reading the values until close (or the end
+# of a with block), reading a span opens it on its own
+class _bitstream_file:
+    CHUNK = 1 << 16
+    SPACE = re.compile(r"\s*")
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.ascii = True  # buf offsets are file offsets
+        self.base = 0  # file offset of buf[0]
+        self.pos = 0
+        self.eof = False
+
+    # top level keys, the caller reads each value with value, items
+    # or spans before asking for the next key
+    def fields(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            if self._peek() == "}":
+                return
+            self._expect(",")
+
+    def value(self):
+        return self._take()[0]
+
+    # the items of an array, one at a time
+    def items(self):
+        for each in self._array():
+            yield self._take()[0]
+
+    # (offset, length) in the file of the items of an array, they are
+    # parsed to find where they end but not kept
+    def spans(self):
+        for each in self._array():
+            start = self._offset(self.pos)
+            self._take()
+            yield (start, self._offset(self.pos) - start)
+
+    def read(self, offset, length):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # yields before every item of an array
+    def _array(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._peek() == "]":
+                self.pos += 1
+                return
+            self._expect(",")
+
+    # (value, end) of the next value, more is read while it runs past
+    # the end of what has been read (a number may go on)
+    def _take(self):
+        self._peek()
+        size = self.CHUNK
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value, end
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise Exception(self.path + ": not a bitstream")
+            self._more(size)
+            size *= 2
+
+    # next character after the whitespace, "" at the end of the file
+    def _peek(self):
+        while True:
+            self.pos = self.SPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._more(self.CHUNK)
+
+    def _expect(self, c):
+        if self._peek() != c:
+            raise Exception(self.path + ": not a bitstream, expected " + c)
+        self.pos += 1
+
+    def _offset(self, pos):
+        if self.ascii:
+            return self.base + pos
+        return self.base + len(self.buf[:pos].encode("utf-8"))
+
+    # drop what has been read and read size more bytes
+    def _more(self, size):
+        data = self.file.read(size)
+        self.base = self._offset(self.pos)
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + self.text.decode(data, self.eof)
+        self.ascii = self.buf.isascii()
+        self.pos = 0
+
+
+# equation of a bitstream read from the file the first time one of
+# its fields is used
+class _lazy_eq(eq.eq_adt):
+    __slots__ = ("source", "span")
+    # kept out of bitstreams
+    INDEXES = ("source", "span")
+
+    def __init__(self, source, span):
+        self.source = source
+        self.span = span
+
+    # only called for the fields not read yet
+    def __getattr__(self, name):
+        if name not in eq.eq_adt.__slots__:
+            raise AttributeError(name)
+        loaded = _load_eq(json.loads(self.source.read(*self.span)))
+        for k in eq.eq_adt.__slots__:
+            setattr(self, k, getattr(loaded, k))
+        return getattr(self, name)
+
+
+class grid:
+    def __init__(self, rows, cols):
+        self.cells = np.zeros((rows, cols), dtype=np.int32)
+        self.table = [""]  # cell id -> value, id 0 is an empty cell
+        self.ids = {"": 0}  # value -> cell id
+
+    # end __init__
+
+    """ id_of
+    cell id of a value, a new value gets the next id
+    """
+
+    def id_of(self, value):
+        try:
+            if value in self.ids:
+                return self.ids[value]
+            self.ids[value] = len(self.table)
+        except TypeError:
+            # unhashable values (LUT dicts from a bitstream) are not shared
+            pass
+        self.table.append(value)
+        return len(self.table) - 1
+
+    # end id_of
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            return self.table[self.cells[index]]
+        return _row(self, index)
+
+    def __setitem__(self, index, value):
+        self.cells[index] = self.id_of(value)
+
+    def __len__(self):
+        return self.cells.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield _row(self, i)
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+    # nested lists of the cell values
+    def to_list(self):
+        return [[self.table[c] for c in row] for row in self.cells.tolist()]
+
+    # end to_list
+
+    """ to_bitstream
+    JSON form of the grid, the cell ids are packed as zlib compressed
+    int32 bytes in base64
+    """
+
+    def to_bitstream(self):
+        packed = zlib.compress(self.cells.astype("<i4").tobytes())
+        return {
+            "rows": self.cells.shape[0],
+            "cols": self.cells.shape[1],
+            "cells": base64.b64encode(packed).decode("ascii"),
+            "table": self.table,
+        }
+
+    # end to_bitstream
+
+    """ load
+    grid from its JSON form or from nested lists
+    """
+
+    @classmethod
+    def load(cls, data):
+        if isinstance(data, grid):
+            return data
+        if isinstance(data, list):
+            cols = len(data[0]) if data else 0
+            out = cls(len(data), cols)
+            for i in range(len(data)):
+                for j in range(cols):
+                    if data[i][j] != "":
+                        out[i, j] = data[i][j]
+            return out
+        out = cls(data["rows"], data["cols"])
+        raw = zlib.decompress(base64.b64decode(data["cells"]))
+        out.cells = np.frombuffer(raw, dtype="<i4").astype(np.int32).reshape(
+            data["rows"], data["cols"]
+        )
+        out.table = data["table"]
+        out.ids = {}
+        for i in range(len(out.table)):
+            if isinstance(out.table[i], str):
+                out.ids.setdefault(out.table[i], i)
+        return out
+
+    # end load
+
+
+# end grid
+
+
+# one row of a grid, reads and writes go to the grid's cells
+class _row:
+    def __init__(self, grid, i):
+        self.grid = grid
+        self.i = i
+
+    def __getitem__(self, j):
+        return self.grid.table[self.grid.cells[self.i, j]]
+
+    def __setitem__(self, j, value):
+        self.grid.cells[self.i, j] = self.grid.id_of(value)
+
+    def __len__(self):
+        return self.grid.cells.shape[1]
+
+    def __iter__(self):
+        table = self.grid.table
+        for c in self.grid.cells[self.i].tolist():
+            yield table[c]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# end _row
+
+
 class LUT:
+    # no per LUT __dict__, fabrics hold many of these
+    __slots__ = (
+        "name", "type", "op", "inputs", "output", "location", "connections", "data"
+    )
+
     def __init__(self, name, tLut):
         self.name = name
         self.type = tLut
         self.op = ""
-        self.inputs = []
+        self.inputs = ()  # empty tuples are shared until the LUT is placed
         self.output = ""
         self.location = []
-        self.connections = []
+        self.connections = ()
         self.data = {}
 
     # end __init__
@@ -261,12 +760,13 @@ class LUT:
         if isinstance(op_data, dict):
             # Create an eq_adt instance using the dictionary data
             self.op = eq.eq_adt(op_data.get("eq", ""))
-            self.op.literals = op_data.get("literals", [])
-            self.op.neglist = op_data.get("neglist", [])
-            self.op.ops = op_data.get("ops", [])
+            self.op.update_literals(op_data.get("literals", []))
+            self.op.update_neglist(op_data.get("neglist", []))
+            self.op.update_ops(op_data.get("ops", []))
             self.op.table = op_data.get("table", {})
             self.op.name = op_data.get("name", "")
             self.op.isCircuit = op_data.get("isCircuit", False)
+            self.op.level = op_data.get("level", 0)
         else:
             self.op = op_data
 
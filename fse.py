@@ -14,10 +14,17 @@
 import json
 import fpga_adt as fpga
 import eq_adt as eq
+import npn
+import decompose as dc
+import aig
+import place
+import route
+import timing
+import quine_mccluskey as qm
+import truth_table as tt
 import numpy as np
-import math
 import sys
-import itertools
+from collections.abc import Mapping
 
 
 class eq_part_adt(eq.eq_adt):
@@ -31,25 +38,43 @@ class eq_part_adt(eq.eq_adt):
         self.lutPrim = []
 
 
+# equations or LUTs that read each other in a loop can't be ordered,
+# levelize, timing and aig raise this naming the signals on the loop
+class CombinationalLoopError(Exception):
+    pass
+
+
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
+# NPN classes of the placed LUTs, one entry per class
+# filled by shared_luts when the 'r' report asks for it
+# key: (lut_type, inputs in the support, canonical truth table bits)
+# value: {"data": canonical data string, "expr": minimized expression}
+npn_cache = {}
+
+
 # analyze input equations and determine the order they are routed
-# most complex equations are routed first
+# free: most complex equations are routed first
+# constrained: equations are routed level by level (see levelize) so
+# every equation comes after the equations it reads
+# both set eq.level on every equation
 def analyze_eq(eq_adt: list, constraint="free", fpga_adt: fpga = None):
-    # get the number of literals and ops in each equation
-    # higher generally means more complex
+    outputs = [each.name for each in eq_adt]
+    if fpga_adt is not None:
+        outputs = fpga_adt.get_outputs()
+    levels = levelize(eq_adt, outputs)
 
     if constraint == "free":
+        # get the number of literals and ops in each equation
+        # higher generally means more complex
         complexity = []
         for each in eq_adt:
             complexity.append(len(each.literals) + len(each.ops))
 
         # sort the equations by complexity
         # the most complex equations are routed first
-
-        # sort the equations by complexity
         output = [
             x
             for _, x in sorted(
@@ -58,179 +83,83 @@ def analyze_eq(eq_adt: list, constraint="free", fpga_adt: fpga = None):
         ]
         return output
     elif constraint == "constrained":
-        # determine the dependency of each equation
-        depdency = {}
-        for each in eq_adt:
-            oliteral = list(set(each.literals))
-            oliteral.sort()
-            depdendent_list = []
-            for literal in oliteral:
-                if literal in fpga_adt.get_outputs():
-                    depdendent_list.append(literal)
-            depdency[each.name] = depdendent_list
-
-
-        # first append any eq with no dependency
-        output = []
-        fpga_outputs = fpga_adt.get_outputs()
-        for each in eq_adt:
-            oliteral = list(set(each.literals))
-            oliteral.sort()
-            depdendent = False
-            for literal in oliteral:
-                if literal in fpga_outputs:
-                    depdendent = True
-                    break
-            if not depdendent:
-                output.append(each)
-                eq_adt.remove(each)  # so we don't have to iterate through it again
-
-        # then append the rest
-        # starting from the ones with least dependency (just 1)
-        # to the ones with most dependency
-
-        # create an empty layer list that is the same size of eq_adt
-        layer = [0] * len(eq_adt)
-        i = 0
-        for each in eq_adt:
-            oliteral = list(set(each.literals))
-            oliteral.sort()
-            for literal in oliteral:
-                if literal in fpga_outputs:
-                    layer[i] += 1
-            i += 1
-
-        # sort the equations by dependency
-        # the least dependent equations are routed first
-        output += [
-            x
-            for _, x in sorted(
-                zip(layer, eq_adt), key=lambda pair: pair[0], reverse=False
-            )
+        # lowest level first, input order within a level
+        return [eq_adt[i] for i in levels]
+
+
+# dependency graph of the equations: deps[name] lists the outputs an
+# equation reads, users[name] the equations that read it
+def eq_graph(eq_adt: list, outputs: list):
+    outputs = set(outputs)
+    deps = {}
+    users = {each.name: [] for each in eq_adt}
+    for each in eq_adt:
+        deps[each.name] = [
+            literal for literal in dict.fromkeys(each.literals)
+            if literal in outputs and literal in users
         ]
+        for literal in deps[each.name]:
+            users[literal].append(each.name)
+    return deps, users
+
+
+# topological order of the equations by Kahn's algorithm
+# an equation that reads no other output is level 0, the rest are one
+# level above the highest equation they read, eq.level is set and the
+# indices of eq_adt are returned sorted by (level, index)
+# raises CombinationalLoopError naming the equations on the loop
+def levelize(eq_adt: list, outputs: list):
+    deps, users = eq_graph(eq_adt, outputs)
+    indegree = {name: len(deps[name]) for name in deps}
+    level = {name: 0 for name in deps}
+    ready = [name for name in deps if indegree[name] == 0]
+    for name in ready:  # ready grows while it is walked
+        for user in users[name]:
+            level[user] = max(level[user], level[name] + 1)
+            indegree[user] -= 1
+            if indegree[user] == 0:
+                ready.append(user)
+
+    if len(ready) < len(deps):
+        # peel off equations that only feed the loop, what is left
+        # are the equations on it
+        loop = set(name for name in deps if indegree[name] > 0)
+        fanout = {name: len([u for u in users[name] if u in loop]) for name in loop}
+        sinks = [name for name in loop if fanout[name] == 0]
+        for name in sinks:
+            loop.discard(name)
+            for dep in deps[name]:
+                if dep in loop:
+                    fanout[dep] -= 1
+                    if fanout[dep] == 0:
+                        sinks.append(dep)
+        names = [each.name for each in eq_adt if each.name in loop]
+        raise CombinationalLoopError(
+            "combinational loop between " + ", ".join(names)
+        )
 
-        # another round of reordering, make sure that the equations that are dependent on
-        # other equations are placed after the equations they are dependent on
-        # check each eq and their literals, if the literal is an output, check if it is in the output list
-        # if it is, find the location of the output in the output list
-        # then find the location of the eq in the output list
-        # if it is smaller, swap the two
-        # repeat until no more swaps are needed
-
-        # first create a dictionary of eq name and their location in the output list
-        output_dict = {}
-        for i in range(len(output)):
-            output_dict[output[i].name] = i
-
-        # then go through each eq and their literals
-        # if the literal is an output, check if it is in the output list
-        # if it is, find the location of the output in the output list
-        # then find the location of the eq in the output list
-        # and keep track of the largest location if there are more than 
-        # one dependent output
-        # if the location of the eq is smaller than the location of the output
-        # move the eq to the right of the largest location
-
-        for each in output:
-            oliteral = list(set(each.literals))
-            oliteral.sort()
-            largest_location = 0
-            for literal in oliteral:
-                if literal in fpga_outputs:
-                    if literal in output_dict:
-                        if output_dict[literal] > largest_location:
-                            largest_location = output_dict[literal]
-            if largest_location > output_dict[each.name]:
-                # move the eq to the right of the largest location
-                output.insert(largest_location + 1, output.pop(output_dict[each.name]))
-                # update the output_dict
-                output_dict[each.name] = largest_location + 1
-                for i in range(len(output)):
-                    output_dict[output[i].name] = i
-
-
-
-        
-
-
-
-        
-
-        return output
+    for each in eq_adt:
+        each.level = level[each.name]
+    return sorted(range(len(eq_adt)), key=lambda i: (eq_adt[i].level, i))
 
 
 # partitions the truth table of each eq_adt into
-# either 4 or 6 input luts
+# a tree of either 4 or 6 input luts (see decompose.py)
 # input: eq_adt, lut_type, fpga_adt
 # output: partitioned_luts, num_luts
 
 
 def partition_to_lut(eq_adt: eq, lut_type: int, fpga_adt: fpga):
-    oliteral = list(
-        set(eq_adt.literals)
-    )  # Assuming this gives a list of all possible input literals
-    oliteral.sort()
+    # literals in the order synth_engine numbered the truth table
+    oliteral = list(dict.fromkeys(eq_adt.literals))
     num_literals = len(oliteral)
 
-    lut_inputs = []
-    lut_outputs = []
-    lut_data = []
-
-    if len(oliteral) < lut_type:
-        lut_input_combinations = itertools.combinations(oliteral, len(oliteral))
-    else:
-        lut_input_combinations = itertools.combinations(oliteral, lut_type)
-    for combination in lut_input_combinations:
-        filtered_table = {
-            k: v
-            for k, v in eq_adt.table.items()
-            if is_combination_relevant(k, combination, num_literals, oliteral)
-        }
-        if filtered_table:
-            lut_index = len(lut_inputs)  # Index for the next LUT
-            lut_inputs.append(list(combination))
-            lut_outputs.append(f"LUT_{eq_adt.name}_{lut_index}_Output")
-            relevant_minterms = get_relevant_minterms(
-                combination, num_literals, oliteral, eq_adt.table
-            )
-            binary_data = "".join(
-                str(eq_adt.table.get(minterm, 0)) for minterm in relevant_minterms
-            )
-            binary_data = adjust_binary_length(binary_data, lut_type)
-            lut_data.append(binary_data)
-
-    # if no muxes are needed, return here
-    if len(lut_data) == 1:
-        num_luts = 1
-        output_lut_name = lut_outputs[0].split("_Output")[0]
-        output_var_name = eq_adt.name
-        return (
-            lut_inputs,
-            lut_outputs,
-            lut_data,
-            num_luts,
-            output_lut_name,
-            output_var_name,
-        )
-
-    # Determining MUX LUTs
-    num_normal_luts = len(lut_inputs)
-    num_select_lines = math.ceil(math.log2(num_normal_luts))
-    num_mux_luts = math.ceil(num_normal_luts / lut_type)
-
-    # Generate MUX LUT configurations
-    for i in range(num_mux_luts):
-        mux_inputs = [
-            lut_outputs[j]
-            for j in range(i * lut_type, min((i + 1) * lut_type, num_normal_luts))
-        ]
-        mux_outputs = f"MUX_{eq_adt.name}_{i}_Output"
-        mux_binary_data = generate_mux_data(
-            num_select_lines, len(mux_inputs)
-        )  # Placeholder, implement the logic based on your MUX design
-        lut_inputs.append(mux_inputs)
-        lut_outputs.append(mux_outputs)
-        lut_data.append(mux_binary_data)
+    # decompose the truth table into a tree of lut_type input LUTs
+    # the LUTs come back inputs first and the last one drives the output
+    outputs = table_to_array(eq_adt.table, num_literals)
+    lut_inputs, lut_outputs, lut_data = dc.decompose(
+        outputs, oliteral, lut_type, eq_adt.name
+    )
 
     num_luts = len(lut_outputs)
     output_lut_name = lut_outputs[-1].split("_Output")[0]
@@ -238,35 +167,82 @@ def partition_to_lut(eq_adt: eq, lut_type: int, fpga_adt: fpga):
     return lut_inputs, lut_outputs, lut_data, num_luts, output_lut_name, output_var_name
 
 
-def is_combination_relevant(minterm, combination, num_literals, oliteral):
-    binary_repr = format(minterm, f"0{num_literals}b")
-    output = all(binary_repr[oliteral.index(lit)] != "0" for lit in combination)
-    return output
-
+# partition every equation with the chosen mapper
+# "decompose": each equation on its own with partition_to_lut
+# "aig": all equations through one shared AIG (see aig.py), a LUT
+#        shared by several equations is listed under the first one
+# reuse: {output name: partition_to_lut tuple} of a previous run, the
+#        AIG is only skipped when every equation is in it
+# output: {output name: partition_to_lut tuple}
+def partition_all(
+    eqs: list, lut_type: int, fpga_adt: fpga, mapper="decompose", reuse=None
+):
+    reuse = reuse or {}
+    if mapper == "aig":
+        if eqs and all(eq.name in reuse for eq in eqs):
+            return {eq.name: reuse[eq.name] for eq in eqs}
+        return aig.map_luts(eqs, lut_type)
+    if mapper != "decompose":
+        raise Exception("mapper must be decompose or aig")
+    parts = {}
+    for eq in eqs:
+        if eq.name in reuse:
+            parts[eq.name] = reuse[eq.name]
+        else:
+            parts[eq.name] = partition_to_lut(eq, lut_type, fpga_adt)
+    return parts
+
+
+# output of every minterm of a truth table as a uint8 array
+def table_to_array(table, num_literals):
+    size = 1 << num_literals
+    if isinstance(table, tt.truth_table) and table.nvars == num_literals:
+        raw = np.frombuffer(table.bits.to_bytes(size // 8 + 1, "little"), np.uint8)
+        return np.unpackbits(raw, bitorder="little")[:size]
+    outputs = np.zeros(size, dtype=np.uint8)
+    for k, v in table.items():
+        if 0 <= k < size:
+            outputs[k] = v
+    return outputs
+
+
+# look up the NPN class of a LUT's data in npn_cache
+# the class is canonicalized and minimized only the first time it is seen
+# ninputs: pins the LUT uses, the data of the unused pins is ignored
+def share_lut(data, lut_type, ninputs=None):
+    if ninputs is None:
+        ninputs = lut_type
+    data = adjust_binary_length(data[: 1 << ninputs], ninputs)
+    nvars, bits = npn.support(ninputs, npn.data_to_bits(data))
+    key = (lut_type, nvars, npn.canonical(nvars, bits))
+    if key not in npn_cache:
+        npn_cache[key] = {
+            "data": npn.bits_to_data(nvars, key[2]),
+            "expr": npn_expression(nvars, key[2]),
+        }
+    return key
 
-def get_relevant_minterms(combination, num_literals, oliteral, table):
-    relevant_minterms = []
-    for minterm in range(2**num_literals):
-        if (
-            is_combination_relevant(minterm, combination, num_literals, oliteral)
-            and minterm in table
-        ):
-            relevant_minterms.append(minterm)
-    return relevant_minterms
 
+# minimized expression of a canonical LUT function over inputs i0..i(n-1)
+# i0 is the most significant bit of the minterm
+def npn_expression(nvars, bits):
+    data = eq.eq_adt("")
+    data.update_table(tt.truth_table(nvars, bits))
+    literals = ["i" + str(i) for i in range(nvars)]
+    return qm.quine_mccluskey(data, literals)
 
-def generate_mux_data(num_select_lines, num_inputs):
-    binary_data = ""
-    for select_combination in range(2**num_select_lines):
-        # Determine which input is selected by this combination
-        selected_input = select_combination % num_inputs
-        # For each combination, only one input is selected
-        input_state = ["0"] * num_inputs
-        if selected_input < num_inputs:
-            input_state[selected_input] = "1"  # Set '1' for the selected input
-        binary_data += "".join(input_state)
 
-    return binary_data[0:15]
+# group the placed LUTs by NPN class
+# LUTs in the same group can share one configuration with rewired inputs
+# output: {(lut_type, inputs in the support, canonical bits): [lut names]}
+def shared_luts(fpga_adt: fpga):
+    groups = {}
+    for lut in fpga_adt.luts:
+        if lut.op == "" or not isinstance(lut.data, str):
+            continue
+        key = share_lut(lut.data, fpga_adt.get_lut_type(), len(lut.inputs))
+        groups.setdefault(key, []).append(lut.name)
+    return groups
 
 
 def adjust_binary_length(binary_data, lut_type):
@@ -281,8 +257,16 @@ def adjust_binary_length(binary_data, lut_type):
 # partition the truth table of each eq_adt into
 # either 4 or 6 input luts and route them
 # input list of eqs are sorted based on complexity
-def routing_free(eq_adt: list, fpga_adt: fpga):
+# parts and keep come from an incremental run (see incremental.py):
+# the partitions to use and the LUT cells of equations that stay put
+def routing_free(
+    eq_adt: list, fpga_adt: fpga, mapper: str = "decompose", parts=None, keep=None
+):
     sorted_eqs = analyze_eq(eq_adt)  # Analyze and sort equations, placeholder function
+    if parts is None:
+        parts = partition_all(sorted_eqs, fpga_adt.get_lut_type(), fpga_adt, mapper)
+    keep = keep or {}
+    reserve(fpga_adt, keep)
 
     lut_ins = []
     lut_outs = []
@@ -295,7 +279,7 @@ def routing_free(eq_adt: list, fpga_adt: fpga):
             num_luts,
             output_lut_name,
             output_var_name,
-        ) = partition_to_lut(eq, fpga_adt.get_lut_type(), fpga_adt)
+        ) = parts[eq.name]
 
         lut_ins.append(lut_inputs)
         lut_outs.append(output_var_name)
@@ -304,8 +288,10 @@ def routing_free(eq_adt: list, fpga_adt: fpga):
         # Place LUTs on the FPGA
         for i in range(num_luts):
             # Find the next available location on the FPGA
-
-            location = find_and_place(fpga_adt, "free", "base", "lut")
+            if eq.name in keep:
+                location = keep[eq.name][i]
+            else:
+                location = find_and_place(fpga_adt, "free", "base", "lut")
             # populate a LUT object
             luts_on_fpga = fpga_adt.get_luts()
 
@@ -361,19 +347,36 @@ def routing_free(eq_adt: list, fpga_adt: fpga):
     #             input_location = find_io(fpga_adt, input)
     #             pass
 
+    update_timing(fpga_adt)
     fpga_adt.update_utilization()
 
 
 # LUT routing with connection constraints
-def routing_constrained(eq_adt: list, fpga_adt: fpga):
+# the greedy placement is refined by annealing (effort 0 keeps it),
+# then the nets are routed over the wire cells, a fabric too congested
+# to route raises route.UnroutableError
+# parts and keep are as in routing_free, kept LUTs are not annealed
+def routing_constrained(
+    eq_adt: list,
+    fpga_adt: fpga,
+    mapper: str = "decompose",
+    effort: float = 1.0,
+    seed: int = 551,
+    parts=None,
+    keep=None,
+):
     sorted_eqs = analyze_eq(
         eq_adt, "constrained", fpga_adt
     )  # Analyze and sort equations, placeholder function
+    if parts is None:
+        parts = partition_all(sorted_eqs, fpga_adt.get_lut_type(), fpga_adt, mapper)
+    keep = keep or {}
     lut_ins = []
     lut_outs = []
 
     output_dict = {}
     place_wires(fpga_adt)
+    reserve(fpga_adt, keep)
     find_lut_list = sorted_eqs.copy()
     for eq in sorted_eqs:
         # Partition each equation into LUTs
@@ -384,7 +387,7 @@ def routing_constrained(eq_adt: list, fpga_adt: fpga):
             num_luts,
             output_lut_name,
             output_var_name,
-        ) = partition_to_lut(eq, fpga_adt.get_lut_type(), fpga_adt)
+        ) = parts[eq.name]
 
         lut_ins.append(lut_inputs)
         lut_outs.append(output_var_name)
@@ -400,15 +403,18 @@ def routing_constrained(eq_adt: list, fpga_adt: fpga):
         # a LUT that is dependent on other LUTs will be ordered after all the LUTs it is dependent on
 
         for i in range(num_luts):
-            location = find_and_place(
-                fpga_adt,
-                "constrained",
-                "base",
-                "lut",
-                find_lut_list,
-                sorted_eqs,
-                output_dict,
-            )
+            if eq.name in keep:
+                location = keep[eq.name][i]
+            else:
+                location = find_and_place(
+                    fpga_adt,
+                    "constrained",
+                    "base",
+                    "lut",
+                    find_lut_list,
+                    sorted_eqs,
+                    output_dict,
+                )
             luts_on_fpga = fpga_adt.get_luts()
 
             for lut in luts_on_fpga:
@@ -423,6 +429,14 @@ def routing_constrained(eq_adt: list, fpga_adt: fpga):
                     break
         find_lut_list.pop(0)
 
+    # refine the placement before the I/O is placed next to it,
+    # nets on the critical path weigh more
+    weights = timing.net_weights(timing.analyze(fpga_adt))
+    fixed = set()
+    for name in keep:
+        fixed.update(out.split("_Output")[0] for out in parts[name][1])
+    fpga_adt.place_report = place.anneal(fpga_adt, effort, seed, weights, fixed)
+
     # route inputs
     # go through each column of the base layer and find the inputs to the LUTS on that column
     # and route the inputs to the column to the left of the LUTs in the I/O layer
@@ -457,10 +471,10 @@ def routing_constrained(eq_adt: list, fpga_adt: fpga):
     # route internal LUT connections
     # route from either from input to a LUT, or the input of a LUT to the output to another LUT,
     # or the output of a LUT to the output
+    crit = timing.criticality(timing.analyze(fpga_adt))
+    fpga_adt.route_report = route.route(fpga_adt, crit=crit)
+    update_timing(fpga_adt)
 
-    # route from inputs
-
-    #
     fpga_adt.update_utilization()
 
 
@@ -481,13 +495,10 @@ def find_and_place(
             # get the base layer
             layout = layout[0]
             if target_type == "lut":
-                # get the LUT layer
-                layout = layout[0]
-                # fill vertically first
-                for j in range(len(layout[0])):
-                    for i in range(len(layout)):
-                        if layout[i][j] == "":
-                            return [i, j]
+                # first free LUT, filling vertically first
+                location = fpga_adt.first_free(0)
+                if location is not None:
+                    return location
             elif target_type == "wire":
                 # get the wire layer
                 layout = layout[1]
@@ -496,23 +507,17 @@ def find_and_place(
                         if layout[i][j] == "":
                             return [i, j]
         elif target_layer == "io":
-            layout = layout[0][2]  # the other array is discared
             # no constraint so just place whereever
-            for j in range(len(layout[0])):
-                for i in range(len(layout)):
-                    if layout[i][j] == "":
-                        return [i, j]
+            location = fpga_adt.first_free(2)
+            if location is not None:
+                return location
 
     elif constraint == "constrained":
         # first check the types of input to this LUT
         # if all the inputs are external, it can be placed more towards the left (start of index)
         # if it is dependent on the output of another LUT, it must be placed behind it
         if target_layer == "base":
-            # get the base layer
-            layout = layout[0]
             if target_type == "lut":
-                # get the LUT layer
-                layout = layout[0]
                 oliteral = list(set(remaining_eq[0].literals))
                 oliteral.sort()
                 dependent = {}  # {depdent_var: dependent_var_location}
@@ -525,135 +530,112 @@ def find_and_place(
 
                 # if the LUT is not dependent on any other LUTs, place it
                 # as far left as possible
-
-                if len(dependent) == 0:
-                    # fill vertically first
-                    for j in range(len(layout[0])):
-                        for i in range(len(layout)):
-                            if layout[i][j] == "":
-                                return [i, j]
-
                 # if the LUT is dependent on other LUTs, place it on the first
                 # column that is to the rightmost of all the dependent LUTs
-
-                else:
+                start = 0
+                if len(dependent) != 0:
                     # find the rightmost column
                     rightmost = 0
                     for key in dependent:
                         if dependent[key][1] > rightmost:
                             rightmost = dependent[key][1]
-                    # fill vertically first
-                    for j in range(rightmost + 1, len(layout[0])):
-                        for i in range(len(layout)):
-                            if layout[i][j] == "":
-                                return [i, j]
+                    start = rightmost + 1
+                # fill vertically first
+                location = fpga_adt.first_free(0, start)
+                if location is not None:
+                    return location
         elif target_layer == "io":
             base = layout[0][0]  # to reference where the LUTs are
             layout = layout[0][2]
             if target_type == "input":
                 target_column = []
-                for j in range(len(layout[0])):
-                    for i in range(len(layout)):
-                        if isinstance(
-                            base[i][j], fpga.LUT
-                        ):  # this is a LUT and needs input on the left
-                            # check if this LUT needs the current input
-                            this_lut = base[i][j]
-
-                            for lut in fpga_adt.luts:
-                                if lut == this_lut:
-                                    if input_name in lut.inputs:
-                                        # place the input to the left of this LUT
-                                        target_column.append(j - 1)
-                                    break
+                for name, loc in fpga_adt.lut_locations.items():
+                    # this is a LUT and needs input on the left
+                    # check if this LUT needs the current input
+                    if input_name in base[loc[0]][loc[1]].inputs:
+                        # place the input to the left of this LUT
+                        target_column.append(loc[1] - 1)
                 # target column is now a list of columns that need this input
                 # find the first row in each column that is empty
                 # get rid of repeats
-                target_column = list(set(target_column))
+                # a LUT in column 0 reads from the last column, as
+                # indexing the layout with -1 did
+                target_column = list(set(c % len(layout[0]) for c in target_column))
                 input_assignments = []
                 for column in target_column:
-                    for i in range(len(layout)):
-                        if layout[i][column] == "":
-                            input_assignments.append([i, column])
-                            break
+                    row = fpga_adt.free_in_column(2, column)
+                    if row is not None:
+                        input_assignments.append([row, column])
                 return input_assignments
             # output is the same as input but on the right
             if target_type == "output":
                 output_lut = fpga_adt.output_lut_name[output_name]
                 target_column = []
-                for j in range(len(layout[0])):
-                    for i in range(len(layout)):
-                        if isinstance(base[i][j], fpga.LUT):
-                            this_lut = base[i][j]
-
-                            for lut in fpga_adt.luts:
-                                if lut == this_lut:
-                                    if output_lut == lut.name:
-                                        # if this is the not the last LUT, place it to the right
-                                        if j + 1 < len(layout[0]):
-                                            target_column.append(j + 1)
-                                        else:
-                                            target_column.append(j)
-                                    break
+                if output_lut in fpga_adt.lut_locations:
+                    j = fpga_adt.lut_locations[output_lut][1]
+                    # if this is the not the last LUT, place it to the right
+                    if j + 1 < len(layout[0]):
+                        target_column.append(j + 1)
+                    else:
+                        target_column.append(j)
                 # target column is now a list of columns that need this input
                 # find the first row in each column that is empty
                 # get rid of repeats
                 target_column = list(set(target_column))
                 output_assignments = []
                 for column in target_column:
-                    for i in range(len(layout)):
-                        # if the target column is the last column, instead append 
-                    
-                        if column == len(layout[0]) - 1:
-                            output_assignments.append([i, column])
-                            break
-                        else: 
-                            if layout[i][column] == "":
-                                output_assignments.append([i, column])
-                                break
+                    # if the target column is the last column, instead append
+                    # to its first row
+                    if column == len(layout[0]) - 1:
+                        output_assignments.append([0, column])
+                        continue
+                    row = fpga_adt.free_in_column(2, column)
+                    if row is not None:
+                        output_assignments.append([row, column])
                 return output_assignments
 
     return [0, 0]  # Return location as [x, y]
 
 
+# hold the cells of the LUTs an incremental run keeps, the other
+# LUTs are placed around them
+def reserve(fpga_adt, keep):
+    fpga_adt.free_index(0)
+    for places in keep.values():
+        for loc in places:
+            fpga_adt.mark_used(0, loc)
+
+
 def update_fpga_layout(fpga_adt, lut):
     layout = fpga_adt.get_layout()
     lut_layer = layout[0][0]
     lut_layer[lut.location[0]][lut.location[1]] = lut
     layout[0][0] = lut_layer
+    fpga_adt.mark_used(0, lut.location)
+    fpga_adt.record_lut(lut.name, lut.location)
     # fpga_adt.update_layout(layout)
 
 
 def update_io_layout(fpga_adt, loc, name):
     layout = fpga_adt.get_layout()
     io_layer = layout[0][2]
+    old = io_layer[loc[0]][loc[1]]
     io_layer[loc[0]][loc[1]] = name
     layout[0][2] = io_layer
+    fpga_adt.mark_used(2, loc)
+    fpga_adt.record_io(name, loc, old)
     # fpga_adt.update_layout(layout)
 
 
+# location of the LUT driving output lut_name, [-1, -1] if not placed
 def find_lut(fpga_adt, lut_name, dependency_dict):
-    layout = fpga_adt.get_layout()
-    lut_layer = layout[0][0]
-    for j in range(len(lut_layer[0])):
-        for i in range(len(lut_layer)):
-            target = dependency_dict[lut_name]
-            if isinstance(lut_layer[i][j], fpga.LUT):
-                if lut_layer[i][j].name == target:
-                    return [i, j]
-
-    return [-1, -1]
+    target = dependency_dict[lut_name]
+    return fpga_adt.lut_locations.get(target, [-1, -1])
 
 
+# every location of an I/O net, row by row
 def find_io(fpga_adt, name):
-    layout = fpga_adt.get_layout()
-    io_layer = layout[0][2]
-    locations = []
-    for i in range(len(io_layer)):
-        for j in range(len(io_layer[i])):
-            if io_layer[i][j] == name:
-                locations.append([i, j])
-    return locations
+    return sorted(fpga_adt.io_locations.get(name, []))
 
 
 # place wires on base layer every other column
@@ -661,14 +643,11 @@ def find_io(fpga_adt, name):
 def place_wires(fpga_adt):
     layout = fpga_adt.get_layout()
     wire_layer = layout[0][0]
-    for j in range(len(wire_layer[0])):
-        if j % 2 == 0:
-            for i in range(len(wire_layer)):
-                wire_layer[i][j] = "+"
-        else:
-            for i in range(len(wire_layer)):
-                if i % 2 == 0:
-                    wire_layer[i][j] = "+"
+    wire = wire_layer.id_of("+")
+    # every even column, and the even rows of the odd columns
+    wire_layer.cells[:, 0::2] = wire
+    wire_layer.cells[0::2, 1::2] = wire
+    fpga_adt.reset_free()
 
 
 #
@@ -815,10 +794,102 @@ def show_o_extern(fpga_adt: fpga):
     print("----END----")
 
 
+# critical delay, budget and worst slack of the placed fabric
+def update_timing(fpga_adt: fpga):
+    report = timing.analyze(fpga_adt)
+    fpga_adt.timing_report = {
+        key: report[key] for key in ("delay", "budget", "worst_slack")
+    }
+
+
+# the n outputs with the least slack and their critical paths
+def show_critical_paths(fpga_adt: fpga, n: int = 5):
+    report = timing.analyze(fpga_adt)
+    model = fpga_adt.delay_model
+    print("Critical Paths:")
+    print(f"Delay Model: LUT {model['lut']}, Wire Cell {model['wire']}")
+    print(f"Critical Path Delay: {report['delay']:.2f}, Budget: {report['budget']:.2f}")
+    for path in timing.critical_paths(report, n):
+        print(
+            f"Output: {path['output']}, Delay: {path['delay']:.2f}, Slack: {path['slack']:.2f}"
+        )
+        print("  " + " -> ".join(f"{name} ({t:.2f})" for name, t in path["path"]))
+        print("---------------")
+    print("----END----")
+
+
 # dump fpga_adt to json
-def write_bitstream(fpga_adt: fpga):
-    bitsteram = json.dumps(fpga_adt, default=lambda o: o.__dict__, indent=4)
-    return bitsteram
+# equations and LUTs are written once, in the top level "eqs", "ops"
+# and "luts" lists, LUT ops and layout cells refer to them with
+# {"$ref": "eqs/<index>"} and {"$ref": "luts/<index>"}, and layout[1]
+# to layout[0] with {"$ref": "layout/0"} (see fpga_adt.load_bitstream)
+# with a file the JSON is streamed into it and nothing is returned
+def write_bitstream(fpga_adt: fpga, file=None):
+    fields = bitstream_fields(fpga_adt)
+    # LUT ops that are not in fpga_adt.eqs go to "ops"
+    ops = []
+    refs = {id(e): "eqs/" + str(i) for i, e in enumerate(fpga_adt.eqs)}
+    # LUTs of an older bitstream each hold a copy of their equation
+    same = {e.key(): refs[id(e)] for e in fpga_adt.eqs}
+    luts = []
+    lut_index = {}
+    for i, lut in enumerate(fpga_adt.luts):
+        lut_index[id(lut)] = i
+        entry = bitstream_fields(lut)
+        if lut.op != "":
+            if id(lut.op) not in refs:
+                key = lut.op.key()
+                if key not in same:
+                    same[key] = "ops/" + str(len(ops))
+                    ops.append(lut.op)
+                refs[id(lut.op)] = same[key]
+            entry["op"] = {"$ref": refs[id(lut.op)]}
+        luts.append(entry)
+    fields["luts"] = luts
+    fields["ops"] = ops
+
+    # layout cells hold LUTs by reference
+    layout = []
+    for k, layers in enumerate(fpga_adt.layout):
+        if k > 0 and layers is fpga_adt.layout[0]:
+            layout.append({"$ref": "layout/0"})
+            continue
+        packed = []
+        for layer in layers:
+            layer = fpga.grid.load(layer).to_bitstream()
+            layer["table"] = [
+                {"$ref": "luts/" + str(lut_index[id(v)])} if id(v) in lut_index else v
+                for v in layer["table"]
+            ]
+            packed.append(layer)
+        layout.append(packed)
+    fields["layout"] = layout
+
+    # packed truth tables are written out as plain minterm dicts
+    encoder = json.JSONEncoder(
+        default=lambda o: dict(o) if isinstance(o, Mapping) else bitstream_fields(o),
+        indent=4,
+    )
+    if file is None:
+        return encoder.encode(fields)
+    file.writelines(encoder.iterencode(fields))
+
+
+# attributes of an object written to the bitstream, the indexes
+# fpga_adt keeps over its layout are rebuilt on load instead,
+# layout grids are written in their packed form
+def bitstream_fields(o):
+    if isinstance(o, fpga.grid):
+        return o.to_bitstream()
+    skip = getattr(o, "INDEXES", ())
+    # LUT and eq_adt keep their attributes in __slots__
+    fields = {}
+    for cls in reversed(type(o).__mro__):
+        for k in getattr(cls, "__slots__", ()):
+            if hasattr(o, k):
+                fields[k] = getattr(o, k)
+    fields.update(getattr(o, "__dict__", {}))
+    return {k: v for k, v in fields.items() if k not in skip}
 
 
 # read json to fpga_adt
@@ -844,7 +915,7 @@ def show_utilization(fpga_adt: fpga):
     #print("Total Units: " + str(len(fpga_adt.layout[0][2])))
     print("Used: " + str(fpga_adt.io_utilized))
     #print("Remaining: " + str(len(fpga_adt.layout[0][2]) - fpga_adt.io_utilized))
-    p#rint("Utilization Rate: " + str(fpga_adt.io_utilized / len(fpga_adt.layout[0][2])))
+    #print("Utilization Rate: " + str(fpga_adt.io_utilized / len(fpga_adt.layout[0][2])))
     print("*****************************")
     print("Memory Required: ")
     print("Total: " + str(len(fpga_adt.luts) * 64) + " bits")
@@ -856,6 +927,43 @@ def show_utilization(fpga_adt: fpga):
     print(
         "LUTs that can be reduced by utilizing Multiplexer hardware: " + str(num_muxes)
     )
+    print("*****************************")
+    groups = shared_luts(fpga_adt)
+    num_shared = sum(len(names) - 1 for names in groups.values())
+    print("LUTs that can share an NPN equivalent configuration: " + str(num_shared))
+    for key, names in groups.items():
+        if len(names) > 1:
+            print("  " + npn_cache[key]["expr"] + ": " + ", ".join(names))
+    if fpga_adt.place_report:
+        print("*****************************")
+        report = fpga_adt.place_report
+        print("Placement Wirelength (bounding box): ")
+        print("Greedy: " + str(report["before"]))
+        print("Annealed: " + str(report["after"]))
+    if fpga_adt.route_report:
+        report = fpga_adt.route_report
+        print("*****************************")
+        print("Routing: ")
+        print("Nets Routed: " + str(report["nets"]))
+        print("Wirelength (wire cells): " + str(report["wirelength"]))
+        print("Iterations: " + str(report["iterations"]))
+        print("Overused Wire Cells: " + str(report["overused"]))
+    if fpga_adt.timing_report:
+        report = fpga_adt.timing_report
+        print("*****************************")
+        print("Timing: ")
+        print("Critical Path Delay: " + f"{report['delay']:.2f}")
+        print("Budget: " + f"{report['budget']:.2f}")
+        print("Worst Slack: " + f"{report['worst_slack']:.2f}")
+    if fpga_adt.reuse_report:
+        report = fpga_adt.reuse_report
+        print("*****************************")
+        print("Incremental: ")
+        print("Equations: " + str(report.get("equations", 0)))
+        print("Reused Minimizations: " + str(report.get("reused", 0)))
+        print("Reused Partitions: " + str(report.get("partitioned", 0)))
+        print("Kept Placements: " + str(report.get("kept", 0)))
+        print("Kept LUTs: " + str(report.get("luts_kept", 0)))
 
     print("-----------------------------------------------------")
 
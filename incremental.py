@@ -0,0 +1,201 @@
+################################################
+# incremental.py
+# agent
+# agent@local
+################################################
+# Contains the state kept between runs for
+# incremental re-synthesis. Each equation gets
+# two fingerprints:
+# - own: its output name and expression, what
+#   minimizing and partitioning it depend on
+# - cone: own plus the cones of the outputs it
+#   reads, what placing it depends on
+# An equation with the same own fingerprint as
+# last run reuses its eq_adt and LUT partition,
+# one with the same cone and partition keeps its
+# LUTs where they were. Only the rest are placed
+# again, in the cells left free.
+################################################
+# The state is a pickle file written after every
+# run with runner.py --incremental <file>. A run
+# with other settings (LUTs, LUT type, constraints
+# or mapper) only reuses the minimized equations.
+################################################
+# methods:
+# fingerprints(fpga_adt: fpga_adt) -> dict
+# load(path: str) -> dict
+# reuse_eqs(state: dict) -> dict
+# plan(state: dict, fpga_adt: fpga_adt, mapper: str) -> tuple
+# save(path: str, fpga_adt: fpga_adt, parts: dict, mapper: str) -> None
+################################################
+
+import hashlib
+import os
+import pickle
+import fpga_adt as fpga
+import fse
+
+# changes when the state layout does
+VERSION = 1
+
+
+""" fingerprints
+own and cone fingerprints of every equation of a configured fabric
+returns {output name: (own, cone)}
+"""
+def fingerprints(fpga_adt: fpga.fpga_adt):
+    eqs = {each.name: each for each in fpga_adt.eqs}
+    own = {}
+    for name, each in eqs.items():
+        text = name + "=" + fpga_adt.sources.get(name, each.eq)
+        own[name] = hashlib.sha1(text.encode()).hexdigest()
+    cone = {}
+
+    def cone_of(name, path):
+        if name not in cone:
+            reads = [
+                literal for literal in dict.fromkeys(eqs[name].literals)
+                if literal in eqs and literal not in path
+            ]
+            text = own[name] + "".join(
+                sorted(cone_of(literal, path | {name}) for literal in reads)
+            )
+            cone[name] = hashlib.sha1(text.encode()).hexdigest()
+        return cone[name]
+
+    return {name: (own[name], cone_of(name, frozenset())) for name in eqs}
+# end fingerprints
+
+""" load
+state of the last run, empty when there is none or it is unreadable
+"""
+def load(path: str):
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except Exception:
+        print("error: " + path + ": unreadable incremental state, starting over")
+        return {}
+    if not isinstance(state, dict) or state.get("version") != VERSION:
+        return {}
+    return state
+# end load
+
+""" reuse_eqs
+minimized equations config can reuse
+returns {output name: (expression, eq_adt, minimized equation)}
+"""
+def reuse_eqs(state: dict):
+    return {
+        name: (entry["expr"], entry["eq"], entry["req"])
+        for name, entry in state.get("eqs", {}).items()
+    }
+# end reuse_eqs
+
+""" plan
+partitions and placements this run can reuse
+returns (parts, keep): parts as from fse.partition_all for every
+equation and keep {output name: [location of each of its LUTs]}
+for the equations whose LUTs stay where they were
+adds the equation count and the reused partitions and placements to
+fpga_adt.reuse_report, config already put the reused minimizations
+under "reused"
+"""
+def plan(state: dict, fpga_adt: fpga.fpga_adt, mapper: str = "decompose"):
+    prints = fingerprints(fpga_adt)
+    same = state.get("settings") == _settings(fpga_adt, mapper)
+    old = state.get("eqs", {}) if same else {}
+
+    if fpga_adt.constrained:
+        sorted_eqs = fse.analyze_eq(fpga_adt.eqs, "constrained", fpga_adt)
+    else:
+        sorted_eqs = fse.analyze_eq(fpga_adt.eqs)
+    unchanged = [
+        name for name in prints
+        if name in old and old[name]["own"] == prints[name][0]
+    ]
+    reuse = {}
+    if mapper == "decompose":
+        reuse = {name: old[name]["parts"] for name in unchanged}
+    elif len(unchanged) == len(prints) == len(old):
+        # the AIG maps every equation together, reuse all or none
+        reuse = {name: old[name]["parts"] for name in unchanged}
+    parts = fse.partition_all(
+        sorted_eqs, fpga_adt.get_lut_type(), fpga_adt, mapper, reuse
+    )
+
+    keep = {}
+    taken = set()
+    for name in prints:
+        if name not in old or old[name]["cone"] != prints[name][1]:
+            continue
+        if _lut_fields(old[name]["parts"]) != _lut_fields(parts[name]):
+            continue
+        places = [tuple(loc) for loc in old[name]["places"]]
+        if len(places) != parts[name][3] or not taken.isdisjoint(places):
+            continue
+        if any(loc[0] < 0 for loc in places):
+            continue
+        taken.update(places)
+        keep[name] = [list(loc) for loc in places]
+    fpga_adt.reuse_report.update({
+        "equations": len(prints),
+        "partitioned": len(reuse),
+        "kept": len(keep),
+        "luts_kept": sum(len(places) for places in keep.values()),
+    })
+    return parts, keep
+# end plan
+
+""" save
+write the state of a synthesized fabric for the next run
+"""
+def save(path: str, fpga_adt: fpga.fpga_adt, parts: dict, mapper: str = "decompose"):
+    prints = fingerprints(fpga_adt)
+    entries = {}
+    for each in fpga_adt.eqs:
+        name = each.name
+        if name not in parts:
+            continue
+        luts = [out.split("_Output")[0] for out in parts[name][1]]
+        entries[name] = {
+            "expr": fpga_adt.sources.get(name, each.eq),
+            "own": prints[name][0],
+            "cone": prints[name][1],
+            "eq": each,
+            "req": _req(fpga_adt, name),
+            "parts": parts[name],
+            "places": [fpga_adt.lut_locations.get(lut, [-1, -1]) for lut in luts],
+        }
+    state = {
+        "version": VERSION,
+        "settings": _settings(fpga_adt, mapper),
+        "eqs": entries,
+    }
+    # written aside and moved so a failed write keeps the last state
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+# end save
+
+# what has to match for partitions and placements to carry over
+def _settings(fpga_adt, mapper):
+    return {
+        "luts": len(fpga_adt.luts),
+        "lut_type": fpga_adt.get_lut_type(),
+        "constrained": fpga_adt.constrained,
+        "mapper": mapper,
+    }
+
+# LUT names, inputs and data of a partition
+def _lut_fields(part):
+    return (list(part[0]), list(part[1]), list(part[2]))
+
+# minimized equation string config made for an output
+def _req(fpga_adt, name):
+    for req in fpga_adt.reqs:
+        if req.split("=", 1)[0] == name:
+            return req
+    return ""
@@ -0,0 +1,171 @@
+################################################
+# min_cache.py
+# agent
+# agent@local
+################################################
+# Contains the memoization layer in front of the
+# minimizer. Solutions are keyed by the variable
+# count, the packed truth table bits, SOP/POS and
+# the method, so the same function is minimized
+# once no matter which equation it came from.
+################################################
+# The cache has two tiers:
+# - an in-process LRU bounded by size
+# - an optional sqlite file shared across runs,
+#   turned on with open_disk(path)
+################################################
+# methods:
+# make_key(nvars: int, bits: int, sop: bool, method: str) -> tuple
+# open_disk(path: str) -> None
+# close_disk() -> None
+# lookup(key: tuple) -> tuple
+# store(key: tuple, soln: tuple) -> None
+# clear() -> None
+# stats() -> dict
+################################################
+
+import json
+import sqlite3
+from collections import OrderedDict
+
+# entries kept in memory before the oldest is dropped
+CACHE_SIZE = 4096
+
+
+class min_cache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.lru = OrderedDict()
+        self.db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # attach a sqlite file as the second tier
+    def open_disk(self, path):
+        self.close_disk()
+        # pool workers share the file, wait for their writes
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS soln (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+    def close_disk(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    # solution for key or None, a disk hit is moved into memory
+    def get(self, key):
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            self.hits += 1
+            return self.lru[key]
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT value FROM soln WHERE key = ?", (_disk_key(key),)).fetchone()
+            if row is not None:
+                soln = _decode(row[0])
+                self._remember(key, soln)
+                self.disk_hits += 1
+                return soln
+        self.misses += 1
+        return None
+
+    def put(self, key, soln):
+        self._remember(key, soln)
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO soln VALUES (?, ?)",
+                (_disk_key(key), _encode(soln)))
+            self.db.commit()
+
+    def clear(self):
+        self.lru.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, soln):
+        self.lru[key] = soln
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.size:
+            self.lru.popitem(last=False)
+
+
+# cache shared by every call to quine_mccluskey
+cache = min_cache()
+
+
+""" make_key
+cache key of a function, bits is the packed truth table
+with bit m the output of minterm m
+"""
+def make_key(nvars: int, bits: int, sop: bool, method: str):
+    return (nvars, bits, bool(sop), method)
+# end make_key
+
+""" open_disk
+keep solutions in a sqlite file so later runs reuse them
+"""
+def open_disk(path: str):
+    cache.open_disk(path)
+# end open_disk
+
+""" close_disk
+stop using the sqlite file
+"""
+def close_disk():
+    cache.close_disk()
+# end close_disk
+
+""" lookup
+cached solution of a key or None
+"""
+def lookup(key: tuple):
+    return cache.get(key)
+# end lookup
+
+""" store
+save the solution of a key
+"""
+def store(key: tuple, soln: tuple):
+    cache.put(key, soln)
+# end store
+
+""" clear
+empty the in-process tier, the sqlite file is kept
+"""
+def clear():
+    cache.clear()
+# end clear
+
+""" stats
+hit and miss counts of the cache
+"""
+def stats():
+    return {
+        "hits": cache.hits,
+        "disk_hits": cache.disk_hits,
+        "misses": cache.misses,
+        "size": len(cache.lru)
+    }
+# end stats
+
+# sqlite key text, bits are written in hex to keep it short
+def _disk_key(key):
+    nvars, bits, sop, method = key
+    return "%d:%x:%d:%s" % (nvars, bits, sop, method)
+
+# a solution is (complexity, cover), cover is '0', '1' or a list of cubes
+def _encode(soln):
+    cover = soln[1]
+    if not isinstance(cover, str):
+        cover = [list(c) for c in cover]
+    return json.dumps([soln[0], cover])
+
+def _decode(text):
+    complexity, cover = json.loads(text)
+    if not isinstance(cover, str):
+        cover = [tuple(c) for c in cover]
+    return complexity, cover
@@ -0,0 +1,152 @@
+################################################
+# npn.py
+# agent
+# agent@local
+################################################
+# Contains NPN canonicalization of small functions.
+# Two functions are NPN equivalent when one turns
+# into the other by permuting inputs, negating
+# inputs and/or negating the output. A LUT can be
+# configured once per NPN class and reused with
+# its inputs rewired.
+################################################
+# The canonical form is the smallest packed truth
+# table of the class. Every transform is walked
+# with single bit-parallel steps: permutations by
+# adjacent swaps (Steinhaus-Johnson-Trotter) and
+# input negations in Gray code order.
+################################################
+# methods:
+# canonical(nvars: int, bits: int) -> int
+# support(nvars: int, bits: int) -> tuple
+# data_to_bits(data: str) -> int
+# bits_to_data(nvars: int, bits: int) -> str
+# flip(nvars: int, bits: int, j: int) -> int
+# swap(nvars: int, bits: int, j: int) -> int
+################################################
+
+from functools import lru_cache
+import truth_table as tt
+
+
+""" canonical
+smallest truth table NPN equivalent to bits
+bit m of bits is the output of minterm m
+"""
+@lru_cache(maxsize=None)
+def canonical(nvars: int, bits: int):
+    full = tt.full_mask(nvars)
+    best = bits
+    steps = _gray_steps(nvars)
+    for t in _permutations(nvars, bits):
+        # every input negation of this permutation, one flip apart
+        for mask, rest, s in steps:
+            if t < best:
+                best = t
+            if full ^ t < best:
+                best = full ^ t
+            t = (t & mask) >> s | (t & rest) << s
+    return best
+# end canonical
+
+""" support
+drop the inputs bits does not depend on
+returns (number of inputs left, bits over those inputs)
+"""
+def support(nvars: int, bits: int):
+    j = 0
+    while j < nvars:
+        if flip(nvars, bits, j) != bits:
+            j += 1
+            continue
+        # keep the minterms with input j clear and close the gap
+        low = (1 << j) - 1
+        out = 0
+        for m in range(1 << (nvars - 1)):
+            if bits >> ((m & ~low) << 1 | (m & low)) & 1:
+                out |= 1 << m
+        bits = out
+        nvars -= 1
+    return nvars, bits
+# end support
+
+""" data_to_bits
+LUT data string to a packed truth table,
+character m is the output of minterm m
+"""
+def data_to_bits(data: str):
+    bits = 0
+    for m in range(len(data)):
+        if data[m] == "1":
+            bits |= 1 << m
+    return bits
+# end data_to_bits
+
+""" bits_to_data
+packed truth table to a LUT data string
+"""
+def bits_to_data(nvars: int, bits: int):
+    return "".join(str(bits >> m & 1) for m in range(1 << nvars))
+# end bits_to_data
+
+""" flip
+negate input j, where j is the bit of the input in a minterm
+"""
+def flip(nvars: int, bits: int, j: int):
+    mask = _var_mask(nvars, j)
+    s = 1 << j
+    return (bits & mask) >> s | (bits & ~mask & tt.full_mask(nvars)) << s
+# end flip
+
+""" swap
+exchange inputs j and j + 1
+"""
+def swap(nvars: int, bits: int, j: int):
+    # minterms with input j set and input j + 1 clear move up by 1 << j
+    low = _var_mask(nvars, j) & ~_var_mask(nvars, j + 1)
+    s = 1 << j
+    keep = bits & ~(low | low << s)
+    return keep | (bits & low) << s | (bits >> s) & low
+# end swap
+
+# every input permutation of bits, each one adjacent swap from the last
+def _permutations(nvars, bits):
+    yield bits
+    perm = list(range(nvars))
+    dirs = [-1] * nvars
+    while True:
+        # largest mobile element
+        k = -1
+        for i in range(nvars):
+            n = i + dirs[i]
+            if 0 <= n < nvars and perm[n] < perm[i] and (k < 0 or perm[i] > perm[k]):
+                k = i
+        if k < 0:
+            return
+        n = k + dirs[k]
+        bits = swap(nvars, bits, min(k, n))
+        perm[k], perm[n] = perm[n], perm[k]
+        dirs[k], dirs[n] = dirs[n], dirs[k]
+        for i in range(nvars):
+            if perm[i] > perm[n]:
+                dirs[i] = -dirs[i]
+        yield bits
+
+# (mask, rest, shift) of the input flipped at each step of a Gray
+# code over the input negations, the last step returns to the start
+@lru_cache(maxsize=None)
+def _gray_steps(nvars):
+    if nvars == 0:
+        return [(1, 0, 0)]
+    steps = []
+    for i in range(1, (1 << nvars) + 1):
+        j = (i & -i).bit_length() - 1
+        if j == nvars:
+            j = nvars - 1
+        mask = _var_mask(nvars, j)
+        steps.append((mask, tt.full_mask(nvars) ^ mask, 1 << j))
+    return steps
+
+# projection mask of bit j of the minterm number
+def _var_mask(nvars, j):
+    return tt.literal_mask(nvars, nvars - 1 - j)
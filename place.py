@@ -0,0 +1,297 @@
+################################################
+# place.py
+# agent
+# agent@local
+################################################
+# Contains the netlist view of a placed fabric and
+# the simulated annealing placer that refines the
+# greedy placement of routing_constrained.
+################################################
+# Annealing (VPR style):
+# - cost is the sum over nets of the half
+#   perimeter of the bounding box of the net's
+#   LUTs, only the nets of the moved LUTs are
+#   recomputed for a move. Nets to the I/O reach
+#   row 0, where the pads are placed at the top
+#   of the columns next to the LUTs
+# - a move takes a LUT to a site at most rlim
+#   sites away, swapping with the LUT already
+#   there, rlim shrinks as fewer moves are taken
+# - effort scales the moves per temperature
+#   (effort * LUTs^4/3), the seed fixes the moves
+# - a LUT stays right of the output LUTs of the
+#   equations its equation reads, like the greedy
+#   placement
+################################################
+# methods:
+# driver(fpga_adt: fpga_adt, signal: str) -> str
+# lut_nets(fpga_adt: fpga_adt) -> dict
+# wirelength(fpga_adt: fpga_adt, weights: dict) -> int
+# anneal(fpga_adt: fpga_adt, effort: float, seed: int, weights: dict,
+#        fixed: set) -> dict
+################################################
+
+import math
+import random
+import numpy as np
+import fpga_adt as fpga
+
+# temperatures tried at most, bounds the run time
+MAX_TEMPERATURES = 400
+
+
+""" driver
+name of the LUT driving a signal, None for external inputs
+"""
+def driver(fpga_adt: fpga.fpga_adt, signal: str):
+    if signal in fpga_adt.output_lut_name:
+        return fpga_adt.output_lut_name[signal]
+    if signal.endswith("_Output"):
+        return signal[: -len("_Output")]
+    return None
+# end driver
+
+""" lut_nets
+nets between placed LUTs, keyed by the driving LUT (or the input
+name for external inputs)
+returns {key: (driver LUT or None, [signals], [sink LUTs])}
+"""
+def lut_nets(fpga_adt: fpga.fpga_adt):
+    placed = fpga_adt.lut_locations
+    layer = fpga_adt.layout[0][0]
+    nets = {}
+    for name, loc in placed.items():
+        for signal in layer[loc[0]][loc[1]].inputs:
+            src = driver(fpga_adt, signal)
+            if src not in placed:
+                src = None
+            key = src if src is not None else signal
+            if key not in nets:
+                nets[key] = (src, [], [])
+            if signal not in nets[key][1]:
+                nets[key][1].append(signal)
+            if name not in nets[key][2]:
+                nets[key][2].append(name)
+    return nets
+# end lut_nets
+
+""" wirelength
+sum of the half perimeters of the LUT nets, nets of external inputs
+reach row 0, weights (net key -> factor) scale the nets, missing
+nets count once
+"""
+def wirelength(fpga_adt: fpga.fpga_adt, weights: dict = None):
+    loc = fpga_adt.lut_locations
+    total = 0
+    for key, (src, signals, sinks) in lut_nets(fpga_adt).items():
+        cells = [loc[n] for n in sinks] + ([loc[src]] if src is not None else [])
+        w = 1 if weights is None else weights.get(key, 1)
+        total += w * _hpwl(cells, src is None)
+    return total
+# end wirelength
+
+""" anneal
+refine the placement of the LUT layer by simulated annealing
+moves the LUTs in the layout and rebuilds the fabric indexes
+returns {"before", "after", "moves", "accepted", "temperatures"}
+with the wirelength before and after, weights (net key -> factor)
+make the annealer favor short critical nets, the LUTs named in
+fixed do not move
+"""
+def anneal(fpga_adt: fpga.fpga_adt, effort: float = 1.0, seed: int = 551,
+           weights: dict = None, fixed: set = None):
+    layer = fpga_adt.layout[0][0]
+    names = list(fpga_adt.lut_locations)
+    index = {n: i for i, n in enumerate(names)}
+    pos = [tuple(fpga_adt.lut_locations[n]) for n in names]
+    report = {"before": 0, "after": 0, "moves": 0, "accepted": 0,
+              "temperatures": 0}
+
+    # nets as lists of LUT indices, driver first, and whether the net
+    # also reaches a pad
+    outputs = dict.fromkeys(fpga_adt.output_lut_name[o] for o in fpga_adt.get_outputs()
+                            if o in fpga_adt.output_lut_name)
+    nets = []
+    net_w = []
+    for key, (src, signals, sinks) in lut_nets(fpga_adt).items():
+        members = [index[n] for n in sinks]
+        if src is not None:
+            members.insert(0, index[src])
+            outputs.pop(src, None)
+        nets.append((members, src is None or key in outputs))
+        net_w.append(1 if weights is None else weights.get(key, 1))
+    for name in outputs:
+        if name in index:
+            nets.append(([index[name]], True))
+            net_w.append(1 if weights is None else weights.get(name, 1))
+    on_lut = [[] for n in names]
+    for k, (members, top) in enumerate(nets):
+        for m in set(members):
+            on_lut[m].append(k)
+
+    # sites are the cells a LUT can take: empty or holding a LUT
+    sites = set(pos)
+    for i, j in zip(*np.nonzero(layer.cells == 0)):
+        sites.add((int(i), int(j)))
+    movable = [i for i, n in enumerate(names) if not fixed or n not in fixed]
+    if len(sites) < len(pos) + 1 or effort <= 0 or not movable:
+        # overfull (LUTs share a cell) or nothing to do
+        report["before"] = report["after"] = _total(nets, [1] * len(nets), pos)
+        return report
+    rows = sorted(set(s[0] for s in sites))
+    cols = sorted(set(s[1] for s in sites))
+    row_of = {r: i for i, r in enumerate(rows)}
+    col_of = {c: i for i, c in enumerate(cols)}
+    occupant = {p: i for i, p in enumerate(pos)}
+
+    # column order the greedy placement kept: left[m] must stay left of m
+    left, right = _column_rules(fpga_adt, names, index)
+
+    def legal(m, p):
+        return all(pos[d][1] < p[1] for d in left[m]) and all(
+            p[1] < pos[u][1] for u in right[m]
+        )
+
+    cost = [_hpwl([pos[m] for m in members], top) for members, top in nets]
+    total = sum(w * c for w, c in zip(net_w, cost))
+    report["before"] = _total(nets, [1] * len(nets), pos)
+    rng = random.Random(seed)
+
+    # move a LUT within rlim sites, returns the change in cost or None
+    # if the move is not taken, probe only measures the change
+    def try_move(temp, rlim, probe=False):
+        a = movable[rng.randrange(len(movable))]
+        r0 = row_of[pos[a][0]]
+        c0 = col_of[pos[a][1]]
+        r1 = rng.randint(max(0, r0 - rlim), min(len(rows) - 1, r0 + rlim))
+        c1 = rng.randint(max(0, c0 - rlim), min(len(cols) - 1, c0 + rlim))
+        target = (rows[r1], cols[c1])
+        if target == pos[a] or target not in sites:
+            return None
+        b = occupant.get(target)
+        if b is not None and fixed and names[b] in fixed:
+            return None
+        old = pos[a]
+        # move a (and swap b back), check the column rules both ways
+        pos[a] = target
+        if b is not None:
+            pos[b] = old
+        taken = None
+        if legal(a, target) and (b is None or legal(b, old)):
+            touched = set(on_lut[a])
+            if b is not None:
+                touched.update(on_lut[b])
+            new_cost = {k: _hpwl([pos[m] for m in nets[k][0]], nets[k][1])
+                        for k in touched}
+            delta = sum(net_w[k] * (new_cost[k] - cost[k]) for k in touched)
+            if probe:
+                taken = delta
+            elif delta <= 0 or (temp > 0 and rng.random() < math.exp(-delta / temp)):
+                for k in touched:
+                    cost[k] = new_cost[k]
+                occupant[target] = a
+                if b is not None:
+                    occupant[old] = b
+                else:
+                    del occupant[old]
+                return delta
+        pos[a] = old
+        if b is not None:
+            pos[b] = target
+        return taken
+
+    n = len(movable)
+    moves = max(1, int(effort * n ** (4 / 3)))
+    rlim = max(len(rows), len(cols))
+    # starting temperature from the spread of random move costs
+    deltas = []
+    for i in range(n):
+        d = try_move(0, rlim, probe=True)
+        if d is not None:
+            deltas.append(d)
+    temp = 20 * _stdev(deltas)
+    best = (total, list(pos))
+    while temp > 0 and report["temperatures"] < MAX_TEMPERATURES:
+        accepted = 0
+        for i in range(moves):
+            d = try_move(temp, rlim)
+            report["moves"] += 1
+            if d is not None:
+                total += d
+                accepted += 1
+        report["accepted"] += accepted
+        report["temperatures"] += 1
+        if total < best[0]:
+            best = (total, list(pos))
+        rate = accepted / moves
+        if rate > 0.96:
+            temp *= 0.5
+        elif rate > 0.8:
+            temp *= 0.9
+        elif rate > 0.15:
+            temp *= 0.95
+        else:
+            temp *= 0.8
+        rlim = max(1, min(max(len(rows), len(cols)), int(rlim * (0.56 + rate))))
+        if not nets or temp < 0.005 * total / len(nets):
+            break
+    # greedy quench
+    for i in range(moves):
+        d = try_move(0, 1)
+        if d is not None:
+            total += d
+    if total > best[0]:
+        pos = best[1]
+    report["after"] = _total(nets, [1] * len(nets), pos)
+
+    # write the placement back
+    luts = [layer[tuple(fpga_adt.lut_locations[name])] for name in names]
+    for lut in luts:
+        layer[tuple(lut.location)] = ""
+    for lut, p in zip(luts, pos):
+        lut.location = [p[0], p[1]]
+        layer[p] = lut
+    fpga_adt.reset_free()
+    fpga_adt.rebuild_index()
+    return report
+# end anneal
+
+# left[m] are the LUTs m must stay right of: the output LUTs of the
+# equations m's equation reads, right[m] the reverse
+def _column_rules(fpga_adt, names, index):
+    layer = fpga_adt.layout[0][0]
+    outputs = set(fpga_adt.get_outputs())
+    left = [set() for n in names]
+    right = [set() for n in names]
+    for m, name in enumerate(names):
+        loc = fpga_adt.lut_locations[name]
+        op = layer[loc[0]][loc[1]].op
+        if op == "":
+            continue
+        for literal in set(op.literals):
+            if literal not in outputs or literal == op.name:
+                continue
+            src = fpga_adt.output_lut_name.get(literal)
+            if src in index and index[src] != m:
+                left[m].add(index[src])
+                right[index[src]].add(m)
+    return left, right
+
+# half perimeter of the cells, top adds a pad in row 0
+def _hpwl(cells, top=False):
+    if not cells or (len(cells) < 2 and not top):
+        return 0
+    rows = [c[0] for c in cells]
+    cols = [c[1] for c in cells]
+    low = 0 if top else min(rows)
+    return max(rows) - low + max(cols) - min(cols)
+
+def _total(nets, net_w, pos):
+    return sum(w * _hpwl([pos[m] for m in members], top)
+               for w, (members, top) in zip(net_w, nets))
+
+def _stdev(values):
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
@@ -7,22 +7,37 @@
 # algorithm for the minimization of boolean functions.
 ################################################
 # methods:
-# quine_mccluskey(data: adt, literals: list) -> str
-# solve(nvars: int, minterms: list) -> tuple
+# quine_mccluskey(data: adt, literals: list, sop: bool, method: str) -> str
+# solve(nvars: int, minterms: list, max_nodes: int, time_limit: float) -> tuple
+# solve_espresso(nvars: int, table: dict, sop: bool) -> tuple
 # compute_primes(nvars: int, cubes: list) -> set
-# unate_cover(nvars: int, primes: list, ones: list) -> tuple
+# compute_primes_pairwise(nvars: int, cubes: list) -> set
+# unate_cover(nvars: int, primes: list, ones: list, max_nodes: int, time_limit: float) -> tuple
+# prime_complexity(nvars: int, prime: tuple) -> int
+# greedy_cover(chart: dict, rows: int, cols: int) -> list
+# branch_cover(chart: dict, rows: int, cols: int, chosen: list, cost: int) -> None
+# cover_lower_bound(chart: dict, rows: int, cols: int) -> int
 # calculate_complexity(nvars: int, minterms: list) -> int
 # parentheses(glue: str, array: list) -> str
 # get_function(vars: list, minterms: list) -> str
 # bitcount(i: int) -> int
 # is_power_of_two_or_zero(x: int) -> bool
 # merge(a: tuple, b: tuple) -> tuple
+# table_bits(table: dict) -> int
+# onset_terms(table: dict, sop: bool) -> list
 # onset_minterms(tt: dict, bits: bool) -> list
 # minterm_b2d(terms: list) -> list
 # reduce(terms: list) -> dict
 # getPIs(terms: list) -> list
 # pi_b2d(pis: list) -> list
 # b2d(b: list) -> int
+# bits_to_cube(b: list) -> tuple
+# cube_to_bits(cube: tuple, blen: int) -> list
+# cube_minterms(cube: tuple) -> list
+# table_primes(table: dict) -> tuple
+# getPILen(data: adt) -> int
+# genPIs(data: adt, literals: list) -> list
+# getEPIs(data: adt, literals: list) -> list
 ################################################
 # The following code is a modified version of the
 # Quine-McCluskey algorithm from:
@@ -34,44 +49,110 @@
 ################################################
 
 import eq_adt as adt
+import truth_table as tt
+import espresso
+import min_cache as mc
+import time
+import heapq
+
+# budget for the exact cover search in unate_cover, when either
+# runs out the best cover found so far is returned
+COVER_MAX_NODES = 100000
+COVER_TIME_LIMIT = 5.0  # seconds
 
 """ quine_mccluskey
 provides information for the Quine-McCluskey algorithm
+solutions are memoized by min_cache on the truth table bits
+method: "exact" runs Quine-McCluskey, "espresso" runs the
+heuristic minimizer for bounded runtime on wide functions
 """
-def quine_mccluskey(data: adt, literals: list, sop = True):
+def quine_mccluskey(data: adt, literals: list, sop = True, method = "exact"):
+    vars = literals.copy()
+    vars.reverse()
+    if method != "exact" and method != "espresso":
+        raise Exception("method must be exact or espresso")
+    # functions seen before skip minimization
+    key = mc.make_key(len(vars), table_bits(data.table), sop, method)
+    soln = mc.lookup(key)
+    if soln is None:
+        if method == "espresso":
+            soln = solve_espresso(len(vars), data.table, sop)
+        else:
+            md = onset_terms(data.table, sop)
+            soln = solve(len(vars), md)
+        mc.store(key, soln)
     if sop:
-        mb = onset_minterms(data.table, True)
-        md = terms_b2d(mb)
-        vars = literals.copy()
-        vars.reverse()
-        soln = solve(len(vars), md)
         return get_sop_function(vars, soln[1])
     else:
-        mb = onset_maxterms(data.table, True)
-        md = terms_b2d(mb)
-        vars = literals.copy()
-        vars.reverse()
-        soln = solve(len(vars), md)
         return get_pos_function(vars, soln[1])
 # end quine_mccluskey
 
 """ solve
 executes the Quine-McCluskey algorithm
 """
-def solve(nvars, minterms):
+def solve(nvars, minterms, max_nodes = None, time_limit = None):
     # Handle special case for functions that always evaluate to True or False.
     if len(minterms) == 0:
       return 0,'0'
     if len(minterms) == 1<<nvars:
       return 0,'1'
     primes = compute_primes(nvars, minterms)
-    return unate_cover(nvars, list(primes), minterms)
+    return unate_cover(nvars, list(primes), minterms, max_nodes, time_limit)
 # end solve
 
+""" solve_espresso
+minimizes with the Espresso heuristic, same return as solve
+"""
+def solve_espresso(nvars, table, sop = True):
+    on = table_bits(table)
+    if not sop:
+        on ^= tt.full_mask(nvars)
+    if on == 0:
+        return 0,'0'
+    if on == tt.full_mask(nvars):
+        return 0,'1'
+    cover = espresso.espresso(nvars, on)
+    return calculate_complexity(nvars, cover), cover
+# end solve_espresso
+
 """ compute_primes
 find all prime implicants of the function
+cubes with the same mask are kept in one hashed set, so the
+merge partner of a cube is found by looking up value ^ (1<<bit)
+for each of its nvars inputs instead of scanning a whole bucket
 """
 def compute_primes(nvars, cubes):
+    level = {0: set(cubes)}     # mask -> values of the cubes with that mask
+    primes = set()
+    while level:
+        nlevel = {}
+        for mask, values in level.items():
+            merged = set()
+            for value in values:
+                for bit in range(nvars):
+                    b = 1 << bit
+                    # only pair with the partner that has a 1 at bit
+                    if (mask | value) & b:
+                        continue
+                    if value | b in values:
+                        nvalues = nlevel.get(mask | b)
+                        if nvalues is None:
+                            nvalues = nlevel[mask | b] = set()
+                        nvalues.add(value)
+                        merged.add(value)
+                        merged.add(value | b)
+            for value in values - merged:
+                primes.add((value, mask))
+        level = nlevel
+    return primes
+# end compute_primes
+
+""" compute_primes_pairwise
+original prime generator that compares every cube of a popcount
+bucket with every cube of the next one, kept for the benchmark
+in tester.py
+"""
+def compute_primes_pairwise(nvars, cubes):
     sigma = []
     for i in range(nvars+1):
         sigma.append(set())
@@ -98,45 +179,191 @@ def compute_primes(nvars, cubes):
 
 """ unate_cover
 use the PIs to find EPIs and PIs of the function
+the cover is found with branch and bound over the prime chart:
+essential primes are taken, dominated rows and columns dropped,
+and branches that can't beat the best cover are pruned
+once max_nodes or time_limit runs out the best cover so far is kept
 """
-def unate_cover(nvars, primes, ones):
-    chart = []
-    for one in ones:
-        column = []
-        for i in range(len(primes)):
-            if (one & (~primes[i][1])) == primes[i][0]:
-                column.append(i)
-        chart.append(column)
-
-    covers = []
-    if len(chart) > 0:
-        covers = [set([i]) for i in chart[0]]
-    for i in range(1,len(chart)):
-        new_covers = []
-        for cover in covers:
-            for prime_index in chart[i]:
-                x = set(cover)
-                x.add(prime_index)
-                append = True
-                for j in range(len(new_covers)-1,-1,-1):
-                    if x <= new_covers[j]:
-                        del new_covers[j]
-                    elif x > new_covers[j]:
-                        append = False
-                if append:
-                    new_covers.append(x)
-        covers = new_covers
-
-    min_complexity = 99999999
-    for cover in covers:
-        primes_in_cover = [primes[prime_index] for prime_index in cover]
-        complexity = calculate_complexity(nvars, primes_in_cover)
-        if complexity < min_complexity:
-            min_complexity = complexity
-            result = primes_in_cover
+def unate_cover(nvars, primes, ones, max_nodes = None, time_limit = None):
+    if max_nodes is None:
+        max_nodes = COVER_MAX_NODES
+    if time_limit is None:
+        time_limit = COVER_TIME_LIMIT
+    # chart as bitsets: the rows each prime covers, the primes covering each row
+    # each prime walks the minterms it covers instead of testing every one
+    col_rows = [0] * len(primes)
+    row_cols = [0] * len(ones)
+    row = {one: r for r, one in enumerate(ones)}
+    for c in range(len(primes)):
+        value, mask = primes[c]
+        sub = mask
+        while True:
+            r = row.get(value | sub)
+            if r is not None:
+                col_rows[c] |= 1 << r
+                row_cols[r] |= 1 << c
+            if sub == 0:
+                break
+            sub = (sub - 1) & mask
+    weight = [prime_complexity(nvars, p) for p in primes]
+
+    chart = {
+        "col_rows": col_rows,
+        "row_cols": row_cols,
+        "weight": weight,
+        "nodes": 0,
+        "max_nodes": max_nodes,
+        "deadline": time.monotonic() + time_limit,
+    }
+    rows = (1 << len(ones)) - 1
+    cols = (1 << len(primes)) - 1
+    # greedy cover so a result exists even if the budget runs out
+    chart["best"] = greedy_cover(chart, rows, cols)
+    chart["best_cost"] = sum(weight[c] for c in chart["best"])
+    branch_cover(chart, rows, cols, [], 0)
+
+    result = [primes[c] for c in sorted(chart["best"])]
+    min_complexity = calculate_complexity(nvars, result)
+    # a single prime is cheaper than its weight says
+    for c in range(len(primes)):
+        if col_rows[c] == rows and calculate_complexity(nvars, [primes[c]]) < min_complexity:
+            result = [primes[c]]
+            min_complexity = calculate_complexity(nvars, result)
     return min_complexity,result
 # end unate_cover
 
+""" prime_complexity
+complexity a prime adds to a cover, see calculate_complexity
+"""
+def prime_complexity(nvars, prime):
+    masked = ~prime[1] & ((1<<nvars)-1)
+    term_complexity = bitcount(masked)
+    if term_complexity == 1:
+        term_complexity = 0
+    return 1 + term_complexity + bitcount(~prime[0] & masked)
+# end prime_complexity
+
+""" greedy_cover
+cover the rows by repeatedly taking the prime with the
+most uncovered rows per unit of complexity
+"""
+def greedy_cover(chart, rows, cols):
+    col_rows = chart["col_rows"]
+    weight = chart["weight"]
+    # scores only drop as rows get covered, so a column whose
+    # refreshed score still tops the heap is the best one
+    heap = [(-bitcount(col_rows[c] & rows) / weight[c], c) for c in tt.iter_bits(cols)]
+    heapq.heapify(heap)
+    cover = []
+    while rows and heap:
+        score, c = heapq.heappop(heap)
+        fresh = -bitcount(col_rows[c] & rows) / weight[c]
+        if heap and fresh > heap[0][0]:
+            heapq.heappush(heap, (fresh, c))
+            continue
+        if fresh == 0:
+            break
+        cover.append(c)
+        rows &= ~col_rows[c]
+    return cover
+# end greedy_cover
+
+""" branch_cover
+branch and bound search for the cheapest cover of rows
+using the columns in cols, chosen holds the columns taken so far
+"""
+def branch_cover(chart, rows, cols, chosen, cost):
+    chart["nodes"] += 1
+    if chart["nodes"] > chart["max_nodes"] or time.monotonic() > chart["deadline"]:
+        return
+    col_rows = chart["col_rows"]
+    row_cols = chart["row_cols"]
+    weight = chart["weight"]
+    chosen = chosen.copy()
+
+    changed = True
+    while changed and rows:
+        changed = False
+        # essential columns: the only column left for a row
+        for r in tt.iter_bits(rows):
+            if not rows >> r & 1:
+                continue    # covered by an essential column
+            rc = row_cols[r] & cols
+            if rc == 0:
+                return  # row can't be covered
+            if rc & (rc - 1) == 0:
+                c = rc.bit_length() - 1
+                chosen.append(c)
+                cost += weight[c]
+                rows &= ~col_rows[c]
+                cols &= ~rc
+                changed = True
+        if changed or not rows:
+            continue
+        # row dominance: a row whose columns include all of another
+        # row's columns is covered whenever the other row is, only rows
+        # sharing a column with the smaller row can include it
+        for r in sorted(tt.iter_bits(rows), key=lambda r: bitcount(row_cols[r] & cols)):
+            if not rows >> r & 1:
+                continue
+            rc = row_cols[r] & cols
+            c = (rc & -rc).bit_length() - 1
+            for j in tt.iter_bits(col_rows[c] & rows):
+                if j != r and rc & ~row_cols[j] == 0:
+                    rows &= ~(1 << j)
+                    changed = True
+        # column dominance: drop a column whose rows are a subset of
+        # the rows of a column that is no more expensive
+        for c in tt.iter_bits(cols):
+            cr = col_rows[c] & rows
+            if cr == 0:
+                cols &= ~(1 << c)
+                continue
+            r = (cr & -cr).bit_length() - 1
+            for j in tt.iter_bits(row_cols[r] & cols):
+                if j != c and weight[j] <= weight[c] and cr & ~col_rows[j] == 0:
+                    cols &= ~(1 << c)
+                    changed = True
+                    break
+        if cost >= chart["best_cost"]:
+            return
+
+    if not rows:
+        if cost < chart["best_cost"]:
+            chart["best"] = chosen
+            chart["best_cost"] = cost
+        return
+    if cost + cover_lower_bound(chart, rows, cols) >= chart["best_cost"]:
+        return
+
+    # branch on the row with the fewest columns left
+    r = min(tt.iter_bits(rows), key=lambda r: bitcount(row_cols[r] & cols))
+    cands = sorted(
+        tt.iter_bits(row_cols[r] & cols),
+        key=lambda c: (weight[c], -bitcount(col_rows[c] & rows)),
+    )
+    for c in cands:
+        branch_cover(chart, rows & ~col_rows[c], cols & ~(1 << c), chosen + [c], cost + weight[c])
+        # covers using c have all been tried
+        cols &= ~(1 << c)
+# end branch_cover
+
+""" cover_lower_bound
+rows that share no column each need a different column,
+so the cheapest column of each of them adds to the bound
+"""
+def cover_lower_bound(chart, rows, cols):
+    bound = 0
+    used = 0
+    rlist = sorted(tt.iter_bits(rows), key=lambda r: bitcount(chart["row_cols"][r] & cols))
+    for r in rlist:
+        rc = chart["row_cols"][r] & cols
+        if rc & used == 0:
+            used |= rc
+            bound += min(chart["weight"][c] for c in tt.iter_bits(rc))
+    return bound
+# end cover_lower_bound
+
 """ calculate_complexity
 calculate complexity of the function
 """
@@ -198,11 +425,9 @@ def get_pos_function(vars, minterms):
 count the number of bits in an integer
 """
 def bitcount(i):
-    res = 0
-    while i > 0:
-        res += i & 1
-        i >>= 1
-    return res
+    if i <= 0:
+        return 0
+    return i.bit_count()
 # end bitcount
 
 """ is_power_of_two_or_zero
@@ -224,6 +449,32 @@ def merge(a, b):
     return (a[0] & b[0], a[1] | y)
 # end merge
 
+""" table_bits()
+packed bits of a truth table, bit m is the output of minterm m
+"""
+def table_bits(table):
+    if isinstance(table, tt.truth_table):
+        return table.bits
+    bits = 0
+    for m in onset_minterms(table):
+        bits |= 1 << m
+    return bits
+# end table_bits
+
+""" onset_terms()
+returns the decimal minterms (sop) or maxterms (pos)
+read directly from the bits of a packed truth table
+"""
+def onset_terms(table, sop = True):
+    if isinstance(table, tt.truth_table):
+        if sop:
+            return table.minterms()
+        return table.maxterms()
+    if sop:
+        return onset_minterms(table)
+    return onset_maxterms(table)
+# end onset_terms
+
 """ onset_minterms()
 returns all minterms in the truth table
 bits for Quine-McCluskey algorithm
@@ -287,120 +538,53 @@ def terms_b2d(terms: list):
 """ reduce(term)
 get a reduced set of terms based on minterms
 returns dict with keys 'pis' and 'reduced'
+terms are hashed as (value, mask) cubes so each term looks up
+the terms it merges with instead of comparing every pair
 """
 def reduce(terms: list):
-    reduced = []
-    pis     = []
-    pir     = []
-    # determine how many bits are in each term
     if not terms:
         return {
-            "pis": pis,
-            "reduced": reduced
+            "pis": [],
+            "reduced": []
         }
     blen = len(terms[0])
-    for i in range(0, len(terms)):
-        red = False
-        for j in range(i+1, len(terms)):
-            if terms[i] != terms[j]:    # skip if same term
-                # check if terms differ by only one bit
-                diff = []
-                for b in range(0, blen):
-                    if terms[i][b] != terms[j][b]:
-                        diff.append(b)
-                if len(diff) == 1:
-                    t = terms[i].copy()
-                    t[diff[0]] = -1
-                    reduced.append(t)
-                    red = True
-                    # add reduced terms to pir
-                    # t[diff[0]] = 0
-                    if terms[i] not in pir:
-                        pir.append(terms[i])
-                    # t[diff[0]] = 1
-                    if terms[j] not in pir:
-                        pir.append(terms[j])
-        if not red and terms[i] not in pir:
-            pis.append(terms[i])
+    cubes = {}  # (value, mask) -> term, in first seen order
+    for t in terms:
+        cubes.setdefault(bits_to_cube(t), t)
+    merged = set()
+    reduced = {}
+    for value, mask in cubes:
+        for bit in range(blen):
+            b = 1 << bit
+            if (mask | value) & b or (value | b, mask) not in cubes:
+                continue
+            merged.add((value, mask))
+            merged.add((value | b, mask))
+            reduced.setdefault((value, mask | b), None)
     return {
-        "pis": pis,
-        "reduced": reduced
+        "pis": [cubes[c] for c in cubes if c not in merged],
+        "reduced": [cube_to_bits(c, blen) for c in reduced]
     }
 # end reduce
 
 """ getPIs()
 get all prime implicants
+terms and prime implicants are bit lists, -1 is a don't care
 """
 def getPIs(terms: list):
-    # determine how many bits are in each term
     if not terms:
         return []
     blen = len(terms[0])
-    # get all prime implicants using binary reduction
-    pis = []
-    if blen == 0:
-        pass
-    elif blen == 1:
-        pis = terms
-    elif blen == 2: # TODO: combine if necessary
-        pis = reduce(terms)['pis']
-        if not pis:
-            pis = terms[:-1]
-    else:
-        red = reduce(terms)
-        if red['pis']:
-            for pi in red['pis']:
-                pis.append(pi)
-        for i in range(2,blen):
-            if not red['reduced']:
-                break
-            red = reduce(red['reduced'])
-            if red['pis']:
-                for pi in red['pis']:
-                    # add pis to pis
-                    pis.append(pi)
-        if red['reduced']:
-            for pi in red['reduced']:
-                pis.append(pi)
-    return pis
+    primes = compute_primes(blen, terms_b2d(terms))
+    return [cube_to_bits(c, blen) for c in sorted(primes)]
 # end getPIs
 
 """ pi_b2d()
 convert binary prime implicants to decimal
+each prime implicant becomes the list of minterms it covers
 """
 def pi_b2d(pis: list):
-    # determine how many bits are in each term
-    if not pis:
-        return []
-    blen = len(pis[0])
-    pid = []
-    # convert binary to decimal based on bit length
-    if blen == 0:
-        pass
-    elif blen == 1:
-        if pis[0] == -1:
-            pid = [0,1]
-        else:
-            pid = pis[0]
-    else:
-        for pi in pis:
-            d = []
-            idx = [i for i, x in enumerate(pi) if x == -1]
-            for i in range(0, 1<<len(idx)):
-                comb = []
-                for j in range(len(pi)):
-                    if j in idx:
-                        comb.append((i >> idx.index(j)) & 1)
-                    else:
-                        comb.append(pi[j])
-                d.append(comb)
-            # convert binary to decimal
-            dn = []
-            for i in d:
-                n = b2d(i)
-                dn.append(n)
-            pid.append(dn)
-    return pid
+    return [cube_minterms(bits_to_cube(pi)) for pi in pis]
 # end getPIs_d
 
 """ b2d()
@@ -413,226 +597,100 @@ def b2d(b: list):
     return n
 # end b2d
 
+""" bits_to_cube()
+bit list with -1 for don't cares to a (value, mask) cube
+"""
+def bits_to_cube(b: list):
+    value = 0
+    mask = 0
+    for i in range(0, len(b)):
+        bit = 1 << (len(b)-i-1)
+        if b[i] == -1:
+            mask |= bit
+        elif b[i]:
+            value |= bit
+    return (value, mask)
+# end bits_to_cube
+
+""" cube_to_bits()
+(value, mask) cube to a bit list with -1 for don't cares
+"""
+def cube_to_bits(cube: tuple, blen: int):
+    b = []
+    for i in range(blen-1, -1, -1):
+        if cube[1] >> i & 1:
+            b.append(-1)
+        else:
+            b.append(cube[0] >> i & 1)
+    return b
+# end cube_to_bits
+
+""" cube_minterms()
+all minterms covered by a (value, mask) cube, ascending
+"""
+def cube_minterms(cube: tuple):
+    value, mask = cube
+    minterms = []
+    sub = mask
+    while True:
+        minterms.append(value | sub)
+        if sub == 0:
+            break
+        sub = (sub - 1) & mask
+    minterms.reverse()
+    return minterms
+# end cube_minterms
+
+""" table_primes
+prime implicants of a truth table as sorted (value, mask) cubes
+and the bitset of primes covering each minterm
+"""
+def table_primes(table):
+    md = onset_terms(table)
+    if isinstance(table, tt.truth_table):
+        nvars = table.nvars
+    else:
+        nvars = (len(table) - 1).bit_length()
+    primes = sorted(compute_primes(nvars, md))
+    cover = {}
+    for c in range(len(primes)):
+        for m in cube_minterms(primes[c]):
+            cover[m] = cover.get(m, 0) | 1 << c
+    return nvars, md, primes, cover
+# end table_primes
+
 """ getPILen
 get the number of prime implicants
 """
 def getPILen(data: adt):
-    mb = onset_minterms(data.table, True)
-    md = terms_b2d(mb)
-    # reduce minterms to prime implicants
-    pib = getPIs(mb)
-    pid = pi_b2d(pib)
-    # remove duplicates
-    if len(pid) > 1:
-        pid.reverse()
-        p = len(pid)-2
-        for i in range(0, p):
-            if pid[p-i] == pid[p-i+1]:
-                pid.pop(p-i)
-        pid.reverse()
-        # get last index
-        p = len(pid)-1
-        if pid[p] == pid[p-1]:
-            pid.pop(p)
-    # get number of prime implicants
-    l = 0
-    if len(pid) == 1:
-        if len(pid[0]) == 1:
-            l = 1
-        for j in range(0, len(pid)):
-            for k in range(j+1, len(pid)):
-                if pid[0][j] != pid[0][k]:
-                    l += 1
-    else:
-        for i in pid:
-            # get number of combinations for each prime implicant
-            for j in range(0, len(i)):
-                if len(i) == 1:
-                    l += 1
-                else:
-                    for k in range(j+1, len(i)):
-                        if i[j] != i[k]:
-                            l += 1
-    if l == 0:
-        pass
-    return l
+    return len(table_primes(data.table)[2])
 # end getPI
 
+""" genPIs
+get all prime implicants of the function as bit lists
+"""
 def genPIs(data: adt, literals: list):
-    mb = onset_minterms(data.table, True)
-    md = terms_b2d(mb)
-    vars = literals.copy()
-    vars.reverse()
-    soln = solve(len(vars), md)
-    return getPIs(vars, soln[1], md)
+    nvars, md, primes, cover = table_primes(data.table)
+    return [cube_to_bits(c, nvars) for c in primes]
 # end genPIs
 
 """ getEPIs
 get all essential prime implicants
-TODO: does not get all EPIs
+an EPI is the only prime covering one of the minterms, each EPI
+is returned as the list of minterms it covers
+if the function has no EPIs the primes of a minimum cover are returned
 """
 def getEPIs(data: adt, literals: list):
-    # get all minterms
-    mb = onset_minterms(data.table, True)
-    md = terms_b2d(mb)
-    # reduce minterms to prime implicants
-    pib = getPIs(mb)
-    pid = pi_b2d(pib)
-    # sort pid in ascending order
-    pid.sort()
-    # remove duplicates
-    if len(pid) > 1:
-        pid.reverse()
-        p = len(pid)-2
-        for i in range(0, p):
-            if pid[p-i] == pid[p-i+1]:
-                pid.pop(p-i)
-        pid.reverse()
-        # get last index
-        p = len(pid)-1
-        if pid[p] == pid[p-1]:
-            pid.pop(p)
-    # construct prime implicant table
-    empty_row = []
-    for i in range(0, len(pid)+1):
-        empty_row.append('-')
-    pis = []
-    pit = {
-        "minterms": md,
-        "pis": pis
-    }
-    for row in range(0, len(md)):
-        r = empty_row.copy()
-        r[0] = md[row]
-        # check if minterm is covered by a PI
-        for col in range(0, len(pid)):
-            if md[row] in pid[col]:
-                r[col+1] = 'x'
-        pis.append(r)
-
-    # Method
-    # get EPIs
-    epi = []
-    times = 0
-    while times < 2:
-        times += 1
-        nepi = []
-        for row in range(0, len(md)):
-            x = []
-            for col in range(1, len(pid)+1):
-                if pis[row][col] == 'x':
-                    x.append(pid[col-1])
-            if len(x) == 1:
-                if x[0] not in nepi:
-                    nepi.append(x[0])
-        # remove EPIs
-        rows = []
-        for pi in nepi:
-            # get index of pi in md
-            idx = pid.index(pi)
-            # remove pi from pis
-            rm = True
-            while rm:
-                rm = False
-                for row in range(0, len(pis)):
-                    if pis[row][idx+1] == 'x':
-                        # index of pi in md
-                        r = md.index(pis[row][0])
-                        rows.append(r)
-                        pis.pop(row)
-                        rm = True
-                        break
-        epi += nepi
-        # remove rows from pit
-        rows.sort()
-        rows.reverse()
-        for row in rows:
-            md.pop(row)
-        # get rid of empty columns
-        rows = []
-        for col in range(1, len(pid)+1):
-            x = 0
-            for row in range(0, len(pis)):
-                if pis[row][col] == 'x':    # TODO
-                    x += 1
-            if x == 0:
-                rows.append(col-1)
-        # remove rows from pit
-        rows.reverse()
-        for row in rows:
-            for r in range(0, len(pis)):
-                pis[r].pop(row+1)
-        for row in rows:
-            pid.pop(row)
-        # row dominance
-        if pis:
-            drows = find_dominated_rows(pis)
-            for row in drows:
-                # eliminate row
-                idx = pis.index(row)
-                pis.pop(idx)
-                md.pop(idx)
-            # column dominance
-            dcols = find_dominated_columns(pis)
-            dcols.reverse()
-            for col in dcols:
-                # eliminate column
-                for row in range(0, len(pis)):
-                    pis[row].pop(col)
-                pid.pop(col-1)
+    nvars, md, primes, cover = table_primes(data.table)
+    essential = 0
+    for m in md:
+        c = cover[m]
+        if c & (c - 1) == 0:
+            essential |= c
+    epi = [cube_minterms(primes[c]) for c in tt.iter_bits(essential)]
     if not epi:
-        mb = onset_minterms(data.table, True)
-        md = terms_b2d(mb)
-        vars = literals.copy()
-        vars.reverse()
-        soln = solve(len(vars), md)
-        epi = list(soln[1])
+        soln = solve(nvars, md)
+        if not isinstance(soln[1], str):
+            epi = [cube_minterms(c) for c in soln[1]]
     return epi
 # end getEPIs
-
-
-def is_dominated(row1, row2):
-    for i in range(1, len(row1)):
-        if row1[i] == 'x' and row2[i] == '-':
-            return False
-    return True
-
-def find_dominated_rows(table):
-    result = []
-    for i in range(len(table)):
-        dominated = False
-        for j in range(len(table)):
-            if i != j and is_dominated(table[i], table[j]):
-                dominated = True
-                break
-        if not dominated:
-            result.append(table[i])
-    return result
-
-def find_dominated_columns(pis):
-    if not pis:
-        return []
-    num_cols = len(pis[0])
-    dominated_columns = set()
-
-    # switch rows and columns
-    table = []
-    for i in range(len(pis[0])):
-        table.append([row[i] for row in pis])
-    1==1
-    for i in range(1, num_cols):
-        for j in range(i+1, num_cols):
-            # find columns with 1 in the same rows
-            if table[i] == table[j]:
-                dominated_columns.add((i, j))
-            else:
-                # if column has 1 in more than one row
-                if table[i].count('x') > 1 and table[j].count('x') == 1:
-                    dominated_columns.add((i, j))
-                elif table[i].count('x') == 1 and table[j].count('x') > 1:
-                    dominated_columns.add((j, i))
-
-    d = set()
-    for i, j in dominated_columns:
-        d.add(j)
-    return list(d)
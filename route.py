@@ -0,0 +1,281 @@
+################################################
+# route.py
+# agent
+# agent@local
+################################################
+# Contains the PathFinder router for the wire
+# cells ("+") of the LUT layer.
+################################################
+# Routing resource graph:
+# every wire cell is a node joined to the wire
+# cells above, below, left and right of it, and
+# carries up to lut_type nets (tracks). A LUT
+# drives the wire cell right of it and reads its
+# inputs from the wire cells left, above or below
+# it, an I/O pad enters at its own cell.
+################################################
+# PathFinder:
+# every net is routed by A* maze expansion from
+# its routed tree to each sink in turn. Entering a
+# node costs (1 + history) * (1 + present * over),
+# where over is how far past its tracks the node
+# would be. Nets are ripped up and rerouted while
+# any node is overused, present grows each pass
+# and history keeps the overuse of past passes.
+# A net with timing criticality c pays
+# c + (1 - c) * congestion per node (c is
+# sharpened to c^8), so critical nets take short
+# paths, and goes first. The criticalities are
+# updated from the routed delays after each pass.
+# A fabric still overused after the last pass
+# raises UnroutableError, the routing it got to
+# is not legal.
+################################################
+# methods:
+# build_graph(fpga_adt: fpga_adt) -> dict
+# route_nets(fpga_adt: fpga_adt, graph: dict) -> dict
+# route(fpga_adt: fpga_adt, max_iterations: int, crit: dict) -> dict
+################################################
+
+import heapq
+import numpy as np
+import fpga_adt as fpga
+import place
+import timing
+
+# passes before giving up on a legal routing
+MAX_ITERATIONS = 30
+# present congestion factor of the first pass and its growth per pass
+PRES_FAC = 0.5
+PRES_GROWTH = 1.5
+# history added per overused track per pass
+HIST_FAC = 1.0
+# nets this critical are rerouted with the overused ones
+CRIT_REROUTE = 0.5
+
+
+# wire cells are still overused when PathFinder runs out of passes,
+# the nets of the placement need more tracks than the fabric has
+class UnroutableError(Exception):
+    pass
+
+
+""" build_graph
+routing resource graph of the wire cells of the LUT layer
+returns {"rows", "cols", "adj": {node: [nodes]}, "cap", "entries"},
+the node of cell (i, j) is i * cols + j, entries maps the cell of a
+LUT to the wire nodes its inputs can come in on
+"""
+def build_graph(fpga_adt: fpga.fpga_adt):
+    layer = fpga_adt.layout[0][0]
+    wire = layer.cells == layer.ids.get("+", -1)
+    rows, cols = wire.shape
+    adj = {}
+    for i, j in zip(*np.nonzero(wire)):
+        i = int(i)
+        j = int(j)
+        out = []
+        for di, dj in ((0, 1), (1, 0), (0, -1), (-1, 0)):
+            a = i + di
+            b = j + dj
+            if 0 <= a < rows and 0 <= b < cols and wire[a, b]:
+                out.append(a * cols + b)
+        adj[i * cols + j] = out
+    entries = {}
+    for name, (i, j) in fpga_adt.lut_locations.items():
+        entries[i * cols + j] = [
+            a * cols + b
+            for a, b in ((i, j - 1), (i - 1, j), (i + 1, j))
+            if 0 <= a < rows and 0 <= b < cols and wire[a, b]
+        ]
+    return {"rows": rows, "cols": cols, "adj": adj, "entries": entries,
+            "cap": max(1, fpga_adt.get_lut_type())}
+# end build_graph
+
+""" route_nets
+the nets to route as {key: (signals, sources, sinks)}, sources and
+sinks are graph nodes, key is the driving LUT (or the input name)
+"""
+def route_nets(fpga_adt: fpga.fpga_adt, graph: dict):
+    locs = fpga_adt.lut_locations
+    nets = {}
+    for key, (src, signals, sinks) in place.lut_nets(fpga_adt).items():
+        if src is not None:
+            sources = _pin(graph, locs[src], 1)
+        else:
+            sources = []
+            for loc in fpga_adt.io_locations.get(key, []):
+                sources += _pin(graph, loc, 0)
+        ends = []
+        for name in sinks:
+            cell = locs[name][0] * graph["cols"] + locs[name][1]
+            if graph["entries"].get(cell):
+                ends.append(cell)
+        nets[key] = (list(signals), sources, ends)
+    # equation outputs go from their LUT to their pads
+    for output in fpga_adt.get_outputs():
+        src = fpga_adt.output_lut_name.get(output)
+        if src not in locs:
+            continue
+        if src not in nets:
+            nets[src] = ([], _pin(graph, locs[src], 1), [])
+        if output not in nets[src][0]:
+            nets[src][0].append(output)
+        for loc in fpga_adt.io_locations.get(output, []):
+            nets[src][2].extend(_pin(graph, loc, 0))
+    for key in nets:
+        signals, sources, sinks = nets[key]
+        sinks = [n for n in dict.fromkeys(sinks) if n not in sources]
+        nets[key] = (signals, list(dict.fromkeys(sources)), sinks)
+    return nets
+# end route_nets
+
+""" route
+route every net of the placed fabric with PathFinder
+fpga_adt.wire gets one entry per net:
+{"net", "signals", "paths"} with the cells of each path to a sink
+crit maps a net key to its timing criticality (see timing.py)
+returns {"nets", "iterations", "wirelength", "overused", "unrouted"}
+raises UnroutableError when wire cells are overused after
+max_iterations passes
+"""
+def route(fpga_adt: fpga.fpga_adt, max_iterations: int = MAX_ITERATIONS,
+          crit: dict = None):
+    graph = build_graph(fpga_adt)
+    nets = route_nets(fpga_adt, graph)
+    cap = graph["cap"]
+    occ = {}
+    hist = {}
+    pres = PRES_FAC
+    paths = {}
+    timed = crit is not None
+    crit = _sharpen(crit or {})
+    order = [k for k in nets if nets[k][1] and nets[k][2]]
+    report = {"nets": len(order), "iterations": 0, "wirelength": 0,
+              "overused": 0, "unrouted": len(nets) - len(order)}
+    reroute = order
+    for it in range(1, max_iterations + 1):
+        report["iterations"] = it
+        for key in sorted(reroute, key=lambda k: -crit.get(k, 0.0)):
+            for node in _cells(paths.get(key, [])):
+                occ[node] -= 1
+            paths[key] = _route_net(graph, nets[key][1], nets[key][2], occ, hist,
+                                    pres, crit.get(key, 0.0))
+            for node in _cells(paths[key]):
+                occ[node] = occ.get(node, 0) + 1
+        over = [n for n in occ if occ[n] > cap]
+        report["overused"] = len(over)
+        if not over:
+            break
+        for n in over:
+            hist[n] = hist.get(n, 0.0) + HIST_FAC * (occ[n] - cap)
+        pres *= PRES_GROWTH
+        # only the nets through an overused node are ripped up, and
+        # the critical nets when the routed delays changed them
+        over = set(over)
+        reroute = [k for k in order if not over.isdisjoint(_cells(paths[k]))]
+        if timed:
+            _write(fpga_adt, graph, nets, order, paths)
+            crit = _sharpen(timing.criticality(timing.analyze(fpga_adt)))
+            reroute += [k for k in order
+                        if k not in reroute and crit.get(k, 0.0) >= CRIT_REROUTE]
+
+    for key in order:
+        report["wirelength"] += len(_cells(paths[key]))
+    _write(fpga_adt, graph, nets, order, paths)
+    if report["overused"]:
+        raise UnroutableError(
+            "unroutable after " + str(report["iterations"]) + " passes, wire cells "
+            + "over their " + str(cap) + " nets: " + str(report["overused"]))
+    return report
+# end route
+
+# criticality as the router uses it
+def _sharpen(crit):
+    return {k: min(timing.MAX_CRIT, c ** timing.CRIT_EXP) for k, c in crit.items()}
+
+# store the routed paths in fpga_adt.wire
+def _write(fpga_adt, graph, nets, order, paths):
+    cols = graph["cols"]
+    wire = []
+    for key in order:
+        wire.append({
+            "net": key,
+            "signals": nets[key][0],
+            "paths": [[[n // cols, n % cols] for n in p] for p in paths[key]],
+        })
+    fpga_adt.update_wire(wire)
+
+# graph node a driver or pad at loc connects to: side 1 is the wire
+# cell right of a LUT and 0 the cell itself (I/O pads), the nearest
+# wire cell next to it is used when that one is not a wire
+def _pin(graph, loc, side):
+    cols = graph["cols"]
+    i, j = loc[0], loc[1]
+    first = [(i, j + side)] if side != 0 else [(i, j)]
+    for a, b in first + [(i, j + 1), (i, j - 1), (i + 1, j), (i - 1, j)]:
+        if 0 <= b < cols and a * cols + b in graph["adj"]:
+            return [a * cols + b]
+    return []
+
+# every node of a net's paths, each once
+def _cells(paths):
+    return list(dict.fromkeys(n for p in paths for n in p))
+
+# route one net, sinks closest to the sources first, each sink is
+# reached by A* from the tree routed so far, a LUT sink is reached on
+# any of its entry nodes, crit trades congestion for path length,
+# a critical net also pays for how far into its tree a branch starts
+def _route_net(graph, sources, sinks, occ, hist, pres, crit=0.0):
+    adj = graph["adj"]
+    cols = graph["cols"]
+    cap = graph["cap"]
+    entries = graph["entries"]
+    tree = set(sources)
+    depth = {n: 0 for n in sources}
+    paths = []
+
+    def dist(a, b):
+        return abs(a // cols - b // cols) + abs(a % cols - b % cols)
+
+    for sink in sorted(sinks, key=lambda s: min(dist(s, t) for t in sources)):
+        goal = set(entries[sink]) if sink in entries else {sink}
+        if not goal.isdisjoint(tree):
+            continue
+        # entry nodes are next to a LUT sink
+        near = 1 if sink in entries else 0
+        # A*: g is the path cost, h the distance left (every step costs >= 1)
+        best = {}
+        prev = {}
+        heap = []
+        for t in tree:
+            best[t] = crit * depth[t]
+            heapq.heappush(heap, (best[t] + max(0, dist(t, sink) - near), best[t], t))
+        end = None
+        while heap:
+            f, g, node = heapq.heappop(heap)
+            if node in goal:
+                end = node
+                break
+            if g > best[node]:
+                continue
+            for nxt in adj[node]:
+                over = max(0, occ.get(nxt, 0) + 1 - cap)
+                congestion = (1.0 + hist.get(nxt, 0.0)) * (1.0 + pres * over)
+                cost = g + crit + (1.0 - crit) * congestion
+                if nxt not in best or cost < best[nxt]:
+                    best[nxt] = cost
+                    prev[nxt] = node
+                    h = max(0, dist(nxt, sink) - near)
+                    heapq.heappush(heap, (cost + h, cost, nxt))
+        if end is None:
+            continue
+        path = [end]
+        while path[-1] not in tree:
+            path.append(prev[path[-1]])
+        path.reverse()
+        for k, n in enumerate(path[1:], 1):
+            depth[n] = depth[path[0]] + k
+        tree.update(path)
+        paths.append(path)
+    return paths
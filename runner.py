@@ -8,6 +8,7 @@
 # commands:
 # -t: test mode
 # -b: bitstream mode
+# -c: convert a bitstream between JSON and binary
 # -f: file mode
 # -h: help
 ################################################
@@ -15,6 +16,12 @@
 # -nLut: number of LUTs
 # -tLut: number of inputs per LUT
 # -cLut: connectivity of LUTs (optional)
+# --cache <file>: keep minimized functions in file (optional)
+# --workers <n>: minimize equations in n processes (optional)
+# --mapper <decompose|aig>: how equations are mapped onto LUTs (optional)
+# --effort <x>, --seed <n>: constrained placer settings (optional)
+# --lut-delay <x>, --wire-delay <x>, --budget <x>: delay model (optional)
+# --incremental <file>: reuse unchanged equations of the last run (optional)
 ################################################
 # methods:
 # main()
@@ -22,9 +29,12 @@
 
 import os
 import sys
+import bitstream as bs
 import configurator as config
 import logic_synthesis_engine as lse
 import fse
+import incremental as inc
+import route
 import eq_adt as logic
 import fpga_adt as fpga
 import tester
@@ -35,13 +45,29 @@ def print_help():
     print("Usage: python3 runner.py <mode> <input>")
     print("Modes:")
     print("\t-t: test mode")
-    print("\t-b: bitstream mode")
+    print("\t-b: bitstream mode, JSON or binary")
+    print("\t-c <in> <out>: convert a bitstream, out is written as JSON")
+    print("\t\twhen it ends in .json and binary otherwise")
     print("\t-f: file mode")
     print("Inputs for -f:")
     print("\tfile: input equations file")
     print("\tnLut: int > 0")
     print("\ttLut: int 4 or 6")
     print("\tcLut: input file (optional)")
+    print("Options:")
+    print("\t--cache <file>: reuse minimized functions across runs")
+    print("\t--workers <n>: minimize equations in n processes")
+    print("\t--mapper <decompose|aig>: map equations one at a time or")
+    print("\t\tall together through a shared AND-inverter graph")
+    print("\t--effort <x>: annealing effort of the constrained placer,")
+    print("\t\t0 keeps the greedy placement (default 1)")
+    print("\t--seed <n>: seed of the constrained placer (default 551)")
+    print("\t--lut-delay <x>: delay of one LUT (default 1)")
+    print("\t--wire-delay <x>: delay of one wire cell (default 0.1)")
+    print("\t--budget <x>: latency budget of the outputs,")
+    print("\t\t0 uses the critical path delay (default 0)")
+    print("\t--incremental <file>: keep the synthesized design in file and")
+    print("\t\tonly redo the equations that changed since the last run")
 
 
 # end print_help
@@ -54,6 +80,20 @@ def tests(test):
         tester.config_tester()
     elif test == "fse":
         tester.fse_tester()
+    elif test == "qm":
+        tester.qm_bench()
+    elif test == "cache":
+        tester.cache_tester()
+    elif test == "decompose":
+        tester.decompose_tester()
+    elif test == "aig":
+        tester.aig_tester()
+    elif test == "timing":
+        tester.timing_tester()
+    elif test == "incremental":
+        tester.incremental_tester()
+    elif test == "bitstream":
+        tester.bitstream_tester()
     else:
         print("Error: invalid test")
         exit(7)
@@ -62,11 +102,13 @@ def tests(test):
 # end tests
 
 
-def bitstream(bs_file):
+def bitstream(bs_file, delay={}):
     # check if bs_file exists
     if not os.path.isfile(bs_file):
         return 2
-    config = fpga.fpga_adt.load_bitstream(bs_file)
+    # binary bitstreams are told apart by their header
+    config = bs.load(bs_file)
+    config.delay_model.update(delay)
     runner(config)
     return 0
 
@@ -74,7 +116,19 @@ def bitstream(bs_file):
 # end bitstream
 
 
-def get_fpga(eq_file, conn_file, nLut, tLut):
+def get_fpga(
+    eq_file,
+    conn_file,
+    nLut,
+    tLut,
+    cache="",
+    workers=1,
+    mapper="decompose",
+    effort=1.0,
+    seed=551,
+    delay={},
+    state="",
+):
     # check if eq_file exists
     if not os.path.isfile(eq_file):
         return 2
@@ -87,17 +141,19 @@ def get_fpga(eq_file, conn_file, nLut, tLut):
     # check if nLut is valid
     if nLut < 1:
         return 6
-    # open eq_file
-    with open(eq_file) as f:
-        eqs = f.readlines()
-    f.close()
-    # remove whitespace
-    eqs = [x.strip() for x in eqs]
+    # equations are read one line at a time while config synthesizes them
+    eqs = config.read_equations(eq_file)
 
-    # TODO: check if eq_file is valid (assuming it is for now)
+    # the last run of an incremental design
+    reuse = None
+    if state != "":
+        last = inc.load(state)
+        reuse = inc.reuse_eqs(last)
 
     # create data
-    ret, data = config.config(eqs, nLut, tLut, conn_file)
+    ret, data = config.config(
+        eqs, nLut, tLut, conn_file, cache=cache, workers=workers, reuse=reuse
+    )
 
     # TODO: all detection and generation caused by config
 
@@ -108,23 +164,36 @@ def get_fpga(eq_file, conn_file, nLut, tLut):
         return 9
 
     eqts = data.eqs
+    data.delay_model.update(delay)
+
+    # equations that read each other in a loop can't be ordered and
+    # a congested fabric can't be routed
+    try:
+        # unchanged equations keep their partitions and placements
+        parts = None
+        keep = None
+        if state != "":
+            parts, keep = inc.plan(last, data, mapper)
+
+        # routing partitions the equations once with the chosen mapper,
+        # an incremental run hands over the partitions it kept
+        if data.constrained:
+            routed = fse.routing_constrained(
+                eqts, data, mapper, effort, seed, parts, keep
+            )
+        elif not data.constrained:
+            routed = fse.routing_free(eqts, data, mapper, parts, keep)
+        else:
+            return 9
+    except fse.CombinationalLoopError as err:
+        print("error: " + str(err))
+        return 7
+    except route.UnroutableError as err:
+        print("error: " + str(err))
+        return 8
 
-    for each in eqts:
-        (
-            lut_inputs,
-            lut_outputs,
-            lut_data,
-            num_luts,
-            output_lut_name,
-            output_var_name,
-        ) = fse.partition_to_lut(each, data.get_lut_type(), data)
-
-    if data.constrained:
-        routed = fse.routing_constrained(eqts, data)
-    elif not data.constrained:
-        routed = fse.routing_free(eqts, data)
-    else:
-        return 9
+    if state != "":
+        inc.save(state, data, parts, mapper)
 
     runner(data)
     return 0
@@ -162,11 +231,16 @@ def runner(data: fpga.fpga_adt):
         elif input == "o":
             fse.show_o_extern(data)
         elif input == "b":
-            out = fse.write_bitstream(data)
-            with open("bitstream.json", "w") as f:
-                f.write(out)
+            bs.save(data, "bitstream.json")
+        elif input[0] == "b" and input[1] == " ":
+            # binary unless the file is .json
+            bs.save(data, input[2:].strip())
         elif input == "r":
             fse.show_utilization(data)
+        elif input == "p":
+            fse.show_critical_paths(data)
+        elif input[0] == "p" and input[1] == " " and input[2:].isdigit():
+            fse.show_critical_paths(data, int(input[2:]))
         else:
             print("Error: invalid input")
 
@@ -174,7 +248,64 @@ def runner(data: fpga.fpga_adt):
 # end get_outs
 
 
+def pop_option(name, default):
+    # remove "name value" from the arguments and return value
+    if name not in sys.argv:
+        return default
+    i = sys.argv.index(name)
+    if i + 1 >= len(sys.argv):
+        print_help()
+        exit(1)
+    value = sys.argv[i + 1]
+    del sys.argv[i : i + 2]
+    return value
+
+
+# end pop_option
+
+
 def main():
+    # pull out the options before reading positional inputs
+    cache = pop_option("--cache", "")
+    workers = pop_option("--workers", "1")
+    if not workers.isdigit() or int(workers) < 1:
+        print_help()
+        exit(1)
+    workers = int(workers)
+    mapper = pop_option("--mapper", "decompose")
+    if mapper != "decompose" and mapper != "aig":
+        print_help()
+        exit(1)
+    state = pop_option("--incremental", "")
+    effort = pop_option("--effort", "1")
+    seed = pop_option("--seed", "551")
+    try:
+        effort = float(effort)
+        seed = int(seed)
+    except ValueError:
+        print_help()
+        exit(1)
+    if effort < 0:
+        print_help()
+        exit(1)
+    # delay model, only the values given replace the defaults
+    delay = {}
+    for name, key in (
+        ("--lut-delay", "lut"),
+        ("--wire-delay", "wire"),
+        ("--budget", "budget"),
+    ):
+        value = pop_option(name, "")
+        if value == "":
+            continue
+        try:
+            delay[key] = float(value)
+        except ValueError:
+            print_help()
+            exit(1)
+        if delay[key] < 0:
+            print_help()
+            exit(1)
     if len(sys.argv) < 2 or len(sys.argv) > 8:
         print_help()
         exit(1)
@@ -188,7 +319,16 @@ def main():
         if len(sys.argv) != 3:
             print_help()
             exit(5)
-        bitstream(sys.argv[2])
+        bitstream(sys.argv[2], delay)
+        exit(0)
+    if sys.argv[1] == "-c":
+        if len(sys.argv) != 4:
+            print_help()
+            exit(5)
+        if not os.path.isfile(sys.argv[2]):
+            print("error: " + sys.argv[2] + ": no such bitstream")
+            exit(2)
+        bs.convert(sys.argv[2], sys.argv[3])
         exit(0)
     if sys.argv[1] == "-h":
         print_help()
@@ -209,7 +349,19 @@ def main():
         tLut = int(sys.argv[4])
         # get file
         # run fpga synthesis engine
-        foo = get_fpga(eq_file, conn_file, nLut, tLut)
+        foo = get_fpga(
+            eq_file,
+            conn_file,
+            nLut,
+            tLut,
+            cache,
+            workers,
+            mapper,
+            effort,
+            seed,
+            delay,
+            state,
+        )
         # check return code
         match foo:
             case 0:  # success
@@ -228,6 +380,8 @@ def main():
                 print("Error:", foo)
             case 7:  # invalid eq file
                 print("Error:", foo)
+            case 8:  # fabric too congested to route
+                print("Error:", foo)
             case 9:  # undefined error
                 print("Error:", foo)
         exit(10 + foo)
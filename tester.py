@@ -2,6 +2,20 @@
 import configurator as config
 import logic_synthesis_engine as lse
 import eq_adt as adt
+import quine_mccluskey as qm
+import min_cache as mc
+import decompose as dc
+import aig
+import bitstream as bs
+import fse
+import json
+import timing
+import incremental as inc
+import os
+import tempfile
+import truth_table as tt
+import random
+import time
 
 def lse_tester():
     input2 = "A*B'+C'"
@@ -72,4 +86,182 @@ def config_tester():
 
 def fse_tester():
     print("tests being made")
-# end fse_tester
\ No newline at end of file
+# end fse_tester
+
+
+''' qm_bench
+compares the hashed prime generator with the pairwise one
+on random 12-16 variable functions
+'''
+def qm_bench(seed=551):
+    rng = random.Random(seed)
+    print("vars | minterms | primes | pairwise (s) | hashed (s)")
+    for nvars in (12, 14, 16):
+        # random function built from a sum of random cubes
+        bits = 0
+        for i in range(2 * nvars):
+            width = rng.randint(nvars // 2, nvars - 2)
+            lits = [(p, rng.random() < 0.5) for p in rng.sample(range(nvars), width)]
+            bits |= tt.cube_mask(nvars, lits)
+        minterms = tt.truth_table(nvars, bits).minterms()
+
+        start = time.perf_counter()
+        old = qm.compute_primes_pairwise(nvars, minterms)
+        t_old = time.perf_counter() - start
+        start = time.perf_counter()
+        new = qm.compute_primes(nvars, minterms)
+        t_new = time.perf_counter() - start
+
+        if old != new:
+            print("error: prime generators disagree on", nvars, "vars")
+        print(f"{nvars} | {len(minterms)} | {len(new)} | {t_old:.3f} | {t_new:.3f}")
+# end qm_bench
+
+''' cache_tester
+runs the same equations twice, the second run should be
+answered from the minimization cache
+'''
+def cache_tester():
+    eqs = ["F = a*b + a*b'*c", "G = x*y + x*y'*z", "H = (a+b)*(a+c)"]
+    mc.clear()
+    first = config.config(eqs, 8, 4)[1].get_reqs()
+    print("first run:", mc.stats())
+    second = config.config(eqs, 8, 4)[1].get_reqs()
+    print("second run:", mc.stats())
+    if first != second:
+        print("error: cached results differ", first, second)
+# end cache_tester
+
+''' decompose_tester
+decomposes every equation in a file onto LUTs and checks the
+LUT network against the truth table on every input
+'''
+def decompose_tester(eq_file="examples/example_8var.dat", tLut=4):
+    data = config.config(config.read_equations(eq_file), 64, tLut)[1]
+    for e in data.eqs:
+        lut_inputs, lut_outputs, lut_data = fse.partition_to_lut(e, tLut, data)[:3]
+        lits = list(dict.fromkeys(e.literals))
+        n = len(lits)
+        ok = True
+        for m in range(1 << n):
+            values = {lits[i]: m >> (n - 1 - i) & 1 for i in range(n)}
+            out = dc.evaluate_luts(lut_inputs, lut_outputs, lut_data, values)
+            if out[lut_outputs[-1]] != e.table[m]:
+                ok = False
+                break
+        print(e.name, "inputs:", n, "LUTs:", len(lut_outputs), "ok" if ok else "error: wrong output")
+# end decompose_tester
+
+''' aig_tester
+maps equations that read each other through the shared AIG and
+checks every output against its truth table on every input
+'''
+def aig_tester(eq_file="examples/example_4vari.dat", tLut=4):
+    data = config.config(config.read_equations(eq_file), 64, tLut)[1]
+    parts = aig.map_luts(data.eqs, tLut)
+    lut_inputs = []
+    lut_outputs = []
+    lut_data = []
+    for e in data.eqs:
+        lut_inputs += parts[e.name][0]
+        lut_outputs += parts[e.name][1]
+        lut_data += parts[e.name][2]
+        print(e.name, "LUTs:", parts[e.name][3], "output:", parts[e.name][4])
+    g = aig.build_aig(data.eqs)
+    print("AIG nodes:", g.size(), "strash hits:", g.hits,
+          "shared by outputs:", len(aig.shared_nodes(g)))
+    inputs = sorted(g.inputs)
+    rng = random.Random(551)
+    for trial in range(256):
+        values = {i: rng.randint(0, 1) for i in inputs}
+        out = dc.evaluate_luts(lut_inputs, lut_outputs, lut_data, values)
+        for e in data.eqs:
+            values[e.name] = out[parts[e.name][4] + "_Output"]
+        for e in data.eqs:
+            m = 0
+            for l in dict.fromkeys(e.literals):
+                m = m << 1 | values[l]
+            if e.table[m] != values[e.name]:
+                print("error: wrong output for", e.name, values)
+                return
+    print("total LUTs:", len(lut_outputs), "ok")
+# end aig_tester
+
+''' timing_tester
+places and routes a constrained design and checks that no LUT
+has negative slack without a budget and that every reported
+path ends on its output's delay
+'''
+def timing_tester(eq_file="examples/example_lot.dat", tLut=4):
+    data = config.config(config.read_equations(eq_file), 64, tLut, "c")[1]
+    fse.routing_constrained(data.eqs, data)
+    report = timing.analyze(data)
+    print("critical delay:", round(report["delay"], 2), "worst slack:",
+          round(report["worst_slack"], 2))
+    if min(report["slack"].values()) < -1e-9:
+        print("error: negative slack without a budget")
+    for path in timing.critical_paths(report, 3):
+        name, t = path["path"][-1]
+        print(path["output"], "->", " -> ".join(n for n, t in path["path"]))
+        if t > path["delay"] + 1e-9:
+            print("error: path arrives after its output")
+    tight = timing.analyze(data, {"budget": report["delay"] / 2})
+    print("half budget worst slack:", round(tight["worst_slack"], 2))
+# end timing_tester
+
+''' incremental_tester
+synthesizes the same equations twice and then with one changed,
+the second run should reuse everything and the third all but the
+changed equation and the ones that read it
+'''
+def incremental_tester():
+    eqs = ["F = a*b + c", "G = F*d + e", "H = x*y + z'"]
+    with tempfile.TemporaryDirectory() as folder:
+        state = os.path.join(folder, "state.pkl")
+        for run in (eqs, eqs, ["F = a*b' + c"] + eqs[1:]):
+            last = inc.load(state)
+            data = config.config(run, 16, 4, reuse=inc.reuse_eqs(last))[1]
+            parts, keep = inc.plan(last, data)
+            fse.routing_free(data.eqs, data, "decompose", parts, keep)
+            inc.save(state, data, parts)
+            print(data.reuse_report)
+    if data.reuse_report["reused"] != 2:
+        print("error: only F should be minimized again")
+    if data.reuse_report["kept"] != 1:
+        print("error: only H should keep its placement")
+# end incremental_tester
+
+''' bitstream_tester
+writes a routed design as a binary bitstream, loads it back through
+mmap and checks it against the JSON bitstream of the design
+'''
+def bitstream_tester(eq_file="examples/example_lot.dat", tLut=4):
+    data = config.config(config.read_equations(eq_file), 64, tLut, "c")[1]
+    fse.routing_constrained(data.eqs, data)
+    with tempfile.TemporaryDirectory() as folder:
+        bin_file = os.path.join(folder, "bitstream.bin")
+        json_file = os.path.join(folder, "bitstream.json")
+        start = time.perf_counter()
+        size = bs.write(data, bin_file)
+        t_write = time.perf_counter() - start
+        start = time.perf_counter()
+        back = bs.load(bin_file)
+        t_load = time.perf_counter() - start
+        bs.save(data, json_file)
+        print("binary:", size, "bytes, JSON:", os.path.getsize(json_file), "bytes")
+        print(f"write {t_write:.4f} s, load {t_load:.4f} s")
+        # a JSON bitstream made from the binary one matches the original,
+        # the layouts are compared cell by cell
+        copy_file = os.path.join(folder, "copy.json")
+        bs.convert(bin_file, copy_file)
+        with open(json_file) as f, open(copy_file) as g:
+            first = json.load(f)
+            second = json.load(g)
+        for each in (first, second):
+            del each["layout"], each["fromBitstream"]
+        if first != second:
+            print("error: binary bitstream does not round trip")
+        for layer, other in zip(data.layout[0], back.layout[0]):
+            if repr(layer) != repr(other):
+                print("error: layout differs after loading")
+# end bitstream_tester
@@ -0,0 +1,266 @@
+################################################
+# timing.py
+# agent
+# agent@local
+################################################
+# Contains the static timing analysis of the
+# placed LUT netlist.
+################################################
+# Delay model:
+# every LUT adds delay_model["lut"] and every
+# wire cell a signal crosses adds
+# delay_model["wire"]. Routed nets count the
+# cells of their routed tree, nets not routed yet
+# count the Manhattan distance between the cells
+# (to row 0 for pads not placed yet, where the
+# constrained placement puts them).
+################################################
+# Analysis:
+# arrival times go forward from the inputs (0)
+# through the LUTs in topological order, required
+# times go back from the outputs, which must
+# arrive by delay_model["budget"] (the critical
+# delay when it is 0). slack = required - arrival
+# and the criticality of a net is
+# 1 - slack / critical delay on its worst sink.
+################################################
+# methods:
+# analyze(fpga_adt: fpga_adt, model: dict) -> dict
+# criticality(report: dict) -> dict
+# net_weights(report: dict) -> dict
+# critical_paths(report: dict, n: int) -> list
+################################################
+
+import fpga_adt as fpga
+import fse
+import place
+
+# default delay of one LUT and one wire cell
+LUT_DELAY = 1.0
+WIRE_DELAY = 0.1
+# net weight for the placer is 1 + CRIT_WEIGHT * criticality^CRIT_EXP
+CRIT_WEIGHT = 1.0
+CRIT_EXP = 8
+# the router uses criticality^CRIT_EXP and keeps some congestion
+# cost on the most critical nets
+MAX_CRIT = 0.99
+
+
+""" analyze
+static timing analysis of the placed (and routed) LUTs
+model overrides fpga_adt.delay_model ("lut", "wire", "budget")
+returns {"delay", "budget", "worst_slack", "arrival", "required",
+"slack", "fanin", "endpoints", "nets"}, arrival, required and slack
+are at the LUT outputs, fanin maps a LUT to its
+(signal, driver LUT or None, wire delay, net key) inputs and
+endpoints an output to (LUT, arrival at its pad, slack)
+"""
+def analyze(fpga_adt: fpga.fpga_adt, model: dict = None):
+    delays = dict(fpga_adt.delay_model)
+    delays.update(model or {})
+    lut_delay = delays.get("lut", LUT_DELAY)
+    wire_delay = delays.get("wire", WIRE_DELAY)
+    locs = fpga_adt.lut_locations
+    hops = _routed_hops(fpga_adt)
+
+    nets = place.lut_nets(fpga_adt)
+    fanin = {name: [] for name in locs}
+    fanout = {name: [] for name in locs}
+    for key, (src, signals, sinks) in nets.items():
+        for sink in sinks:
+            d = wire_delay * _hops(fpga_adt, hops, key, src, locs[sink], True)
+            fanin[sink].append((signals[0], src, d, key))
+            if src is not None:
+                fanout[src].append(sink)
+
+    order = _topological(fanin, fanout)
+    arrival = {}
+    for name in order:
+        t = 0.0
+        for signal, src, d, key in fanin[name]:
+            t = max(t, (arrival[src] if src is not None else 0.0) + d)
+        arrival[name] = t + lut_delay
+
+    # outputs leave their LUT for their pads
+    ends = {}
+    for output in fpga_adt.get_outputs():
+        name = fpga_adt.output_lut_name.get(output)
+        if name in arrival:
+            d = wire_delay * _hops(fpga_adt, hops, name, name, output, False)
+            ends[output] = (name, arrival[name] + d, d)
+    delay = max([t for n, t, d in ends.values()] + list(arrival.values()) + [0.0])
+    budget = delays.get("budget", 0) or delay
+
+    required = {name: float("inf") for name in order}
+    for name, t, d in ends.values():
+        required[name] = min(required[name], budget - d)
+    for name in reversed(order):
+        if required[name] == float("inf"):
+            # drives no output, only its sinks bound it
+            required[name] = budget
+        for signal, src, d, key in fanin[name]:
+            if src is not None:
+                required[src] = min(required[src], required[name] - lut_delay - d)
+    slack = {name: required[name] - arrival[name] for name in order}
+
+    endpoints = {
+        output: (name, t, budget - t) for output, (name, t, d) in ends.items()
+    }
+    worst = min([s for n, t, s in endpoints.values()] + list(slack.values()) + [budget])
+    return {
+        "delay": delay,
+        "budget": budget,
+        "worst_slack": worst,
+        "lut_delay": lut_delay,
+        "arrival": arrival,
+        "required": required,
+        "slack": slack,
+        "fanin": fanin,
+        "endpoints": endpoints,
+        "nets": list(nets),
+    }
+# end analyze
+
+""" criticality
+criticality of every net (keyed like place.lut_nets) in [0, 1],
+1 on the critical path, from the slack of its worst sink, slack is
+taken against the critical delay so a tight budget does not make
+every net critical
+"""
+def criticality(report: dict):
+    delay = report["delay"]
+    shift = delay - report["budget"]
+    crit = {key: 0.0 for key in report["nets"]}
+    if delay <= 0:
+        return crit
+
+    def note(key, s):
+        s += shift
+        crit[key] = max(crit.get(key, 0.0), min(1.0, max(0.0, 1.0 - s / delay)))
+
+    arrival = report["arrival"]
+    required = report["required"]
+    for sink, edges in report["fanin"].items():
+        for signal, src, d, key in edges:
+            start = arrival[src] if src is not None else 0.0
+            note(key, required[sink] - report["lut_delay"] - d - start)
+    # the net of an output LUT also runs to its pads
+    for output, (name, t, s) in report["endpoints"].items():
+        note(name, s)
+    return crit
+# end criticality
+
+""" net_weights
+placement weights of the nets, critical nets weigh more
+"""
+def net_weights(report: dict):
+    return {
+        key: 1.0 + CRIT_WEIGHT * c ** CRIT_EXP
+        for key, c in criticality(report).items()
+    }
+# end net_weights
+
+""" critical_paths
+the n outputs with the least slack and the path to each
+returns [{"output", "delay", "slack", "path": [(signal, arrival)]}],
+path runs from the input to the output LUT
+"""
+def critical_paths(report: dict, n: int = 5):
+    arrival = report["arrival"]
+    paths = []
+    ends = sorted(report["endpoints"].items(), key=lambda e: (e[1][2], e[0]))
+    for output, (name, t, s) in ends[:n]:
+        path = []
+        while name is not None:
+            path.append((name, arrival[name]))
+            # the latest input sets the arrival of the LUT
+            latest = None
+            worst = -1.0
+            for signal, src, d, key in report["fanin"][name]:
+                at = (arrival[src] if src is not None else 0.0) + d
+                if at > worst:
+                    worst = at
+                    latest = (signal, src)
+            if latest is None:
+                break
+            if latest[1] is None:
+                path.append((latest[0], 0.0))
+            name = latest[1]
+        path.reverse()
+        paths.append({"output": output, "delay": t, "slack": s, "path": path})
+    return paths
+# end critical_paths
+
+# LUTs in topological order, raises fse.CombinationalLoopError on a
+# loop between LUTs
+def _topological(fanin, fanout):
+    count = {name: sum(1 for e in edges if e[1] is not None)
+             for name, edges in fanin.items()}
+    order = [name for name in fanin if count[name] == 0]
+    for name in order:
+        for sink in fanout[name]:
+            count[sink] -= 1
+            if count[sink] == 0:
+                order.append(sink)
+    if len(order) != len(fanin):
+        left = sorted(name for name in fanin if count[name] > 0)
+        raise fse.CombinationalLoopError(
+            "combinational loop between " + ", ".join(left))
+    return order
+
+# {net key: {cell: wire cells from the net's sources}} from fpga_adt.wire
+def _routed_hops(fpga_adt):
+    hops = {}
+    for entry in fpga_adt.get_wire():
+        if not isinstance(entry, dict) or "paths" not in entry:
+            continue
+        paths = [[tuple(c) for c in p] for p in entry["paths"]]
+        # a path starts on the tree routed before it, a start not on
+        # an earlier path is a source
+        dist = {}
+        seen = set()
+        adj = {}
+        for p in paths:
+            if p and p[0] not in seen:
+                dist[p[0]] = 1
+            for a, b in zip(p, p[1:]):
+                adj.setdefault(a, []).append(b)
+                adj.setdefault(b, []).append(a)
+            seen.update(p)
+        queue = list(dist)
+        for cell in queue:
+            for nxt in adj.get(cell, []):
+                if nxt not in dist:
+                    dist[nxt] = dist[cell] + 1
+                    queue.append(nxt)
+        hops[entry["net"]] = dist
+    return hops
+
+# wire cells between a net's source and a LUT (to_lut) or the pads
+# of an output, the routed tree when there is one
+def _hops(fpga_adt, hops, key, src, target, to_lut):
+    routed = hops.get(key, {})
+    if to_lut:
+        i, j = target
+        goals = [(i, j - 1), (i - 1, j), (i + 1, j)]
+    else:
+        goals = [tuple(c) for c in fpga_adt.io_locations.get(target, [])]
+    found = [routed[g] for g in goals if g in routed]
+    if found:
+        return min(found)
+    # not routed: Manhattan distance from the source
+    if src is not None:
+        starts = [fpga_adt.lut_locations[src]]
+    else:
+        starts = fpga_adt.io_locations.get(key, [])
+    if to_lut:
+        ends = [target]
+    else:
+        ends = fpga_adt.io_locations.get(target, [])
+    if not ends:
+        # output pad not placed yet, it goes to row 0
+        return starts[0][0] if starts else 0
+    if not starts:
+        # input pad not placed yet, it comes from row 0
+        return min(e[0] for e in ends)
+    return min(abs(s[0] - e[0]) + abs(s[1] - e[1]) for s in starts for e in ends)
@@ -0,0 +1,120 @@
+################################################
+# truth_table.py
+# agent
+# agent@local
+################################################
+# Contains a bit-parallel truth table used by the
+# synthesis engine. A function of n variables is
+# stored as a single packed integer where bit m
+# holds the output for minterm m.
+################################################
+# classes:
+# truth_table(nvars: int, bits: int)
+################################################
+# methods:
+# full_mask(nvars: int) -> int
+# literal_mask(nvars: int, pos: int) -> int
+# cube_mask(nvars: int, lits: list) -> int
+# iter_bits(bits: int) -> generator
+################################################
+# Variables are ordered MSB first to match the
+# minterm numbering of synth_engine: the variable
+# at position i of the ordered literal list has
+# weight 1 << (nvars - i - 1).
+################################################
+
+from collections.abc import Mapping
+from functools import lru_cache
+
+
+""" full_mask
+mask with one bit set for every minterm of nvars variables
+"""
+def full_mask(nvars: int):
+    return (1 << (1 << nvars)) - 1
+# end full_mask
+
+""" literal_mask
+projection mask of the variable at position pos,
+bit m is set if the variable is 1 in minterm m
+"""
+@lru_cache(maxsize=None)
+def literal_mask(nvars: int, pos: int):
+    b = nvars - pos - 1         # bit of the variable in a minterm
+    half = 1 << b               # length of each run of 0s / 1s
+    mask = ((1 << half) - 1) << half
+    period = half << 1
+    # double the pattern until it covers every minterm
+    while period < (1 << nvars):
+        mask |= mask << period
+        period <<= 1
+    return mask
+# end literal_mask
+
+""" cube_mask
+AND of the projection masks of a product term
+lits: list of (position, negated) pairs
+"""
+def cube_mask(nvars: int, lits: list):
+    full = full_mask(nvars)
+    mask = full
+    for pos, neg in lits:
+        if neg:
+            mask &= full ^ literal_mask(nvars, pos)
+        else:
+            mask &= literal_mask(nvars, pos)
+    return mask
+# end cube_mask
+
+""" iter_bits
+yield the index of every set bit in ascending order
+"""
+def iter_bits(bits: int):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+# end iter_bits
+
+
+""" truth_table
+packed truth table that can be read like the
+minterm -> output dict used by eq_adt.table
+"""
+class truth_table(Mapping):
+    def __init__(self, nvars: int, bits: int = 0):
+        self.nvars = nvars
+        self.bits = bits
+
+    # dict view: minterm -> 0/1
+    def __getitem__(self, minterm):
+        if not isinstance(minterm, int) or minterm < 0 or minterm >= len(self):
+            raise KeyError(minterm)
+        return (self.bits >> minterm) & 1
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __len__(self):
+        return 1 << self.nvars
+
+    def __eq__(self, other):
+        if isinstance(other, truth_table):
+            return self.nvars == other.nvars and self.bits == other.bits
+        return Mapping.__eq__(self, other)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    # minterms with output 1, ascending
+    def minterms(self):
+        return list(iter_bits(self.bits))
+
+    # minterms with output 0, ascending
+    def maxterms(self):
+        return list(iter_bits(full_mask(self.nvars) ^ self.bits))
+
+    # number of minterms with output 1
+    def count(self):
+        return self.bits.bit_count()
+# end truth_table